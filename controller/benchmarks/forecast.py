@@ -0,0 +1,80 @@
+"""
+Measures the cost of parsing a forecast: a 16 day forecast at a 15 minute resolution by default,
+which is far more than the controller asks for, but shows how the parser scales.
+
+The columnar parser of WeatherForecastFetcher is compared to the parser that it replaced, which
+looked up every variable of every row separately, and built a WeatherForecast per row.
+
+    python benchmarks/forecast.py [--days N] [--interval SECONDS]
+"""
+
+import argparse
+import pathlib
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src'))
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'tests'))
+
+from open_meteo_stub import build_forecast, build_response  # noqa: E402
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse  # noqa: E402
+
+from controller.weather_forecast_fetcher import (ForecastInterpolator,  # noqa: E402
+                                                 WeatherForecast,
+                                                 WeatherForecastFetcher)
+
+
+def parse_per_row(variables) -> list[WeatherForecast]:
+    """The parser before the columnar one."""
+    params = WeatherForecastFetcher.params
+    reports = []
+    start = datetime.fromtimestamp(variables.Time())
+    end = datetime.fromtimestamp(variables.TimeEnd())
+    interval = timedelta(seconds=variables.Interval())
+    for i in range(int((end - start) / interval) - 1):
+        reports.append(WeatherForecast(
+            timestamp=start + i * interval,
+            temperature=variables.Variables(params['hourly'].index('temperature_2m')).Values(i),
+            wind_gust=variables.Variables(params['hourly'].index('wind_gusts_10m')).Values(i),
+            rain_event=variables.Variables(params['hourly'].index('precipitation')).Values(i),
+            solar_radiation=variables.Variables(params['hourly'].index('shortwave_radiation')).Values(i),
+        ))
+    return reports
+
+
+def parse_columns(variables):
+    table = WeatherForecastFetcher._parse_forecast(WeatherForecastFetcher, variables)
+    return ForecastInterpolator(table)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=16)
+    parser.add_argument('--interval', type=int, default=900, help='seconds between rows')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    count = args.days * 86400 // args.interval
+    start = int(time.time()) // 86400 * 86400
+    response = build_response(
+        start,
+        args.interval,
+        build_forecast(start, count, args.interval),
+        'minutely_15' if args.interval == 900 else 'hourly',
+    )
+
+    def get_variables():
+        # Skip the length prefix
+        message = WeatherApiResponse.GetRootAs(response, 4)
+        return message.Minutely15() if args.interval == 900 else message.Hourly()
+
+    print(f'{count} rows, {len(response)} bytes')
+    for name, parse in (('per row', parse_per_row), ('columns', parse_columns)):
+        seconds = min(timeit.repeat(lambda: parse(get_variables()), number=1, repeat=args.repeat))
+        print(f'{name:>8}: {1000 * seconds:8.2f} ms, {1e6 * seconds / count:6.2f} µs per row')
+
+
+if __name__ == '__main__':
+    main()
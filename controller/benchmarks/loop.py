@@ -0,0 +1,134 @@
+"""
+Compares the main loop modes: the CPU time that the controller uses while nothing happens, and the
+latency from a button press to the motor output, in LoopMode.TICK and LoopMode.EVENT.
+
+The controller runs with the fake motor IO and a fixed weather report, so this works on any machine.
+Each mode runs in its own process, since the controller is made of singletons.
+
+    python benchmarks/loop.py [--idle SECONDS] [--presses N]
+"""
+
+import argparse
+import json
+import logging
+import pathlib
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src'))
+
+from controller import config, util  # noqa: E402
+
+NORTH_OPEN = util.Movement(util.Orientation.NORTH, util.Direction.OPEN)
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(mode: util.LoopMode, idle: float, presses: int, data_dir: pathlib.Path) -> dict:
+    config.MODE = util.Mode.FAKE
+    config.LOOP_MODE = mode
+    config.LOG_LEVEL = logging.WARNING
+    config.DATA_DIR = data_dir
+    config.ROOF_STATE_JOURNAL_PATH = data_dir / 'roof_state.jsonl'
+    config.MQTT_OUTBOX_PATH = data_dir / 'mqtt_outbox.json'
+    config.WEATHER_FORECAST_CACHE_PATH = data_dir / 'forecast.bin'
+    config.ROOF_VERIFICATION_ON_STARTUP = False
+    config.SEND_HEALTHCHECKS = False
+    # Nothing listens on port 9: the MQTT client and the forecast fetcher fail in the background,
+    # just like they would without a network.
+    config.MQTT_HOST = '127.0.0.1'
+    config.MQTT_PORT = 9
+    from controller.weather_forecast_fetcher import WeatherForecastFetcher
+    WeatherForecastFetcher.url = 'http://127.0.0.1:9/'
+
+    from controller import app
+    from controller.weather_monitor import Datasource, WeatherReport
+    report = WeatherReport()
+    report.timestamp = datetime.now()
+    report.indoor_data_source = Datasource.WEATHERSTATION
+    report.indoor_temperature = 20
+    report.outdoor_data_source = Datasource.WEATHERSTATION
+    report.outdoor_temperature = 15
+    report.outdoor_wind_gust = 0
+    report.outdoor_wind_gust_max = 0
+    report.outdoor_rain_event = 0
+    report.outdoor_solar_radiation = 0
+    app.controller.weather_monitor.get_report = lambda: report
+
+    thread = threading.Thread(target=app.run, daemon=True)
+    thread.start()
+    time.sleep(1)
+
+    start_cpu = cpu_time()
+    time.sleep(idle)
+    idle_cpu = (cpu_time() - start_cpu) / idle
+
+    # Each press starts or stops the north roof, and is measured up to the motor output that
+    # follows it.
+    io = app.controller.motor_controller.motor_io
+    latencies = []
+    for _ in range(presses):
+        time.sleep(random.uniform(.1, .3))
+        output_count = len(io.output_log)
+        pressed = time.monotonic()
+        io.push(NORTH_OPEN, True, pressed)
+        while len(io.output_log) == output_count:
+            time.sleep(.0002)
+        latencies.append(io.output_log[output_count][0] - pressed)
+        time.sleep(.05)
+        io.push(NORTH_OPEN, False)
+
+    app.killer.kill_now = True
+    app.wakeup.notify()
+    thread.join()
+    return {'idle_cpu': idle_cpu, 'latencies': sorted(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--idle', type=float, default=10, help='seconds to measure the idle CPU')
+    parser.add_argument('--presses', type=int, default=100)
+    # Set when the benchmark runs itself for each mode
+    parser.add_argument('--mode', choices=[mode.name for mode in util.LoopMode], help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', type=pathlib.Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = measure(util.LoopMode[args.mode], args.idle, args.presses, args.data_dir)
+        (args.data_dir / 'result.json').write_text(json.dumps(result))
+        return
+
+    print(f'{"mode":>6} {"idle CPU":>9} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for mode in util.LoopMode:
+        with tempfile.TemporaryDirectory() as data_dir:
+            subprocess.run(
+                [
+                    sys.executable, __file__,
+                    '--mode', mode.name, '--data-dir', data_dir,
+                    '--idle', str(args.idle), '--presses', str(args.presses),
+                ],
+                check=True,
+                capture_output=True,
+            )
+            result = json.loads((pathlib.Path(data_dir) / 'result.json').read_text())
+
+        latencies = result['latencies']
+        print(
+            f'{mode.name:>6} {100 * result["idle_cpu"]:>8.2f}% '
+            f'{1000 * latencies[len(latencies) // 2]:>8.2f} '
+            f'{1000 * latencies[int(.99 * (len(latencies) - 1))]:>8.2f} '
+            f'{1000 * latencies[-1]:>8.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
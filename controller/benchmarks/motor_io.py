@@ -0,0 +1,124 @@
+"""
+Measures the IO cost of a tick: reading all inputs and writing the outputs, once per pin and batched
+with read_all() and write_many(). The outputs are those of starting a motor (which also stops the
+opposite motor), and of closing both roofs at once.
+
+FakeIO shows the Python overhead of the calls. RegisterGPIO runs against a register bank in a
+temporary file, and also counts the register accesses: on the Orange Pi, each of those is an
+uncached access to the pin controller. Its inputs are read by a poll thread, so the poll of all
+input pins is measured as well.
+
+    python benchmarks/motor_io.py [--ticks N]
+"""
+
+import argparse
+import pathlib
+import sys
+import tempfile
+import timeit
+from datetime import timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src'))
+
+from controller import config, util  # noqa: E402
+from controller.motor_io.fake import FakeIO  # noqa: E402
+from controller.motor_io.gpio_registers import MMapRegisters, RegisterGPIO  # noqa: E402
+
+NORTH_OPEN = util.Movement(util.Orientation.NORTH, util.Direction.OPEN)
+OUTPUTS = {
+    'start': {NORTH_OPEN.opposite: False, NORTH_OPEN: True},
+    'close all': {
+        movement: movement.direction == util.Direction.CLOSE for movement in util.Movement
+    },
+}
+
+
+class CountingRegisters(MMapRegisters):
+    accesses = 0
+
+    def read(self, offset):
+        self.accesses += 1
+        return super().read(offset)
+
+    def write(self, offset, value):
+        self.accesses += 1
+        super().write(offset, value)
+
+
+def tick_per_pin(io, outputs: dict[util.Movement, bool]) -> None:
+    for movement in util.Movement:
+        io.read(movement)
+    for movement, active in sorted(outputs.items(), key=lambda item: item[1]):
+        io.write(movement, active)
+
+
+def tick_batched(io, outputs: dict[util.Movement, bool]) -> None:
+    io.read_all()
+    io.write_many(outputs)
+
+
+def poll_per_pin(io: RegisterGPIO, outputs=None) -> None:
+    """Read every input pin from its own register, like a digitalRead() per pin."""
+    for gpio in io.input_gpios.values():
+        port, bit = divmod(gpio, 32)
+        registers, offset = io._get_data_register(port)
+        registers.read(offset) >> bit & 1
+
+
+def create_register_gpio(directory: str) -> tuple[RegisterGPIO, list[CountingRegisters]]:
+    path = pathlib.Path(directory) / 'registers'
+    path.write_bytes(bytes(len(config.GPIO_REGISTER_ADDRESSES) * RegisterGPIO.BLOCK_SIZE))
+    register_blocks = [
+        CountingRegisters(str(path), i * RegisterGPIO.BLOCK_SIZE, RegisterGPIO.BLOCK_SIZE)
+        for i in range(len(config.GPIO_REGISTER_ADDRESSES))
+    ]
+    # The pins of GPIO_CONFIG, with the inputs on port PC and the outputs on port PD
+    io = RegisterGPIO(
+        config.GPIO_CONFIG,
+        register_blocks,
+        lambda pin: 32 * (2 + pin % 2) + pin,
+        # Keep the poll thread out of the way: the polls are measured separately
+        timedelta(hours=1),
+        config.INPUT_DEBOUNCE,
+        config.INPUT_EVENT_BUFFER_SIZE,
+    )
+    return io, register_blocks
+
+
+def poll_batched(io: RegisterGPIO, outputs=None) -> None:
+    io._read_inputs()
+
+
+def measure(name: str, function, io, outputs, register_blocks, ticks: int) -> None:
+    seconds = min(timeit.repeat(lambda: function(io, outputs), number=ticks, repeat=5))
+    for registers in register_blocks:
+        registers.accesses = 0
+    function(io, outputs)
+    accesses = sum(registers.accesses for registers in register_blocks)
+    accesses_text = f'{accesses:>9}' if register_blocks else f'{"-":>9}'
+    print(f'{name:>32} {1e6 * seconds / ticks:>10.2f} {accesses_text}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f'{"":>32} {"us/tick":>10} {"registers":>9}')
+    fake_io = FakeIO(config.INPUT_DEBOUNCE, config.INPUT_EVENT_BUFFER_SIZE)
+    with tempfile.TemporaryDirectory() as directory:
+        register_io, register_blocks = create_register_gpio(directory)
+        backends = [('FakeIO', fake_io, []), ('RegisterGPIO', register_io, register_blocks)]
+        for io_name, io, blocks in backends:
+            for outputs_name, outputs in OUTPUTS.items():
+                for mode, tick in (('per pin', tick_per_pin), ('batched', tick_batched)):
+                    name = f'{io_name} {outputs_name} {mode}'
+                    measure(name, tick, io, outputs, blocks, args.ticks)
+
+        for mode, poll in (('per pin', poll_per_pin), ('batched', poll_batched)):
+            name = f'RegisterGPIO poll {mode}'
+            measure(name, poll, register_io, None, register_blocks, args.ticks)
+
+
+if __name__ == '__main__':
+    main()
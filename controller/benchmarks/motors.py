@@ -0,0 +1,90 @@
+"""
+Simulates roof movements with the fake motor IO and a fake clock, and prints how long it takes until
+both roofs have reached their target, when the motors may run at the same time
+(MAX_CONCURRENT_ACTIONS = 2) or only one at a time.
+
+    python benchmarks/motors.py
+"""
+
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src'))
+
+from controller import config, util  # noqa: E402
+from controller.motor_controller import MotorController  # noqa: E402
+from controller.scheduler import Scheduler  # noqa: E402
+
+NORTH = util.Orientation.NORTH
+SOUTH = util.Orientation.SOUTH
+# (name, start positions, target positions)
+SCENARIOS = [
+    ('open fully', {NORTH: 0, SOUTH: 0}, {NORTH: 1, SOUTH: 1}),
+    ('first step', {NORTH: 0, SOUTH: 0}, {NORTH: .15, SOUTH: .15}),
+    ('open and close', {NORTH: 0, SOUTH: 1}, {NORTH: 1, SOUTH: 0}),
+    ('uneven steps', {NORTH: .35, SOUTH: 0}, {NORTH: 1, SOUTH: .15}),
+]
+STEP = .1
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.
+        self.offset = time.time() - self.now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now + self.offset
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def time_to_target(start: dict, target: dict, max_concurrent_actions: int) -> float:
+    config.MAX_CONCURRENT_ACTIONS = max_concurrent_actions
+    util.Singleton._instances = {}
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.time = clock.time
+
+    motor_controller = MotorController()
+    scheduler = Scheduler()
+    for orientation in util.Orientation:
+        motor_controller.last_stable_position[orientation] = start[orientation]
+        motor_controller.target_position[orientation] = start[orientation]
+        motor_controller.confidence[orientation] = 1
+        # Don't let the movements be extended to verify the positions
+        scheduler.cancel(motor_controller._verification_timer(orientation))
+
+    start_time = clock.now
+    for orientation in util.Orientation:
+        motor_controller.set_target_position(orientation, target[orientation])
+    while motor_controller.current_actions or start_time == clock.now:
+        clock.advance(STEP)
+        scheduler.tick()
+        motor_controller.tick()
+
+    motor_controller.shutdown()
+    return clock.now - start_time
+
+
+def main():
+    data_dir = pathlib.Path(tempfile.mkdtemp())
+    config.MODE = util.Mode.FAKE
+    config.DATA_DIR = data_dir
+    config.ROOF_STATE_JOURNAL_PATH = data_dir / 'roof_state.jsonl'
+    config.ROOF_VERIFICATION_ON_STARTUP = False
+
+    print(f'{"scenario":>15} {"one at a time":>14} {"concurrent":>11}')
+    for name, start, target in SCENARIOS:
+        sequential = time_to_target(start, target, 1)
+        concurrent = time_to_target(start, target, 2)
+        print(f'{name:>15} {sequential:>13.1f}s {concurrent:>10.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Measures how fast incoming MQTT messages are dispatched to their callbacks, with hundreds of
+subscriptions, some of them with wildcards. The TopicTrie is compared to checking every
+subscription with paho's topic_matches_sub().
+
+    python benchmarks/mqtt_dispatch.py [--subscriptions N ...]
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+import paho.mqtt.client
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src'))
+
+# Like the app, import the config first: it imports the motor IO, which imports the MQTT client
+from controller import config  # noqa: E402, F401
+from controller.mqtt_client import TopicTrie  # noqa: E402
+
+MESSAGES = 100_000
+
+
+def get_subscriptions(count: int) -> list[str]:
+    """Mostly exact topics, like the roof buttons, and one in ten with a wildcard."""
+    subscriptions = []
+    for i in range(count):
+        if i % 10 == 0:
+            subscriptions.append(f'weatherstation/device{i}/+/state')
+        elif i % 10 == 5:
+            subscriptions.append(f'weatherstation/device{i}/#')
+        else:
+            subscriptions.append(f'weatherstation/device{i}/roof/{i % 3}')
+    return subscriptions
+
+
+def get_topics(subscriptions: list[str]) -> list[str]:
+    topics = []
+    for subscription in random.choices(subscriptions, k=MESSAGES):
+        topic = subscription.replace('+', 'north').replace('#', 'roof/open')
+        topics.append(topic)
+    return topics
+
+
+def dispatch_trie(subscriptions: list[str], topics: list[str]) -> int:
+    trie = TopicTrie()
+    calls = [0]
+    def callback(topic, payload):
+        calls[0] += 1
+    for subscription in subscriptions:
+        trie.add(subscription, callback)
+
+    for topic in topics:
+        for callback in trie.match(topic):
+            callback(topic, '')
+    return calls[0]
+
+
+def dispatch_linear(subscriptions: list[str], topics: list[str]) -> int:
+    calls = [0]
+    def callback(topic, payload):
+        calls[0] += 1
+    routes = [(subscription, callback) for subscription in subscriptions]
+
+    for topic in topics:
+        for subscription, callback in routes:
+            if paho.mqtt.client.topic_matches_sub(subscription, topic):
+                callback(topic, '')
+    return calls[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscriptions', type=int, nargs='+', default=[10, 100, 500, 1000])
+    args = parser.parse_args()
+
+    print(f'{"subscriptions":>13} {"trie msg/s":>12} {"linear msg/s":>13}')
+    for count in args.subscriptions:
+        subscriptions = get_subscriptions(count)
+        topics = get_topics(subscriptions)
+        results = []
+        for dispatch in (dispatch_trie, dispatch_linear):
+            # The linear scan is slow with many subscriptions, so it gets fewer messages
+            sample = topics if dispatch is dispatch_trie else topics[:max(MESSAGES // count, 1000)]
+            start = time.perf_counter()
+            calls = dispatch(subscriptions, sample)
+            results.append(len(sample) / (time.perf_counter() - start))
+            assert calls >= len(sample)
+        print(f'{count:>13} {results[0]:>12,.0f} {results[1]:>13,.0f}')
+
+
+if __name__ == '__main__':
+    main()
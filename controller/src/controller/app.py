@@ -4,9 +4,11 @@ import logging
 import sys
 import time
 
-from . import config
+from . import config, util
 from .controller import Controller
 from .graceful_killer import GracefulKiller
+from .scheduler import Scheduler
+from .wakeup import Wakeup
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -14,13 +16,18 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
 )
 
-killer = GracefulKiller()
+scheduler = Scheduler()
+wakeup = Wakeup()
+killer = GracefulKiller(on_exit=wakeup.notify)
 
 controller = Controller()
 
 
 def run():
-    loop()
+    if config.LOOP_MODE == util.LoopMode.EVENT:
+        event_loop()
+    else:
+        loop()
 
 
 def loop():
@@ -31,3 +38,18 @@ def loop():
             break
 
         controller.tick()
+
+
+def event_loop():
+    while True:
+        if killer.kill_now:
+            break
+
+        controller.tick()
+
+        deadline = scheduler.get_next_deadline()
+        if deadline is None:
+            timeout = config.STATE_PUBLISH_INTERVAL.total_seconds()
+        else:
+            timeout = max(deadline - time.monotonic(), 0)
+        wakeup.wait(timeout)
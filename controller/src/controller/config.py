@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+import pathlib
 from datetime import timedelta
 
 from . import util
@@ -10,6 +11,8 @@ from .motor_io.mqtt import MQTTIO
 
 MODE = util.Mode.GPIO
 LOG_LEVEL = logging.DEBUG
+# State that should survive a restart is stored here. In docker, this is a mounted volume.
+DATA_DIR = pathlib.Path('/data')
 
 # Each roof has a position between 0 (closed) and 1 (fully opened). Each position step has a range
 # of temperatures between which it is allowed. For example: if the roofs are at position .2, and
@@ -32,6 +35,13 @@ HIGH_WIND = 45  # km/h
 HIGH_WIND_CURFEW = timedelta(minutes=30)
 # When the outdoor weather station is offline, we fall back to Open Meteo weather forecasts.
 WEATHER_FORECAST_VALIDITY = timedelta(minutes=60)
+# Forecasts are fetched in a background thread, and refreshed well before they expire. When a fetch
+# fails, it is retried after WEATHER_FORECAST_RETRY_INTERVAL.
+WEATHER_FORECAST_REFRESH_INTERVAL = WEATHER_FORECAST_VALIDITY / 2
+WEATHER_FORECAST_RETRY_INTERVAL = timedelta(minutes=1)
+WEATHER_FORECAST_TIMEOUT = timedelta(seconds=30)
+# The last fetched forecast is stored on disk, so it can be used right away after a restart.
+WEATHER_FORECAST_CACHE_PATH = DATA_DIR / 'forecast.bin'
 # When rain has fallen, the roofs should not be allowed to open fully, since this will cause them
 # to leak water into the greenhouse.
 RAIN_THRESHOLD = .5 # mm
@@ -40,23 +50,62 @@ RAIN_MAX_POSITION = .6
 # If the last weather report is older than this, we fall back to online weather forecasts.
 WEATHER_REPORT_VALIDITY = timedelta(minutes=15)
 
-# The time between application ticks
+# In LoopMode.EVENT, the main loop sleeps until an input changes, an MQTT message arrives or a
+# timer expires (end of a roof movement, healthcheck, state publish,...). LoopMode.TICK is the
+# fallback: it runs a full tick every TICK_INTERVAL, whether something changed or not.
+LOOP_MODE = util.LoopMode.EVENT
+# The time between application ticks in LoopMode.TICK
 TICK_INTERVAL = timedelta(milliseconds=100)
+# GPIO input pins trigger an interrupt when they change. If interrupts aren't available, the pins
+# are polled at this interval instead.
+INPUT_POLL_INTERVAL = timedelta(milliseconds=20)
+# Input changes within INPUT_DEBOUNCE of the previous change are considered to be contact bounce,
+# and are ignored.
+INPUT_DEBOUNCE = timedelta(milliseconds=30)
+# The number of input changes that can be buffered between two ticks.
+INPUT_EVENT_BUFFER_SIZE = 64
+# Automatic movements that reverse the last movement of a roof by less than MOVEMENT_MIN_REVERSAL
+# are held back until MOVEMENT_REVERSAL_WINDOW after that movement ended. This avoids short
+# open/close cycles when the temperature oscillates around the boundary of a position step.
+MOVEMENT_REVERSAL_WINDOW = timedelta(minutes=10)
+MOVEMENT_MIN_REVERSAL = .3
 # The number of seconds it takes to open/close a roof
 ROOF_MOVEMENT_DURATION = timedelta(seconds=160)
+# The number of motors that may run at the same time. Set this to 1 if the power supply can't
+# drive both motors at once: the roofs will then move one after the other.
+MAX_CONCURRENT_ACTIONS = 2
 # We can't measure the true position of a roof, so we rely on an estimate based on how long we've
 # been actuating the motors. If the motors have been actuated outside of our own control, our
 # estimate may be wildly off. So every few hours, when we expect the roof to be fully
 # opened/closed, we let it move in that direction for ROOF_MOVEMENT_DURATION to be sure that it
 # really is fully opened/closed, even if it wasn't before.
-ROOF_VERIFICATION_INTERVAL = timedelta(hours=6)
+# Once ROOF_VERIFICATION_INTERVAL has passed, we piggy-back on the next movement towards a fully
+# opened/closed position: we extend it to last ROOF_MOVEMENT_DURATION, which makes it count as a
+# verification. If there is no such movement, we start a separate verification run after
+# ROOF_VERIFICATION_MAX_INTERVAL, so a position is never unverified for longer than that.
+ROOF_VERIFICATION_INTERVAL = timedelta(hours=3)
+ROOF_VERIFICATION_MAX_INTERVAL = timedelta(hours=6)
+# Every full roof movement since the last verification lowers our confidence in the position
+# estimate by ROOF_POSITION_DRIFT. Below ROOF_VERIFICATION_MIN_CONFIDENCE, we also piggy-back a
+# verification on the next movement towards a fully opened/closed position.
+ROOF_POSITION_DRIFT = .02
+ROOF_VERIFICATION_MIN_CONFIDENCE = .9
 ROOF_VERIFICATION_ON_STARTUP = True
+# The roof positions are journaled to disk, so we don't have to verify them after every restart.
+# We only verify on startup when there is no journal, or when a roof was moving when we stopped.
+ROOF_STATE_JOURNAL_PATH = DATA_DIR / 'roof_state.jsonl'
+ROOF_STATE_JOURNAL_COMPACT_AFTER = 1000
 # We periodically send a ping to healthchecks.io to let it know the script is still running. If
 # healthchecks.io doesn't get an update from us for x amount of time, it will notify people on
 # their phones. In known emergency situations, we explicitly send a nonzero status.
 HEALTHCHECK_INTERVAL = timedelta(minutes=5)
 HEALTHCHECK_URL = 'https://hc-ping.com/9ce41add-4bd4-484b-95f5-a27312fcde0f'
 SEND_HEALTHCHECKS = True
+# Healthchecks are sent from a background thread. Failed attempts are retried with an exponential
+# backoff, unless a newer status comes in in the meantime.
+HEALTHCHECK_TIMEOUT = timedelta(seconds=60)
+HEALTHCHECK_RETRIES = 3
+HEALTHCHECK_RETRY_BACKOFF = timedelta(seconds=10)
 
 
 # We publish our state (current roof position, weather data and source,...). This is picked up
@@ -72,12 +121,29 @@ MQTT_PASSWORD = 'Kl7sJuVJnZ33BtW'
 MQTT_TOPIC_PREFIX = 'weatherstation'
 MQTT_TOPIC_REPORT = 'report'
 MQTT_TOPIC_STATE = 'state'
+# When the connection to the broker is lost, we keep on trying to reconnect, with a delay that
+# doubles from MQTT_RECONNECT_MIN_DELAY up to MQTT_RECONNECT_MAX_DELAY.
+MQTT_RECONNECT_MIN_DELAY = timedelta(seconds=1)
+MQTT_RECONNECT_MAX_DELAY = timedelta(minutes=2)
+# Messages that are published while we're disconnected are kept in an outbox, and published when
+# we reconnect. Of the retained messages, only the latest one on each topic is kept. The outbox is
+# stored in MQTT_OUTBOX_PATH (if not None), so it survives a restart. It is saved in the background,
+# at most once every MQTT_OUTBOX_SAVE_DELAY, and on exit.
+MQTT_OUTBOX_SIZE = 100
+MQTT_OUTBOX_PATH = DATA_DIR / 'mqtt_outbox.json'
+MQTT_OUTBOX_SAVE_DELAY = timedelta(seconds=30)
+# Incoming MQTT messages are queued, and handled at the start of the next tick. When more than
+# MQTT_MAX_MESSAGES_PER_TICK are waiting, the rest are handled in the next ticks, so that a flood of
+# messages doesn't hold up the motors. When the queue is full, the oldest messages are dropped.
+MQTT_MAX_MESSAGES_PER_TICK = 20
+MQTT_INBOX_SIZE = 1000
 
 
 
 # Debug values
 # MODE = util.Mode.MQTT
 # LOG_LEVEL = logging.DEBUG
+# LOOP_MODE = util.LoopMode.TICK
 # TICK_INTERVAL = timedelta(seconds=1)
 # SEND_HEALTHCHECKS = False
 # ROOF_VERIFICATION_ON_STARTUP = False
@@ -127,3 +193,9 @@ GPIO_CONFIG = {
         pin_mode=GPIO.PinMode.ACTIVE_LOW,
     ),
 }
+
+# Used in util.Mode.GPIO_REGISTERS, which accesses the registers of the pin controllers directly
+# instead of going through wiringpi. These are the physical addresses of the PIO (ports PA-PK) and
+# R_PIO (ports PL and up) register blocks of the Allwinner H6 on the Orange Pi 3 LTS.
+GPIO_REGISTER_DEVICE = '/dev/mem'
+GPIO_REGISTER_ADDRESSES = (0x0300B000, 0x07022000)
@@ -1,13 +1,16 @@
 import enum
 import json
 import logging
+import time
 from datetime import datetime, timedelta
 
-import requests
-
 from . import config, util
+from .healthcheck_sender import HealthcheckSender
+from .metrics import Timing
 from .motor_controller import MotorController
+from .movement_planner import MovementPlanner
 from .mqtt_client import MQTTClient
+from .scheduler import Scheduler
 from .weather_monitor import Datasource, WeatherMonitor, WeatherReport
 
 logger = logging.getLogger(__name__)
@@ -22,31 +25,46 @@ class Status(enum.Enum):
 
 
 class Controller:
+    mqtt_client: MQTTClient
     weather_monitor: WeatherMonitor
     motor_controller: MotorController
+    movement_planner: MovementPlanner
+    scheduler: Scheduler
+    healthcheck_sender: HealthcheckSender
+    tick_duration: Timing
 
-    startup_time = datetime.now()
     status: Status = Status.OK
     # We only want each input press to be handled once, so we keep track of which ones we've
     # already handled.
     input_handled: set[util.Movement]
 
+    # These are only used for reporting: the timers that depend on them are kept in the scheduler.
     last_manual_input: datetime = datetime.fromtimestamp(0)
     last_high_wind: datetime = datetime.fromtimestamp(0)
     last_outdoor_report: datetime = datetime.fromtimestamp(0)
-    last_healthcheck: datetime = datetime.now()
-
-    last_state_published: datetime = datetime.fromtimestamp(0)
 
 
     def __init__(self):
+        self.scheduler = Scheduler()
+        self.mqtt_client = MQTTClient()
         self.weather_monitor = WeatherMonitor()
         self.motor_controller = MotorController()
+        self.movement_planner = MovementPlanner(self.motor_controller)
         self.input_handled = set()
+        self.healthcheck_sender = HealthcheckSender(config.HEALTHCHECK_URL)
+        self.tick_duration = Timing()
+
+        self.scheduler.schedule('startup', timedelta(minutes=2))
+        self.scheduler.schedule('publish_state', timedelta(0))
+        if config.SEND_HEALTHCHECKS:
+            self.scheduler.schedule('healthcheck', config.HEALTHCHECK_INTERVAL)
 
 
     def tick(self):
+        start = time.perf_counter()
         try:
+            self.scheduler.tick()
+            self.mqtt_client.process_messages()
             self.motor_controller.tick()
 
             report = self.weather_monitor.get_report()
@@ -55,22 +73,30 @@ class Controller:
             self.do_limit_movements(report)
             self.do_manual_movements(report)
             self.do_temperature_movements(report)
+            if self.scheduler.is_pending('manual_curfew'):
+                # Automatic movements that were held back before the manual input must not
+                # override it.
+                self.movement_planner.discard_all()
+            self.movement_planner.commit()
+            # Act on any new target positions straight away: in LoopMode.EVENT the next tick may
+            # be a while away.
+            self.motor_controller.tick()
 
             self.publish_state(report)
-
-            try:
-                self.send_healthcheck()
-            except Exception as e:
-                logger.error(e)
+            self.send_healthcheck()
         except Exception as e:
             self.send_healthcheck(Status.UNCAUGHT_EXCEPTION)
+            # We're about to crash: give the healthcheck a chance to go out before we do.
+            self.healthcheck_sender.flush(config.HEALTHCHECK_TIMEOUT.total_seconds())
             raise e
+        finally:
+            self.tick_duration.add(time.perf_counter() - start)
 
 
     def get_max_roof_position(self, report: WeatherReport):
         if (
             self.status == Status.FORECAST_OFFLINE
-            or datetime.now() - self.last_high_wind < config.HIGH_WIND_CURFEW
+            or self.scheduler.is_pending('high_wind_curfew')
         ):
             return 0
         elif (
@@ -89,12 +115,7 @@ class Controller:
 
 
     def read_inputs(self) -> dict[util.Movement, bool]:
-        inputs = {}
-
-        for movement in util.Movement:
-            inputs[movement] = self.motor_controller.read(movement)
-
-        return inputs
+        return self.motor_controller.read_all()
 
 
     def get_indoor_temperature(self, report: WeatherReport):
@@ -113,13 +134,24 @@ class Controller:
 
 
     def update_status(self, report: WeatherReport):
-        if report.outdoor_wind_gust is not None and report.outdoor_wind_gust > config.HIGH_WIND:
+        # A single report can miss a short gust, the data-receiver keeps track of the maximum of
+        # the past few minutes.
+        wind_gust = report.outdoor_wind_gust_max
+        if wind_gust is None:
+            wind_gust = report.outdoor_wind_gust
+
+        if (
+            wind_gust is not None
+            and wind_gust > config.HIGH_WIND
+            and report.timestamp != self.last_high_wind
+        ):
             self.last_high_wind = report.timestamp
+            self.scheduler.schedule('high_wind_curfew', config.HIGH_WIND_CURFEW)
 
         if report.outdoor_data_source is Datasource.WEATHERSTATION:
             self.last_outdoor_report = report.timestamp
 
-        if datetime.now() - self.startup_time < timedelta(minutes=2):
+        if self.scheduler.is_pending('startup'):
             return
 
         if report.outdoor_data_source is Datasource.NONE:
@@ -144,17 +176,21 @@ class Controller:
 
         max_position = self.get_max_roof_position(report)
         for orientation in util.Orientation:
+            # A requested movement may be held back by the planner, so we check where the roof is
+            # actually going. Limiting the roof discards the requested movements.
             if self.motor_controller.target_position[orientation] > max_position:
                 if max_position == 0:
-                    self.motor_controller.ensure_closed(orientation)
+                    self.movement_planner.ensure_closed(orientation)
                 elif max_position < 1:
-                    self.motor_controller.set_target_position(orientation, max_position)
+                    self.movement_planner.set_target_position(orientation, max_position)
+            elif self.movement_planner.get_target_position(orientation) > max_position:
+                self.movement_planner.discard(orientation)
 
 
     def do_temperature_movements(self, report: WeatherReport) -> None:
         """Automatically open/close the roofs based on the indoor temperature."""
 
-        if datetime.now() - self.last_manual_input < config.MANUAL_MOVEMENT_CURFEW:
+        if self.scheduler.is_pending('manual_curfew'):
             return
 
         if (
@@ -169,28 +205,28 @@ class Controller:
             for i, step in enumerate(config.POSITION_STEPS[:-1]):
                 step_position = self.get_platformed_position(step.position, report)
                 if (
-                    self.motor_controller.target_position[orientation] > step_position
+                    self.movement_planner.get_target_position(orientation) > step_position
                     and temperature < config.POSITION_STEPS[i + 1].min_temperature
                 ):
                     logger.info(
                         f'Temperature {temperature} is too low for roof {orientation} at position '
-                        f'{self.motor_controller.target_position[orientation]:.2f}, closing to '
+                        f'{self.movement_planner.get_target_position(orientation):.2f}, closing to '
                         f'{step_position:.2f}'
                     )
-                    self.motor_controller.set_target_position(orientation, step_position)
+                    self.movement_planner.request_target_position(orientation, step_position)
 
             for i, step in reversed(list(enumerate(config.POSITION_STEPS))[1:]):
                 step_position = self.get_platformed_position(step.position, report)
                 if (
-                    self.motor_controller.target_position[orientation] < step_position
+                    self.movement_planner.get_target_position(orientation) < step_position
                     and temperature > config.POSITION_STEPS[i - 1].max_temperature
                 ):
                     logger.info(
                         f'Temperature {temperature} is too high for roof {orientation} at position '
-                        f'{self.motor_controller.target_position[orientation]:.2f}, opening to '
+                        f'{self.movement_planner.get_target_position(orientation):.2f}, opening to '
                         f'{step_position:.2f}'
                     )
-                    self.motor_controller.set_target_position(orientation, step_position)
+                    self.movement_planner.request_target_position(orientation, step_position)
 
 
     def do_manual_movements(self, report: WeatherReport) -> None:
@@ -206,6 +242,7 @@ class Controller:
                 logger.info(f'Got manual input: {movement}')
                 self.input_handled.add(movement)
                 self.last_manual_input = datetime.now()
+                self.scheduler.schedule('manual_curfew', config.MANUAL_MOVEMENT_CURFEW)
 
                 orientation = movement.orientation
                 direction = movement.direction
@@ -216,36 +253,34 @@ class Controller:
                 if movement_ongoing:
                     logger.info('Cancel ongoing movement')
                     target_position = self.get_platformed_position(current_position, report)
-                    self.motor_controller.set_target_position(orientation, target_position)
+                    self.movement_planner.set_target_position(orientation, target_position)
 
                 elif direction == util.Direction.OPEN:
                     if current_position == 1:
                         # When someone presses the "open" button while we think the roof is
                         # already fully opened, it may be because in reality it's not fully opened.
-                        self.motor_controller.verify_position(orientation)
+                        self.movement_planner.verify_position(orientation)
                     else:
                         target_position = self.get_platformed_position(1, report)
-                        self.motor_controller.set_target_position(orientation, target_position)
+                        self.movement_planner.set_target_position(orientation, target_position)
 
                 elif direction == util.Direction.CLOSE:
                     if current_position == 0:
-                        self.motor_controller.verify_position(orientation)
+                        self.movement_planner.verify_position(orientation)
                     else:
                         target_position = self.get_platformed_position(0, report)
-                        self.motor_controller.set_target_position(orientation, target_position)
+                        self.movement_planner.set_target_position(orientation, target_position)
 
 
     def publish_state(self, report: WeatherReport) -> None:
-        if datetime.now() - self.last_state_published < config.STATE_PUBLISH_INTERVAL:
+        if not self.scheduler.is_due('publish_state'):
             return
 
         self.do_publish_state(report)
-        self.last_state_published = datetime.now()
+        self.scheduler.schedule('publish_state', config.STATE_PUBLISH_INTERVAL)
 
 
     def do_publish_state(self, report: WeatherReport) -> None:
-        mqtt_client = MQTTClient()
-
         if report.indoor_data_source is None and report.outdoor_data_source is None:
             indoor_temperature = None
         else:
@@ -259,7 +294,22 @@ class Controller:
 
                 'last_manual_input': util.datetime_or_none(self.last_manual_input),
                 'last_high_wind': util.datetime_or_none(self.last_high_wind),
-                'last_healthcheck': util.datetime_or_none(self.last_healthcheck),
+                'last_healthcheck': util.datetime_or_none(self.healthcheck_sender.last_sent),
+            },
+
+            'metrics': {
+                'tick_duration': self.tick_duration.pop(),
+                'healthcheck_failures': self.healthcheck_sender.failures,
+                'actuation_seconds': round(self.motor_controller.actuation_seconds),
+                'reversals': self.motor_controller.reversals,
+                'reversals_held_back': self.movement_planner.held_back,
+                'mqtt_latency': self.mqtt_client.latency.pop(),
+                'mqtt_dropped': self.mqtt_client.dropped,
+                'mqtt_duplicates': self.mqtt_client.duplicates,
+                'mqtt_reconnects': self.mqtt_client.reconnects,
+                'mqtt_reconnect_time': self.mqtt_client.reconnect_time.pop(),
+                'mqtt_outbox': len(self.mqtt_client.outbox),
+                'mqtt_outbox_drained': self.mqtt_client.outbox_drained,
             },
 
             'parameters': {
@@ -295,10 +345,11 @@ class Controller:
                 'position': round(max(0, min(1, self.motor_controller.last_stable_position[orientation])), 2),
                 'target': round(max(0, min(1, self.motor_controller.target_position[orientation])), 2),
                 'last_verification': util.datetime_or_none(self.motor_controller.last_verification[orientation]),
+                'confidence': round(self.motor_controller.confidence[orientation], 2),
             }
 
         data = json.dumps(message, cls=util.JSONEncoder)
-        mqtt_client.publish(config.MQTT_TOPIC_STATE, data, retain=True)
+        self.mqtt_client.publish(config.MQTT_TOPIC_STATE, data, retain=True)
 
 
     def send_healthcheck(self, status: Status | None=None) -> None:
@@ -308,12 +359,8 @@ class Controller:
         if not config.SEND_HEALTHCHECKS:
             return
 
-        if datetime.now() - self.last_healthcheck < config.HEALTHCHECK_INTERVAL:
+        if not self.scheduler.is_due('healthcheck'):
             return
-        self.last_healthcheck = datetime.now()
-
-
-        url = f'{config.HEALTHCHECK_URL}/{status.value}'
-        requests.post(url, timeout=60)
+        self.scheduler.schedule('healthcheck', config.HEALTHCHECK_INTERVAL)
 
-        logger.debug(f'Sent healthcheck with status {status.value} ({status})')
+        self.healthcheck_sender.submit(status)
@@ -0,0 +1,63 @@
+"""
+Stores the last fetched forecast on disk, so we have a forecast right away after a restart, even
+when the network is down.
+
+The file is a fixed-size header followed by the columns of the ForecastTable, each as a contiguous
+array of float64 values, so it can be memory-mapped as-is.
+"""
+
+import logging
+import pathlib
+import struct
+
+import numpy as np
+
+from . import util
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'WSFC'
+VERSION = 1
+# magic, version, fetch time (Unix timestamp), number of rows, number of columns
+HEADER = struct.Struct('<4sIdII')
+COLUMNS = ('timestamps', 'temperature', 'wind_gust', 'rain_event', 'solar_radiation')
+
+
+def save(path: pathlib.Path, columns: dict[str, np.ndarray], fetched: float) -> None:
+    rows = len(columns['timestamps'])
+    header = HEADER.pack(MAGIC, VERSION, fetched, rows, len(COLUMNS))
+    data = np.stack([np.asarray(columns[name], dtype='<f8') for name in COLUMNS])
+    util.atomic_write(path, header + data.tobytes())
+
+
+def load(path: pathlib.Path) -> tuple[dict[str, np.ndarray], float] | None:
+    """Return the columns and fetch time of the stored forecast, or None if there is none."""
+
+    try:
+        with open(path, 'rb') as file:
+            magic, version, fetched, rows, num_columns = HEADER.unpack(file.read(HEADER.size))
+    except FileNotFoundError:
+        return None
+    except (OSError, struct.error) as e:
+        logger.warning(f'Could not read forecast cache {path}: {e}')
+        return None
+
+    if magic != MAGIC or version != VERSION or num_columns != len(COLUMNS):
+        logger.warning(f'Ignoring forecast cache {path} with unknown format')
+        return None
+
+    try:
+        data = np.memmap(
+            path,
+            dtype='<f8',
+            mode='r',
+            offset=HEADER.size,
+            shape=(num_columns, rows),
+        )
+    except (OSError, ValueError) as e:
+        logger.warning(f'Could not read forecast cache {path}: {e}')
+        return None
+
+    columns = {name: data[i] for i, name in enumerate(COLUMNS)}
+    return columns, fetched
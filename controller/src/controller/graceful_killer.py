@@ -1,12 +1,16 @@
 import signal
+import typing
 
 
 class GracefulKiller:
   kill_now = False
 
-  def __init__(self):
+  def __init__(self, on_exit: typing.Callable[[], None] | None = None):
+    self.on_exit = on_exit
     signal.signal(signal.SIGINT, self.exit_gracefully)
     signal.signal(signal.SIGTERM, self.exit_gracefully)
 
   def exit_gracefully(self, signum, frame):
     self.kill_now = True
+    if self.on_exit:
+      self.on_exit()
@@ -0,0 +1,99 @@
+import enum
+import logging
+import threading
+from datetime import datetime
+
+import requests
+import requests.adapters
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+class HealthcheckSender:
+    """
+    Sends healthchecks from a background thread, so a slow or unreachable healthcheck endpoint
+    never blocks the control loop.
+
+    Only the most recently submitted status is kept: if a new status is submitted while an older
+    one is still waiting to be sent (or being retried), the older one is dropped.
+    """
+
+    url: str
+    session: requests.Session
+    condition: threading.Condition
+    pending: enum.Enum | None = None
+    sending: bool = False
+
+    last_sent: datetime = datetime.fromtimestamp(0)
+    failures: int = 0
+
+
+    def __init__(self, url: str):
+        self.url = url
+        self.condition = threading.Condition()
+
+        # Keep a single connection alive between healthchecks, instead of doing a new TCP/TLS
+        # handshake every time.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def submit(self, status: enum.Enum) -> None:
+        with self.condition:
+            self.pending = status
+            self.condition.notify_all()
+
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Wait until the pending status has been sent. Used when we're about to exit."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending is None and not self.sending, timeout)
+
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None)
+                status = self.pending
+                self.pending = None
+                self.sending = True
+
+            assert status is not None
+            self._send(status)
+
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+
+
+    def _send(self, status: enum.Enum) -> None:
+        backoff = config.HEALTHCHECK_RETRY_BACKOFF.total_seconds()
+
+        for attempt in range(config.HEALTHCHECK_RETRIES + 1):
+            try:
+                url = f'{self.url}/{status.value}'
+                response = self.session.post(url, timeout=config.HEALTHCHECK_TIMEOUT.total_seconds())
+                response.raise_for_status()
+                self.last_sent = datetime.now()
+                logger.debug(f'Sent healthcheck with status {status.value} ({status})')
+                return
+            except Exception as e:
+                self.failures += 1
+                logger.error(f'Failed to send healthcheck (attempt {attempt + 1}): {e}')
+
+            if attempt == config.HEALTHCHECK_RETRIES:
+                # Don't hold up a flush() with a wait that leads nowhere
+                return
+
+            # Wait before retrying, unless a newer status comes in: that one takes precedence.
+            with self.condition:
+                if self.condition.wait_for(lambda: self.pending is not None, backoff):
+                    return
+            backoff *= 2
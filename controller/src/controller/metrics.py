@@ -0,0 +1,28 @@
+import dataclasses
+
+
+@dataclasses.dataclass
+class Timing:
+    """Running statistics of a duration. The statistics are reset every time they are popped."""
+
+    count: int = 0
+    total: float = 0
+    max: float = 0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+    def pop(self) -> dict:
+        """Return the statistics in milliseconds, and start over."""
+        result = {
+            'count': self.count,
+            'mean': round(1000 * self.total / self.count, 2) if self.count else None,
+            'max': round(1000 * self.max, 2),
+        }
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        return result
@@ -1,11 +1,16 @@
+import atexit
 import enum
 import logging
+import time
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from . import config
 from . import motor_io as _motor_io
 from . import util
+from .scheduler import Scheduler
+from .state_journal import StateJournal
+from .wakeup import Wakeup
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +18,13 @@ logger = logging.getLogger(__name__)
 @dataclass
 class Action:
     movement: util.Movement
-    start: datetime
+    # The start time on the monotonic clock of the Scheduler
+    start: float
+    # The start time as a Unix timestamp. Only used for the state journal.
+    start_timestamp: float
+    # Whether the action was planned as a full ROOF_MOVEMENT_DURATION run, which verifies the
+    # position of the roof once it ends.
+    is_verification: bool = False
 
     @property
     def orientation(self):
@@ -28,11 +39,34 @@ class Action:
 class MotorController:
     last_stable_position: dict[util.Orientation, float]
     target_position: dict[util.Orientation, float]
+    # Only used for reporting: the verification timers are kept in the scheduler.
     last_verification: dict[util.Orientation, datetime]
-    current_action: Action | None
+    # How sure we are of the estimated position of each roof, between 0 and 1
+    confidence: dict[util.Orientation, float]
+    # Each roof has at most one ongoing action. At most config.MAX_CONCURRENT_ACTIONS roofs move at
+    # the same time.
+    current_actions: dict[util.Orientation, Action]
+    # Whether the next action of a roof is a verification
+    verification_pending: dict[util.Orientation, bool]
+    scheduler: Scheduler
+    journal: StateJournal
+    is_shut_down: bool = False
+
+    # The direction of the last (or ongoing) action of each roof, and the moment it ended on the
+    # monotonic clock.
+    last_direction: dict[util.Orientation, util.Direction | None]
+    last_action_end: dict[util.Orientation, float]
+    # Metrics, for measuring how much the motors are used
+    actuation_seconds: float = 0
+    reversals: int = 0
 
     def __init__(self):
         self.motor_io = _motor_io.create(config.MODE)
+        self.scheduler = Scheduler()
+        self.journal = StateJournal(
+            config.ROOF_STATE_JOURNAL_PATH,
+            config.ROOF_STATE_JOURNAL_COMPACT_AFTER,
+        )
 
         self.last_stable_position = {
             util.Orientation.NORTH: 0,
@@ -42,44 +76,88 @@ class MotorController:
             util.Orientation.NORTH: 0,
             util.Orientation.SOUTH: 0,
         }
-        if config.ROOF_VERIFICATION_ON_STARTUP:
-            self.last_verification = {
-                util.Orientation.NORTH: datetime.fromtimestamp(0),
-                util.Orientation.SOUTH: datetime.fromtimestamp(0),
-            }
-        else:
-            self.last_verification = {
-                util.Orientation.NORTH: datetime.now(),
-                util.Orientation.SOUTH: datetime.now(),
-            }
-        self.current_action = None
+        self.confidence = {
+            util.Orientation.NORTH: 0,
+            util.Orientation.SOUTH: 0,
+        }
+        self.verification_pending = {orientation: False for orientation in util.Orientation}
+        if not self._restore_state():
+            self._reset_verification()
+        self.current_actions = {}
+        self.last_direction = {orientation: None for orientation in util.Orientation}
+        self.last_action_end = {orientation: 0 for orientation in util.Orientation}
+
+        if config.LOOP_MODE == util.LoopMode.EVENT:
+            self.motor_io.set_input_listener(Wakeup().notify)
+
+        # __del__ may run too late during interpreter shutdown to still write the state journal
+        atexit.register(self.shutdown)
 
         logger.info('MotorController is being initialized, stopping all roof movement')
-        for orientation in util.Orientation:
-            for direction in util.Direction:
-                self.write(util.Movement(orientation, direction), False)
+        self.write_many({movement: False for movement in util.Movement})
 
 
     def __del__(self):
+        self.shutdown()
+
+
+    def shutdown(self):
+        if self.is_shut_down:
+            return
+        self.is_shut_down = True
+
         logger.info('MotorController is being deleted, closing all roofs')
-        self.current_action = None
-        for orientation in util.Orientation:
-            self.write(util.Movement(orientation, util.Direction.CLOSE), True)
+        # End the ongoing actions first, so that the journal knows where the roofs start closing.
+        # The last tick may have been a while ago.
+        self.scheduler.tick()
+        for orientation in list(self.current_actions):
+            self._end_action(orientation)
+        self.last_direction = {orientation: None for orientation in util.Orientation}
+        self.last_action_end = {orientation: 0 for orientation in util.Orientation}
+        self.write_many({
+            util.Movement(orientation, util.Direction.CLOSE): True
+            for orientation in util.Orientation
+        })
+
+        # The roofs keep on closing after we exit. When we start again, we know where they are from
+        # how long they have been closing.
+        state = self._get_state()
+        for roof_state in state['roofs'].values():
+            roof_state['action'] = {
+                'direction': util.Direction.CLOSE,
+                'start': time.time(),
+                'shutdown': True,
+            }
+        self.journal.append(state)
 
 
     def read(self, movement: util.Movement) -> bool:
         return self.motor_io.read(movement)
 
-    def write(self, movement: util.Movement, active: bool) -> None:
-        if active:
-            self.write(movement.opposite, False)
+    def read_all(self) -> dict[util.Movement, bool]:
+        return self.motor_io.read_all()
+
 
+    def write(self, movement: util.Movement, active: bool) -> None:
         if active:
-            logger.info(f'Start motor {movement}')
+            self.write_many({movement.opposite: False, movement: True})
         else:
-            logger.info(f'Stop motor {movement}')
+            self.write_many({movement: False})
+
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        """Write several motor outputs at once. Starting a motor always stops the opposite motor."""
+        outputs = outputs.copy()
+        for movement, active in list(outputs.items()):
+            if active:
+                if outputs.get(movement.opposite):
+                    raise Exception(f'Tried to start {movement} and {movement.opposite} at once')
+                outputs[movement.opposite] = False
 
-        self.motor_io.write(movement, active)
+        logger.info(', '.join(
+            f'{"Start" if active else "Stop"} motor {movement}'
+            for movement, active in outputs.items()
+        ))
+        self.motor_io.write_many(outputs)
 
 
     def _get_movement_duration(self, current_position, target_position):
@@ -92,24 +170,38 @@ class MotorController:
 
         for orientation in util.Orientation:
             position = self.last_stable_position[orientation]
-            if self.current_action and self.current_action.orientation == orientation:
-                duration = datetime.now() - self.current_action.start
-                distance = duration / config.ROOF_MOVEMENT_DURATION
-                position += self.current_action.direction.sign * distance
+            action = self.current_actions.get(orientation)
+            if action:
+                duration = self.scheduler.now - action.start
+                distance = duration / config.ROOF_MOVEMENT_DURATION.total_seconds()
+                position += action.direction.sign * distance
             current_position[orientation] = position
 
         return current_position
 
 
     def tick(self):
-        self._check_end_current_action()
+        self._check_end_current_actions()
         self._check_start_verification()
         self._check_start_regular_action()
 
 
-    def set_target_position(self, orientation: util.Orientation, position: float):
+    def set_target_position(
+        self,
+        orientation: util.Orientation,
+        position: float,
+        verification: bool = False,
+    ):
         logger.info(f'Set target position of roof {orientation} to {position:.2f}')
         self.target_position[orientation] = position
+        # Only an action that is planned as a verification from its start counts as one. An ongoing
+        # action that gets a new target didn't start at a known position.
+        self.verification_pending[orientation] = verification
+        action = self.current_actions.get(orientation)
+        if action:
+            action.is_verification = False
+        self._schedule_action_end(orientation)
+        self._save_state()
 
     def set_all_target_positions(self, position: float):
         for orientation in util.Orientation:
@@ -122,69 +214,73 @@ class MotorController:
             and self.target_position[orientation] == 0
         ):
             logger.info(f'Verify roof {orientation} by closing')
-            self.set_target_position(orientation, -1)
+            self.set_target_position(orientation, -1, verification=True)
 
         elif (
             self.current_position[orientation] == 1
             and self.target_position[orientation] == 1
         ):
             logger.info(f'Verify roof {orientation} by opening')
-            self.set_target_position(orientation, 2)
+            self.set_target_position(orientation, 2, verification=True)
 
 
     def ensure_closed(self, orientation: util.Orientation):
         # We don't simply set target position 0: we want to be really sure that the roofs do a
         # full closing cycle, even if our estimate of their current position is wrong.
-        self.set_target_position(orientation, self.current_position[orientation] - 1)
+        self.set_target_position(
+            orientation,
+            self.current_position[orientation] - 1,
+            verification=True,
+        )
 
     def ensure_all_closed(self):
         for orientation in util.Orientation:
             self.ensure_closed(orientation)
 
 
-    def _check_end_current_action(self):
-        if not self.current_action:
-            return
+    def _check_end_current_actions(self):
+        for orientation, action in list(self.current_actions.items()):
+            self._check_end_action(orientation, action)
 
-        orientation = self.current_action.orientation
-        last_stable_position = self.last_stable_position[orientation]
+
+    def _check_end_action(self, orientation: util.Orientation, action: Action):
         current_position = self.current_position[orientation]
         target_position = self.target_position[orientation]
-        is_verification = abs(target_position - last_stable_position) >= 1
         # If the target position is fully closed: let the roof run a few extra seconds. We want
         # a tight fit when closing the roof, which isn't guaranteed after e.g. opening the roof
         # for 20 seconds, and then closing it for 20 seconds.
         if target_position <= 0:
             target_position -= .02
 
-        if (current_position - target_position) * self.current_action.direction.sign >= 0:
+        if (current_position - target_position) * action.direction.sign >= 0:
             logger.info(f'Roof {orientation} has reached target position {target_position:.2f}')
-            self._end_action()
+            self._end_action(orientation)
             # If the target position was set out of bounds (e.g. for a verification), we need to
             # fix that here, otherwise the roof will keep on going forever.
             self.target_position[orientation] = min(max(target_position, 0), 1)
 
-            if is_verification:
+            if action.is_verification:
                 self.last_verification[orientation] = datetime.now()
+                self.confidence[orientation] = 1
+                self._schedule_verification(orientation, timedelta(0))
+
+            self._save_state()
 
 
     def _check_start_verification(self):
         for orientation in util.Orientation:
-            if self.current_action:
-                return
-
-            needs_verification = (
-                datetime.now() - self.last_verification[orientation]
-                > config.ROOF_VERIFICATION_INTERVAL
-            )
+            if orientation in self.current_actions:
+                continue
 
-            if needs_verification:
+            if self.scheduler.is_due(self._verification_overdue_timer(orientation)):
                 self.verify_position(orientation)
 
 
     def _check_start_regular_action(self):
         for orientation in util.Orientation:
-            if self.current_action:
+            if orientation in self.current_actions:
+                continue
+            if len(self.current_actions) >= config.MAX_CONCURRENT_ACTIONS:
                 return
 
             current_position = self.current_position[orientation]
@@ -193,6 +289,12 @@ class MotorController:
             if abs(target_position - current_position) < .001:
                 continue
 
+            target_position = self._piggyback_verification(
+                orientation,
+                current_position,
+                target_position,
+            )
+
             if target_position > current_position:
                 direction = util.Direction.OPEN
                 direction_text = 'Open'
@@ -211,19 +313,241 @@ class MotorController:
 
 
 
-    def _start_action(self, movement):
-        if self.current_action:
-            raise Exception(f'Tried to start an action, but {self.current_action} is ongoing')
-
-        self.current_action = Action(movement, datetime.now())
+    def _start_action(self, movement: util.Movement):
+        orientation = movement.orientation
+        if orientation in self.current_actions:
+            raise Exception(
+                f'Tried to start an action, but {self.current_actions[orientation]} is ongoing'
+            )
+        if len(self.current_actions) >= config.MAX_CONCURRENT_ACTIONS:
+            raise Exception(f'Tried to start an action, but {self.current_actions} are ongoing')
+
+        last_direction = self.last_direction[orientation]
+        if last_direction is not None and last_direction != movement.direction:
+            self.reversals += 1
+        self.last_direction[orientation] = movement.direction
+
+        self.current_actions[orientation] = Action(
+            movement,
+            self.scheduler.now,
+            time.time(),
+            is_verification=self.verification_pending[orientation],
+        )
+        self.verification_pending[orientation] = False
+        self._schedule_action_end(orientation)
+        self._save_state()
         self.write(movement, True)
 
 
-    def _end_action(self):
-        if not self.current_action:
+    def _end_action(self, orientation: util.Orientation):
+        action = self.current_actions.get(orientation)
+        if not action:
             return
 
-        orientation = self.current_action.orientation
         self.last_stable_position[orientation] = min(max(self.current_position[orientation], 0), 1)
-        self.write(self.current_action.movement, False)
-        self.current_action = None
+        self.write(action.movement, False)
+        del self.current_actions[orientation]
+        duration = self.scheduler.now - action.start
+        self.actuation_seconds += duration
+        self.confidence[orientation] = max(
+            self.confidence[orientation]
+            - config.ROOF_POSITION_DRIFT * duration / config.ROOF_MOVEMENT_DURATION.total_seconds(),
+            0,
+        )
+        self.last_action_end[orientation] = self.scheduler.now
+        self.scheduler.cancel(self._action_end_timer(orientation))
+
+
+    def _schedule_action_end(self, orientation: util.Orientation):
+        """Let the scheduler know when the current action should reach its target position."""
+        action = self.current_actions.get(orientation)
+        if not action:
+            return
+
+        target_position = self.target_position[orientation]
+        if target_position <= 0:
+            target_position -= .02
+        distance = (
+            (target_position - self.last_stable_position[orientation])
+            * action.direction.sign
+        )
+        duration = max(distance, 0) * config.ROOF_MOVEMENT_DURATION.total_seconds()
+        self.scheduler.schedule_at(self._action_end_timer(orientation), action.start + duration)
+
+
+    def _piggyback_verification(
+        self,
+        orientation: util.Orientation,
+        current_position: float,
+        target_position: float,
+    ) -> float:
+        """
+        If the roof is due for a verification, and it is about to move to a fully opened/closed
+        position anyway, return a target position that lets it move for the full
+        ROOF_MOVEMENT_DURATION, which makes the movement count as a verification.
+        """
+
+        needs_verification = (
+            self.scheduler.is_due(self._verification_timer(orientation))
+            or self.confidence[orientation] < config.ROOF_VERIFICATION_MIN_CONFIDENCE
+        )
+        if not needs_verification:
+            return target_position
+
+        if current_position - 1 < target_position <= 0:
+            logger.info(f'Extend closing of roof {orientation} to verify its position')
+            self.set_target_position(orientation, current_position - 1, verification=True)
+            return self.target_position[orientation]
+        elif 1 <= target_position < current_position + 1:
+            logger.info(f'Extend opening of roof {orientation} to verify its position')
+            self.set_target_position(orientation, current_position + 1, verification=True)
+            return self.target_position[orientation]
+        else:
+            return target_position
+
+
+    def _schedule_verification(self, orientation: util.Orientation, since: timedelta):
+        """Schedule the verification timers of a roof that was last verified `since` ago."""
+        self.scheduler.schedule(
+            self._verification_timer(orientation),
+            config.ROOF_VERIFICATION_INTERVAL - since,
+        )
+        self.scheduler.schedule(
+            self._verification_overdue_timer(orientation),
+            config.ROOF_VERIFICATION_MAX_INTERVAL - since,
+        )
+
+
+    def _verification_timer(self, orientation: util.Orientation) -> str:
+        return f'verification:{orientation.name}'
+
+    def _verification_overdue_timer(self, orientation: util.Orientation) -> str:
+        return f'verification_overdue:{orientation.name}'
+
+    def _action_end_timer(self, orientation: util.Orientation) -> str:
+        return f'action_end:{orientation.name}'
+
+
+    def _get_state(self) -> dict:
+        roofs = {}
+        for orientation in util.Orientation:
+            action = self.current_actions.get(orientation)
+            if action:
+                action_state = {'direction': action.direction, 'start': action.start_timestamp}
+            else:
+                action_state = None
+
+            roofs[orientation.name] = {
+                'last_stable_position': self.last_stable_position[orientation],
+                'target_position': self.target_position[orientation],
+                'last_verification': self.last_verification[orientation],
+                'confidence': self.confidence[orientation],
+                'action': action_state,
+            }
+
+        return {'roofs': roofs}
+
+
+    def _reset_verification(self):
+        if config.ROOF_VERIFICATION_ON_STARTUP:
+            self.last_verification = {
+                util.Orientation.NORTH: datetime.fromtimestamp(0),
+                util.Orientation.SOUTH: datetime.fromtimestamp(0),
+            }
+            for orientation in util.Orientation:
+                self._schedule_verification(orientation, config.ROOF_VERIFICATION_MAX_INTERVAL)
+        else:
+            self.last_verification = {
+                util.Orientation.NORTH: datetime.now(),
+                util.Orientation.SOUTH: datetime.now(),
+            }
+            for orientation in util.Orientation:
+                self.confidence[orientation] = 1
+                self._schedule_verification(orientation, timedelta(0))
+
+
+    def _save_state(self):
+        self.journal.append(self._get_state())
+
+
+    def _restore_state(self) -> bool:
+        """
+        Restore the roof positions from the state journal.
+
+        The motors keep on running after we stop, so a roof that was closing has been closing ever
+        since. If that was at least ROOF_MOVEMENT_DURATION ago, the roof is closed, and that counts
+        as a verification. When we shut down cleanly, all roofs are closing from a known position,
+        so we can also tell where they are after a shorter restart. In any other case, we don't know
+        where the roof ended up, so it gets verified right away, like on a fresh start.
+
+        Return False if there was nothing to restore.
+        """
+
+        state = self.journal.load()
+        if state is None:
+            return False
+
+        try:
+            roof_states = {
+                orientation: state['roofs'][orientation.name]
+                for orientation in util.Orientation
+            }
+        except (KeyError, TypeError):
+            logger.error(f'Ignoring invalid state journal: {state}')
+            return False
+
+        self.last_verification = {}
+        duration = config.ROOF_MOVEMENT_DURATION.total_seconds()
+        for orientation, roof_state in roof_states.items():
+            action = roof_state['action']
+            elapsed = time.time() - action['start'] if action else 0
+            if (
+                action
+                and action['direction'] == util.Direction.CLOSE.name
+                and elapsed >= duration
+            ):
+                logger.info(
+                    f'Roof {orientation} has been closing for {elapsed:.0f}s since we stopped, so '
+                    f'it is closed'
+                )
+                self.last_stable_position[orientation] = 0
+                self.target_position[orientation] = 0
+                self.confidence[orientation] = 1
+                last_verification = datetime.fromtimestamp(action['start'] + duration)
+                self.last_verification[orientation] = last_verification
+                self._schedule_verification(
+                    orientation,
+                    max(datetime.now() - last_verification, timedelta(0)),
+                )
+                continue
+
+            if action and not action.get('shutdown'):
+                logger.info(f'Roof {orientation} was moving when we stopped, verifying it')
+                self.last_stable_position[orientation] = 0
+                self.target_position[orientation] = 0
+                self.last_verification[orientation] = datetime.fromtimestamp(0)
+                self._schedule_verification(orientation, config.ROOF_VERIFICATION_MAX_INTERVAL)
+                continue
+
+            self.last_stable_position[orientation] = roof_state['last_stable_position']
+            self.target_position[orientation] = roof_state['target_position']
+            if action:
+                # We shut down cleanly less than ROOF_MOVEMENT_DURATION ago. The roof was closing
+                # ever since, and it should finish closing now.
+                self.last_stable_position[orientation] = max(
+                    self.last_stable_position[orientation] - elapsed / duration,
+                    0,
+                )
+                self.target_position[orientation] = 0
+            last_verification = datetime.fromtimestamp(roof_state['last_verification'])
+            self.last_verification[orientation] = last_verification
+            self.confidence[orientation] = roof_state.get('confidence', 0)
+            # The journal is stored in wall clock time, so we have to rely on it here
+            since_verification = max(datetime.now() - last_verification, timedelta(0))
+            self._schedule_verification(orientation, since_verification)
+            logger.info(
+                f'Restored roof {orientation} at position '
+                f'{self.last_stable_position[orientation]:.2f}'
+            )
+
+        return True
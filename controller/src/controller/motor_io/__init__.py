@@ -15,12 +15,39 @@ __all__ = (
 def create(mode: util.Mode):
     if mode == util.Mode.GPIO:
         from .gpio import GPIO
-        return GPIO(config.GPIO_CONFIG)
+        return GPIO(
+            config.GPIO_CONFIG,
+            config.INPUT_POLL_INTERVAL,
+            config.INPUT_DEBOUNCE,
+            config.INPUT_EVENT_BUFFER_SIZE,
+        )
+    elif mode == util.Mode.GPIO_REGISTERS:
+        import wiringpi
+
+        from .gpio_registers import MMapRegisters, RegisterGPIO
+
+        # We only use wiringpi to translate the pin numbers in GPIO_CONFIG to GPIO numbers
+        wiringpi.wiringPiSetup()
+        register_blocks = [
+            MMapRegisters(config.GPIO_REGISTER_DEVICE, address, RegisterGPIO.BLOCK_SIZE)
+            for address in config.GPIO_REGISTER_ADDRESSES
+        ]
+        return RegisterGPIO(
+            config.GPIO_CONFIG,
+            register_blocks,
+            wiringpi.wpiPinToGpio,
+            config.INPUT_POLL_INTERVAL,
+            config.INPUT_DEBOUNCE,
+            config.INPUT_EVENT_BUFFER_SIZE,
+        )
     elif mode == util.Mode.KEYBOARD:
         from .keyboard import KeyboardIO
         return KeyboardIO(config.KEYBOARD_IO_CONFIG)
     elif mode == util.Mode.MQTT:
         from .mqtt import MQTTIO
         return MQTTIO(config.MQTT_IO_CONFIG)
+    elif mode == util.Mode.FAKE:
+        from .fake import FakeIO
+        return FakeIO(config.INPUT_DEBOUNCE, config.INPUT_EVENT_BUFFER_SIZE)
     else:
         raise Exception(f'Unknown mode: {mode}')
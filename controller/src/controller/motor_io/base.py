@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import abc
 import logging
+import typing
 
 from .. import util
 
@@ -10,6 +11,19 @@ logger = logging.getLogger(__name__)
 
 
 class MotorIO(abc.ABC):
+    input_listener: typing.Callable[[], None] | None = None
+
+
+    def set_input_listener(self, listener: typing.Callable[[], None]) -> None:
+        """Register a callback that is called (from any thread) whenever an input changes."""
+        self.input_listener = listener
+
+
+    def _notify_input(self) -> None:
+        if self.input_listener:
+            self.input_listener()
+
+
     @abc.abstractmethod
     def read(self, movement: util.Movement) -> bool:
         return NotImplemented
@@ -18,3 +32,21 @@ class MotorIO(abc.ABC):
     @abc.abstractmethod
     def write(self, movement: util.Movement, active: bool) -> None:
         return NotImplemented
+
+
+    def read_all(self) -> dict[util.Movement, bool]:
+        """
+        Return a snapshot of all inputs. Backends that can read all inputs at once should override
+        this.
+        """
+        return {movement: self.read(movement) for movement in util.Movement}
+
+
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        """
+        Write several outputs at once. Outputs that are deactivated are written before outputs that
+        are activated, so that two opposite motors are never active at the same time. Backends
+        that can write several outputs at once should override this.
+        """
+        for movement, active in sorted(outputs.items(), key=lambda item: item[1]):
+            self.write(movement, active)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import time
+import typing
+from datetime import timedelta
+
+from .. import util
+from .base import MotorIO
+from .input_events import InputEventBuffer
+
+__all__ = (
+    'FakeIO',
+)
+
+
+class FakeIO(MotorIO):
+    """
+    A MotorIO without any hardware, for tests and simulations.
+
+    Input edges are pushed into the same debouncing InputEventBuffer that the GPIO backends use, as
+    if they came from an interrupt handler, so the debouncing and latching can be exercised on any
+    machine. The outputs are only recorded.
+    """
+
+    input_events: InputEventBuffer
+    outputs: dict[util.Movement, bool]
+    # Every output change, as (time.monotonic(), movement, active)
+    output_log: list[tuple[float, util.Movement, bool]]
+
+
+    def __init__(self, debounce: timedelta, event_buffer_size: int):
+        self.input_events = InputEventBuffer(
+            {movement: False for movement in util.Movement},
+            debounce,
+            event_buffer_size,
+        )
+        self.outputs = {movement: False for movement in util.Movement}
+        self.output_log = []
+
+
+    def push(self, movement: util.Movement, active: bool, timestamp: float | None = None) -> None:
+        """Push a single input edge."""
+        self.input_events.push(movement, active, timestamp)
+        self._notify_input()
+
+
+    def push_edges(
+        self,
+        movement: util.Movement,
+        edges: typing.Iterable[tuple[float, bool]],
+    ) -> None:
+        """Push a sequence of (timestamp, active) edges, e.g. a button press with contact bounce."""
+        for timestamp, active in edges:
+            self.input_events.push(movement, active, timestamp)
+        self._notify_input()
+
+
+    def read(self, movement: util.Movement) -> bool:
+        return self.input_events.read(movement)
+
+    def read_all(self) -> dict[util.Movement, bool]:
+        return self.input_events.read_all()
+
+
+    def write(self, movement: util.Movement, active: bool) -> None:
+        self.write_many({movement: active})
+
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        now = time.monotonic()
+        for movement, active in sorted(outputs.items(), key=lambda item: item[1]):
+            if active and self.outputs[movement.opposite]:
+                raise Exception(f'Tried to start {movement} while {movement.opposite} is active')
+            if self.outputs[movement] != active:
+                self.outputs[movement] = active
+                self.output_log.append((now, movement, active))
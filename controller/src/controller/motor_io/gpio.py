@@ -1,12 +1,21 @@
 from __future__ import annotations
 
 import enum
+import logging
+import threading
+import time
+import typing
 from dataclasses import dataclass
-
-import wiringpi
+from datetime import timedelta
 
 from .. import util
 from .base import MotorIO
+from .input_events import InputEventBuffer
+
+if typing.TYPE_CHECKING:
+    import wiringpi
+
+logger = logging.getLogger(__name__)
 
 __all__ = (
     'GPIO',
@@ -30,10 +39,26 @@ class GPIO(MotorIO):
     Config = dict[util.Movement, MovementConfig]
 
     config: Config
+    # wiringpi is only available on the Orange Pi. Like pynput in KeyboardIO, it is imported when a
+    # GPIO is created, so that the config can be imported anywhere.
+    wiringpi: typing.Any
+    poll_interval: timedelta
+    input_events: InputEventBuffer
+    poll_thread: threading.Thread | None = None
+
+
+    def __init__(
+        self,
+        config: Config,
+        poll_interval: timedelta,
+        debounce: timedelta,
+        event_buffer_size: int,
+    ):
+        import wiringpi
 
-
-    def __init__(self, config: Config):
         self.config = config
+        self.wiringpi = wiringpi
+        self.poll_interval = poll_interval
 
         wiringpi.wiringPiSetup()
         # pullUpDnControl doesn't seem to work in wiringOP, so we set the pin modes in pin_mode.sh
@@ -46,13 +71,79 @@ class GPIO(MotorIO):
         #         wiringpi.pullUpDnControl(input_pin, wiringpi.PUD_DOWN)
         #         wiringpi.pinMode(output_pin, wiringpi.OUTPUT)
 
+        self.input_events = InputEventBuffer(
+            {movement: self._read_pin(movement) for movement in self.config},
+            debounce,
+            event_buffer_size,
+        )
+        if not self._register_interrupts():
+            # Without interrupts, we poll the input pins in a separate thread instead, and only
+            # record the changes.
+            logger.warning('Could not register GPIO interrupts, polling the input pins instead')
+            self.poll_thread = threading.Thread(target=self._poll_inputs, daemon=True)
+            self.poll_thread.start()
+
+
+    def _register_interrupts(self) -> bool:
+        for movement, movement_config in self.config.items():
+            callback = lambda movement=movement: self._on_interrupt(movement)
+            try:
+                result = self.wiringpi.wiringPiISR(
+                    movement_config.input_pin,
+                    self.wiringpi.INT_EDGE_BOTH,
+                    callback,
+                )
+            except (AttributeError, TypeError):
+                # Not all wiringpi builds support Python callbacks
+                return False
+            if result < 0:
+                return False
+        return True
+
+
+    def _on_interrupt(self, movement: util.Movement) -> None:
+        # The interrupt doesn't tell us which edge was triggered, so we read the pin right away.
+        self.input_events.push(movement, self._read_pin(movement))
+        self._notify_input()
+
+
+    def _poll_inputs(self) -> None:
+        inputs = {movement: self._read_pin(movement) for movement in self.config}
+        while True:
+            time.sleep(self.poll_interval.total_seconds())
+            for movement in self.config:
+                active = self._read_pin(movement)
+                if active != inputs[movement]:
+                    inputs[movement] = active
+                    self.input_events.push(movement, active)
+                    self._notify_input()
+
+
+    def _read_pin(self, movement: util.Movement) -> bool:
+        pin = self.config[movement].input_pin
+        return self.wiringpi.digitalRead(pin) == 1
+
 
     def read(self, movement: util.Movement) -> bool:
-        pin = self.config[movement].input_pin
-        return wiringpi.digitalRead(pin) == 1
+        return self.input_events.read(movement)
+
+    def read_all(self) -> dict[util.Movement, bool]:
+        return self.input_events.read_all()
 
 
     def write(self, movement: util.Movement, active: bool) -> None:
         pin_config = self.config[movement]
         pin_value = int(bool(active) ^ (pin_config.pin_mode == PinMode.ACTIVE_LOW))
-        wiringpi.digitalWrite(pin_config.output_pin, pin_value)
+        self.wiringpi.digitalWrite(pin_config.output_pin, pin_value)
+
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        # Resolve all pins first, so that an unknown movement doesn't leave us with half of the
+        # outputs written.
+        pin_values = []
+        for movement, active in sorted(outputs.items(), key=lambda item: item[1]):
+            pin_config = self.config[movement]
+            pin_value = int(bool(active) ^ (pin_config.pin_mode == PinMode.ACTIVE_LOW))
+            pin_values.append((pin_config.output_pin, pin_value))
+
+        for pin, pin_value in pin_values:
+            self.wiringpi.digitalWrite(pin, pin_value)
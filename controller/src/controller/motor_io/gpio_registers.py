@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import abc
+import mmap
+import os
+import struct
+import threading
+import time
+import typing
+from datetime import timedelta
+
+from .. import util
+from .base import MotorIO
+from .gpio import GPIO, PinMode
+from .input_events import InputEventBuffer
+
+__all__ = (
+    'MMapRegisters',
+    'RegisterGPIO',
+    'Registers',
+)
+
+
+WORD = struct.Struct('<I')
+
+
+class Registers(abc.ABC):
+    """A block of 32-bit registers, addressed by their byte offset within the block."""
+
+    @abc.abstractmethod
+    def read(self, offset: int) -> int:
+        return NotImplemented
+
+
+    @abc.abstractmethod
+    def write(self, offset: int, value: int) -> None:
+        return NotImplemented
+
+
+class MMapRegisters(Registers):
+    """
+    Registers that are mapped from a file: /dev/gpiomem, /dev/mem, or an ordinary file that acts as
+    a fake register bank.
+    """
+
+    mmap: mmap.mmap
+    # The offset of the register block within the mapped page
+    start: int
+
+
+    def __init__(self, path: str, address: int, size: int):
+        page_address = address - address % mmap.PAGESIZE
+        self.start = address - page_address
+
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self.mmap = mmap.mmap(fd, self.start + size, offset=page_address)
+        finally:
+            os.close(fd)
+
+
+    def read(self, offset: int) -> int:
+        return WORD.unpack_from(self.mmap, self.start + offset)[0]
+
+
+    def write(self, offset: int, value: int) -> None:
+        WORD.pack_into(self.mmap, self.start + offset, value)
+
+
+class RegisterGPIO(MotorIO):
+    """
+    Reads and writes the GPIO pins directly in the registers of the Allwinner (sunxi) pin
+    controller, instead of going through wiringpi for every pin.
+
+    The Linux GPIO number of a pin is `32 * port + bit`. Each port has a 32-bit data register, so
+    all pins on the same port are read with one register read, and written with one masked write.
+    Ports 0-10 (PA-PK) are in the first register block, ports 11 and up (PL, PM) in the second.
+
+    Like the GPIO backend, this doesn't configure the pins: they should already be set up as inputs
+    and outputs.
+    """
+
+    # The register layout of a sunxi pin controller
+    PORT_SIZE = 0x24
+    DATA_OFFSET = 0x10
+    PORTS_PER_BLOCK = 11
+    BLOCK_SIZE = 0x400
+
+    config: GPIO.Config
+    register_blocks: typing.Sequence[Registers]
+    # The Linux GPIO numbers of the input and output pin of each movement
+    input_gpios: dict[util.Movement, int]
+    output_gpios: dict[util.Movement, int]
+    poll_interval: timedelta
+    input_events: InputEventBuffer
+    poll_thread: threading.Thread
+
+
+    def __init__(
+        self,
+        config: GPIO.Config,
+        register_blocks: typing.Sequence[Registers],
+        pin_to_gpio: typing.Callable[[int], int],
+        poll_interval: timedelta,
+        debounce: timedelta,
+        event_buffer_size: int,
+    ):
+        self.config = config
+        self.register_blocks = register_blocks
+        self.poll_interval = poll_interval
+
+        self.input_gpios = {
+            movement: pin_to_gpio(movement_config.input_pin)
+            for movement, movement_config in config.items()
+        }
+        self.output_gpios = {
+            movement: pin_to_gpio(movement_config.output_pin)
+            for movement, movement_config in config.items()
+        }
+        for gpio in [*self.input_gpios.values(), *self.output_gpios.values()]:
+            if gpio < 0:
+                raise Exception(f'Pin in {config} is not a GPIO pin')
+
+        self.input_events = InputEventBuffer(self._read_inputs(), debounce, event_buffer_size)
+
+        # The registers can't notify us of input changes, so we poll the input pins in a separate
+        # thread, and only record the changes.
+        self.poll_thread = threading.Thread(target=self._poll_inputs, daemon=True)
+        self.poll_thread.start()
+
+
+    def _poll_inputs(self) -> None:
+        inputs = self._read_inputs()
+        while True:
+            time.sleep(self.poll_interval.total_seconds())
+            new_inputs = self._read_inputs()
+            if new_inputs != inputs:
+                timestamp = time.monotonic()
+                for movement, active in new_inputs.items():
+                    if active != inputs[movement]:
+                        self.input_events.push(movement, active, timestamp)
+                inputs = new_inputs
+                self._notify_input()
+
+
+    def _read_inputs(self) -> dict[util.Movement, bool]:
+        """Read all input pins, with one register read per port."""
+        port_values = {}
+        inputs = {}
+        for movement, gpio in self.input_gpios.items():
+            port, bit = divmod(gpio, 32)
+            if port not in port_values:
+                registers, offset = self._get_data_register(port)
+                port_values[port] = registers.read(offset)
+            inputs[movement] = bool(port_values[port] >> bit & 1)
+        return inputs
+
+
+    def _get_data_register(self, port: int) -> tuple[Registers, int]:
+        block, port = divmod(port, self.PORTS_PER_BLOCK)
+        return self.register_blocks[block], port * self.PORT_SIZE + self.DATA_OFFSET
+
+
+    def read(self, movement: util.Movement) -> bool:
+        return self.input_events.read(movement)
+
+    def read_all(self) -> dict[util.Movement, bool]:
+        return self.input_events.read_all()
+
+
+    def write(self, movement: util.Movement, active: bool) -> None:
+        self.write_many({movement: active})
+
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        # Outputs that are deactivated are written first, so that two opposite motors are never
+        # active at the same time.
+        for active in (False, True):
+            masks: dict[int, tuple[int, int]] = {}
+            for movement, movement_active in outputs.items():
+                if movement_active != active:
+                    continue
+
+                port, bit = divmod(self.output_gpios[movement], 32)
+                pin_value = active ^ (self.config[movement].pin_mode == PinMode.ACTIVE_LOW)
+                mask, values = masks.get(port, (0, 0))
+                masks[port] = (mask | 1 << bit, values | pin_value << bit)
+
+            for port, (mask, values) in masks.items():
+                registers, offset = self._get_data_register(port)
+                registers.write(offset, registers.read(offset) & ~mask | values)
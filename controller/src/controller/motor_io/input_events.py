@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import collections
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from .. import util
+from ..scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    'InputEventBuffer',
+)
+
+
+@dataclass
+class InputEvent:
+    movement: util.Movement
+    active: bool
+    timestamp: float
+
+
+@dataclass
+class InputState:
+    # The debounced state of the input
+    active: bool
+    last_change: float
+    # The state of the input according to the latest event, which may still be bouncing
+    raw_active: bool
+    raw_timestamp: float
+    # Whether the input became active since the last read. This makes sure that a short button
+    # press between two reads is not missed.
+    latched: bool = False
+
+
+class InputEventBuffer:
+    """
+    Collects input edges in a ring buffer, and turns them into a debounced, latched input state.
+
+    Edges can be pushed from any thread (e.g. an interrupt handler). They are only processed when
+    the state is read, so pushing an edge is cheap. The first edge of a bounce is accepted right
+    away, following edges are ignored until the input has been stable for `debounce`. If the last
+    edge was ignored, a scheduler deadline makes sure the state is read again once it has settled:
+    otherwise, the release of a short tap would only be noticed at the next unrelated wakeup.
+    """
+
+    debounce: float
+    events: collections.deque[InputEvent]
+    states: dict[util.Movement, InputState]
+    lock: threading.Lock
+    dropped: int = 0
+
+
+    def __init__(
+        self,
+        initial_state: dict[util.Movement, bool],
+        debounce: timedelta,
+        size: int,
+    ):
+        self.debounce = debounce.total_seconds()
+        self.events = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+        # The initial state is not a change, so the first edge is never treated as a bounce.
+        self.states = {
+            movement: InputState(active, float('-inf'), active, float('-inf'))
+            for movement, active in initial_state.items()
+        }
+
+
+    def push(self, movement: util.Movement, active: bool, timestamp: float | None = None) -> None:
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with self.lock:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(InputEvent(movement, active, timestamp))
+
+
+    def read(self, movement: util.Movement, now: float | None = None) -> bool:
+        """Return whether the input is active, or has been active since the last read."""
+        if now is None:
+            now = time.monotonic()
+
+        self._process_events()
+        return self._read_state(self.states[movement], now)
+
+
+    def read_all(self, now: float | None = None) -> dict[util.Movement, bool]:
+        """Like read(), for all inputs at once."""
+        if now is None:
+            now = time.monotonic()
+
+        self._process_events()
+        return {movement: self._read_state(state, now) for movement, state in self.states.items()}
+
+
+    def _read_state(self, state: InputState, now: float) -> bool:
+        self._settle(state, now)
+        active = state.active or state.latched
+        state.latched = False
+        return active
+
+
+    def _process_events(self) -> None:
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+            dropped, self.dropped = self.dropped, 0
+
+        if dropped:
+            logger.warning(f'Input event buffer overflowed, dropped {dropped} events')
+
+        for event in events:
+            state = self.states[event.movement]
+            self._settle(state, event.timestamp)
+            state.raw_active = event.active
+            state.raw_timestamp = event.timestamp
+
+            if (
+                event.active != state.active
+                and event.timestamp - state.last_change >= self.debounce
+            ):
+                self._change(state, event.active, event.timestamp)
+
+        for movement in {event.movement for event in events}:
+            state = self.states[movement]
+            timer = f'input_settle:{movement}'
+            if state.raw_active != state.active:
+                Scheduler().schedule_at(timer, state.raw_timestamp + self.debounce)
+            else:
+                Scheduler().cancel(timer)
+
+
+    def _settle(self, state: InputState, now: float) -> None:
+        """
+        If the last event of a bounce was ignored, the debounced state may be wrong. Once the
+        input has been stable for long enough, we trust the last event.
+        """
+        # Compared the same way as the settle deadline is computed, so that the input has settled
+        # when the main loop wakes up at that deadline, despite rounding.
+        if state.raw_active != state.active and now >= state.raw_timestamp + self.debounce:
+            self._change(state, state.raw_active, state.raw_timestamp)
+
+
+    def _change(self, state: InputState, active: bool, timestamp: float) -> None:
+        state.active = active
+        state.last_change = timestamp
+        if active:
+            state.latched = True
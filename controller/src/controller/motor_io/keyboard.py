@@ -45,11 +45,13 @@ class KeyboardIO(MotorIO):
         char = self._get_char(key)
         if type(char) == str:
             self.pressed_keys.add(char)
+            self._notify_input()
 
     def _on_key_release(self, key: pynput.keyboard.Key | pynput.keyboard.KeyCode | None) -> None:
         char = self._get_char(key)
         if type(char) == str:
             self.pressed_keys.remove(char)
+            self._notify_input()
 
     def _get_char(self, key: pynput.keyboard.Key | pynput.keyboard.KeyCode | None) -> str | None:
         return getattr(key, 'char', None)
@@ -60,6 +62,18 @@ class KeyboardIO(MotorIO):
         return char in self.pressed_keys
 
 
+    def read_all(self) -> dict[util.Movement, bool]:
+        pressed_keys = self.pressed_keys.copy()
+        return {
+            movement: movement_config.key in pressed_keys
+            for movement, movement_config in self.config.items()
+        }
+
+
     def write(self, movement: util.Movement, active: bool) -> None:
         # Do nothing
         pass
+
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        # Do nothing
+        pass
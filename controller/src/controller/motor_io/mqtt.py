@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import functools
 import logging
 from dataclasses import dataclass
 
-from controller.mqtt_client import MQTTClient
+from controller.mqtt_client import MQTTClient, get_common_topic_filter
 
 from .. import config as _config
 from .. import util
@@ -40,21 +41,39 @@ class MQTTIO(MotorIO):
             for movement in util.Movement
         }
 
-        for movement_config in self.config.values():
-            self.mqtt_client.subscribe(movement_config.topic, self._on_mqtt_message)
+        # All movement topics share a single wildcard subscription at the broker, but each of them
+        # gets its own callback, so we know the movement without having to look up the topic.
+        subscription = get_common_topic_filter(
+            movement_config.topic for movement_config in self.config.values()
+        )
+        for movement, movement_config in self.config.items():
+            self.mqtt_client.subscribe(
+                movement_config.topic,
+                functools.partial(self._on_mqtt_message, movement),
+                subscription=subscription,
+            )
 
 
-    def _on_mqtt_message(self, topic, payload):
-        for movement, movement_config in self.config.items():
-                if movement_config.topic == topic:
-                    self.active_inputs[movement] = (payload != '0')
+    def _on_mqtt_message(self, movement: util.Movement, topic: str, payload: str):
+        # This is called from MQTTClient.process_messages() at the start of a tick, before the
+        # inputs are read, and the MQTT client already woke up the main loop for the message. So
+        # unlike the other backends, we don't notify the input listener.
+        self.active_inputs[movement] = (payload != '0')
 
 
     def read(self, movement: util.Movement) -> bool:
         return self.active_inputs[movement]
 
 
+    def read_all(self) -> dict[util.Movement, bool]:
+        return self.active_inputs.copy()
+
+
     def write(self, movement: util.Movement, active: bool) -> None:
         # Do nothing
         pass
 
+    def write_many(self, outputs: dict[util.Movement, bool]) -> None:
+        # Do nothing
+        pass
+
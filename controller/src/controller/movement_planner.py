@@ -0,0 +1,118 @@
+import logging
+
+from . import config, util
+from .motor_controller import MotorController
+from .scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class MovementPlanner:
+    """
+    Sits between the controllers that decide where the roofs should go, and the MotorController
+    that moves them.
+
+    Automatic target positions that are requested during a tick are merged, and only passed on to
+    the MotorController at the end of the tick. A small reversal shortly after a roof has moved in
+    the other direction is held back until MOVEMENT_REVERSAL_WINDOW has passed: it is usually
+    caused by a temperature that oscillates around the boundary of a position step, and will often
+    have been cancelled again by then. Urgent movements (manual input, safety limits) are passed on
+    right away, and discard any requested movements of the roof.
+    """
+
+    motor_controller: MotorController
+    scheduler: Scheduler
+    # Target positions that were requested this tick, or that are being held back
+    requested: dict[util.Orientation, float]
+    held_back: int = 0
+
+
+    def __init__(self, motor_controller: MotorController):
+        self.motor_controller = motor_controller
+        self.scheduler = Scheduler()
+        self.requested = {}
+
+
+    def get_target_position(self, orientation: util.Orientation) -> float:
+        """
+        Return the requested target position of a roof. Note that a request may be held back: the
+        target position of the MotorController is where the roof is actually going.
+        """
+        return self.requested.get(orientation, self.motor_controller.target_position[orientation])
+
+
+    def request_target_position(self, orientation: util.Orientation, position: float):
+        """Request an automatic movement. It is planned at the end of the tick, in commit()."""
+        self.requested[orientation] = position
+
+
+    def set_target_position(self, orientation: util.Orientation, position: float):
+        """Move a roof right away, overriding any requested movements."""
+        self.discard(orientation)
+        self.motor_controller.set_target_position(orientation, position)
+
+    def ensure_closed(self, orientation: util.Orientation):
+        self.discard(orientation)
+        self.motor_controller.ensure_closed(orientation)
+
+    def verify_position(self, orientation: util.Orientation):
+        self.discard(orientation)
+        self.motor_controller.verify_position(orientation)
+
+
+    def discard(self, orientation: util.Orientation):
+        """Forget the requested movement of a roof, including one that is being held back."""
+        self.requested.pop(orientation, None)
+        self.scheduler.cancel(self._hold_timer(orientation))
+
+    def discard_all(self):
+        for orientation in util.Orientation:
+            self.discard(orientation)
+
+
+    def commit(self):
+        for orientation, position in list(self.requested.items()):
+            # A verification run has a target beyond the end stop. It already goes where a request
+            # for that end stop wants to go, and it must not be cut short.
+            target_position = min(max(self.motor_controller.target_position[orientation], 0), 1)
+            if position == target_position:
+                del self.requested[orientation]
+
+            elif not self._hold_back(orientation, position):
+                del self.requested[orientation]
+                self.scheduler.cancel(self._hold_timer(orientation))
+                self.motor_controller.set_target_position(orientation, position)
+
+
+    def _hold_back(self, orientation: util.Orientation, position: float) -> bool:
+        last_direction = self.motor_controller.last_direction[orientation]
+        current_position = self.motor_controller.current_position[orientation]
+        distance = position - current_position
+
+        if (
+            last_direction is None
+            or distance * last_direction.sign >= 0
+            or abs(distance) >= config.MOVEMENT_MIN_REVERSAL
+        ):
+            return False
+
+        if orientation in self.motor_controller.current_actions:
+            last_movement = self.scheduler.now
+        else:
+            last_movement = self.motor_controller.last_action_end[orientation]
+        window_end = last_movement + config.MOVEMENT_REVERSAL_WINDOW.total_seconds()
+        if window_end <= self.scheduler.now:
+            return False
+
+        if not self.scheduler.is_pending(self._hold_timer(orientation)):
+            logger.info(
+                f'Hold back reversal of roof {orientation} to {position:.2f} for '
+                f'{window_end - self.scheduler.now:.0f}s'
+            )
+            self.held_back += 1
+        self.scheduler.schedule_at(self._hold_timer(orientation), window_end)
+        return True
+
+
+    def _hold_timer(self, orientation: util.Orientation) -> str:
+        return f'hold_back:{orientation.name}'
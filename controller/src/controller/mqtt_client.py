@@ -1,26 +1,164 @@
+from __future__ import annotations
+
+import collections
 import logging
+import time
 import typing
+from dataclasses import dataclass
 
 import paho.mqtt.client
 import paho.mqtt.enums
 
 from . import config, util
+from .metrics import Timing
+from .mqtt_outbox import OutgoingMessage, Outbox
+from .wakeup import Wakeup
 
 logger = logging.getLogger(__name__)
 
 
+Callback = typing.Callable[[str, str], None]
+
+
 class MQTTException(Exception):
     pass
 
 
+@dataclass
+class Message:
+    topic: str
+    payload: str
+    # The time.monotonic() at which paho received the message
+    received: float
+    # Whether the broker sent a retained message because we (re)subscribed
+    retain: bool = False
+
+
+class TopicTrie:
+    """
+    Maps MQTT topic filters, which may contain the wildcards + and #, to callbacks. Finding the
+    callbacks of a topic takes O(topic depth), plus one extra branch for every wildcard level.
+    """
+
+    children: dict[str, TopicTrie]
+    callbacks: list[Callback]
+
+
+    def __init__(self):
+        self.children = {}
+        self.callbacks = []
+
+
+    def add(self, topic_filter: str, callback: Callback) -> None:
+        node = self
+        for level in topic_filter.split('/'):
+            node = node.children.setdefault(level, TopicTrie())
+        node.callbacks.append(callback)
+
+
+    def remove(self, topic_filter: str, callback: Callback) -> None:
+        self._remove(topic_filter.split('/'), callback)
+
+    def _remove(self, levels: list[str], callback: Callback) -> None:
+        if not levels:
+            try:
+                self.callbacks.remove(callback)
+            except ValueError:
+                pass
+            return
+
+        child = self.children.get(levels[0])
+        if child is None:
+            return
+        child._remove(levels[1:], callback)
+        if not child.callbacks and not child.children:
+            del self.children[levels[0]]
+
+
+    def match(self, topic: str) -> list[Callback]:
+        callbacks = []
+        self._match(topic.split('/'), 0, callbacks)
+        return callbacks
+
+    def _match(self, levels: list[str], index: int, callbacks: list[Callback]) -> None:
+        # Wildcards don't match topics that start with $, such as $SYS
+        wildcards = index > 0 or not levels[0].startswith('$')
+
+        # A # also matches its parent level: sport/# matches sport
+        if wildcards and '#' in self.children:
+            callbacks.extend(self.children['#'].callbacks)
+
+        if index == len(levels):
+            callbacks.extend(self.callbacks)
+            return
+
+        child = self.children.get(levels[index])
+        if child is not None:
+            child._match(levels, index + 1, callbacks)
+        if wildcards and '+' in self.children:
+            self.children['+']._match(levels, index + 1, callbacks)
+
+
+def get_common_topic_filter(topics: typing.Iterable[str]) -> str:
+    """
+    Return a topic filter that matches all the given topics, by replacing the levels in which they
+    differ with +. E.g. roof/north/open and roof/south/close give roof/+/+.
+    """
+    topics = list(topics)
+    split_topics = [topic.split('/') for topic in topics]
+    if len(set(len(levels) for levels in split_topics)) != 1:
+        # Topics of different depths can only be matched with #, which is probably too broad
+        raise Exception(f'Topics {topics} have different depths')
+
+    return '/'.join(
+        levels[0] if len(set(levels)) == 1 else '+'
+        for levels in zip(*split_topics)
+    )
+
+
 class MQTTClient(metaclass=util.Singleton):
+    """
+    Messages are received on paho's network thread, but the callbacks are called on the main
+    thread, in process_messages(). The network thread is the only producer of the inbox, and the
+    main thread its only consumer, so the atomic append() and popleft() of a deque are all the
+    synchronisation we need.
+    """
+
     topic_prefix: str
-    callbacks: dict[str, typing.List[typing.Callable[[str, str], None]]]
+    routes: TopicTrie
+    # The number of callbacks that use each broker subscription
+    subscriptions: dict[str, int]
     client: paho.mqtt.client.Client
 
+    inbox: collections.deque[Message]
+    # The last payload that was handled on each topic, used to skip duplicate messages
+    last_payloads: dict[str, str]
+    # The time between receiving a message and handling it
+    latency: Timing
+    dropped: int = 0
+    duplicates: int = 0
+
+    # Messages that were published while we were disconnected
+    outbox: Outbox
+    outbox_drained: int = 0
+    # How long we were disconnected before each reconnect
+    reconnect_time: Timing
+    reconnects: int = 0
+    disconnected_at: float | None = None
+
     def __init__(self):
         self.topic_prefix = config.MQTT_TOPIC_PREFIX
-        self.callbacks = {}
+        self.routes = TopicTrie()
+        self.subscriptions = {}
+        self.inbox = collections.deque(maxlen=config.MQTT_INBOX_SIZE)
+        self.last_payloads = {}
+        self.latency = Timing()
+        self.outbox = Outbox(
+            config.MQTT_OUTBOX_PATH,
+            config.MQTT_OUTBOX_SIZE,
+            config.MQTT_OUTBOX_SAVE_DELAY,
+        )
+        self.reconnect_time = Timing()
 
         self.client = paho.mqtt.client.Client(
             paho.mqtt.enums.CallbackAPIVersion.VERSION2,
@@ -28,9 +166,15 @@ class MQTTClient(metaclass=util.Singleton):
         )
         self.client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
         self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
         self.client.on_subscribe = self._on_subscribe
         self.client.on_message = self._on_message
-        self.client.connect(config.MQTT_HOST, config.MQTT_PORT)
+        # paho's network thread keeps on trying to (re)connect, with an exponential backoff
+        self.client.reconnect_delay_set(
+            int(config.MQTT_RECONNECT_MIN_DELAY.total_seconds()),
+            int(config.MQTT_RECONNECT_MAX_DELAY.total_seconds()),
+        )
+        self.client.connect_async(config.MQTT_HOST, config.MQTT_PORT)
         self.client.loop_start()
 
 
@@ -39,8 +183,29 @@ class MQTTClient(metaclass=util.Singleton):
 
 
     def _on_connect(self, client: paho.mqtt.client.Client, userdata, flags, rc, properties):
-        if rc != 0:
-            raise MQTTException(f'Failed to connect to MQTT, return code {rc}')
+        if rc.is_failure:
+            # paho will try again
+            logger.error(f'Failed to connect to MQTT: {rc}')
+            return
+
+        if self.disconnected_at is not None:
+            disconnected = time.monotonic() - self.disconnected_at
+            self.disconnected_at = None
+            self.reconnects += 1
+            self.reconnect_time.add(disconnected)
+            logger.info(f'Reconnected to MQTT after {disconnected:.0f}s')
+
+        # The broker may have forgotten our subscriptions
+        for subscription in list(self.subscriptions):
+            self.client.subscribe(subscription)
+
+        self._drain_outbox()
+
+
+    def _on_disconnect(self, client: paho.mqtt.client.Client, userdata, flags, rc, properties):
+        if self.disconnected_at is None:
+            self.disconnected_at = time.monotonic()
+        logger.warning(f'Disconnected from MQTT: {rc}')
 
 
     def _on_subscribe(self, client: paho.mqtt.client.Client, userdata, mid, rcs, properties):
@@ -61,14 +226,47 @@ class MQTTClient(metaclass=util.Singleton):
         userdata,
         message: paho.mqtt.client.MQTTMessage,
     ):
-        topic = self._strip_topic(message.topic)
-        payload = message.payload.decode()
-        callbacks = self.callbacks.get(message.topic, [])
+        if len(self.inbox) == self.inbox.maxlen:
+            self.dropped += 1
+        self.inbox.append(Message(
+            message.topic,
+            message.payload.decode(),
+            message.timestamp,
+            message.retain,
+        ))
+        Wakeup().notify()
+
+
+    def process_messages(self) -> None:
+        """Call the callbacks of the messages that were received since the last call."""
+        for _ in range(config.MQTT_MAX_MESSAGES_PER_TICK):
+            try:
+                message = self.inbox.popleft()
+            except IndexError:
+                return
+            self._handle_message(message)
+
+        if self.inbox:
+            logger.warning(f'{len(self.inbox)} MQTT messages are waiting, handling them next tick')
+            Wakeup().notify()
+
+
+    def _handle_message(self, message: Message) -> None:
+        self.latency.add(time.monotonic() - message.received)
+
+        # Retained messages are sent again whenever we (re)subscribe. Handling the same payload
+        # twice would only cost time. A live message is always handled, even if it repeats the last
+        # one: it may be a second button press.
+        if message.retain and self.last_payloads.get(message.topic) == message.payload:
+            self.duplicates += 1
+            return
+        self.last_payloads[message.topic] = message.payload
 
-        logger.debug(f'Got message on {message.topic}: {payload}')
+        topic = self._strip_topic(message.topic)
+        logger.debug(f'Got message on {message.topic}: {message.payload}')
 
-        for callback in callbacks:
-            callback(topic, payload)
+        for callback in self.routes.match(message.topic):
+            callback(topic, message.payload)
 
 
     def _prefix_topic(self, topic: str):
@@ -84,37 +282,64 @@ class MQTTClient(metaclass=util.Singleton):
             return topic
 
 
-    def publish(self, topic: str, *args, **kwargs):
-        topic = self._prefix_topic(topic)
-        self.client.publish(topic, *args, **kwargs)
+    def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False):
+        message = OutgoingMessage(self._prefix_topic(topic), payload, qos, retain)
+        if self.client.is_connected() and self._publish(message):
+            return
+
+        self.outbox.put(message)
+        # We may have reconnected after the check above, but before the message was in the outbox
+        if self.client.is_connected():
+            self._drain_outbox()
 
 
-    def subscribe(self, topic: str, callback: typing.Callable[[str, str], None]):
-        topic = f'{self.topic_prefix}/{topic}'
-        is_new_topic = topic not in self.callbacks
+    def _publish(self, message: OutgoingMessage) -> bool:
+        info = self.client.publish(message.topic, message.payload, message.qos, message.retain)
+        return info.rc == paho.mqtt.enums.MQTTErrorCode.MQTT_ERR_SUCCESS
 
-        if is_new_topic:
-            self.callbacks[topic] = []
 
-        self.callbacks[topic].append(callback)
+    def _drain_outbox(self) -> None:
+        messages = self.outbox.pop_all()
+        for i, message in enumerate(messages):
+            if not self._publish(message):
+                # We lost the connection again. Keep the rest for the next reconnect.
+                self.outbox.requeue(messages[i:])
+                return
+            self.outbox_drained += 1
 
-        if is_new_topic:
-            logger.debug(f'Subscribed to {topic}')
-            self.client.subscribe(topic)
+        if messages:
+            logger.info(f'Published {len(messages)} messages from the MQTT outbox')
 
 
-    def unsubscribe(self, topic, callback):
-        topic = f'{self.topic_prefix}/{topic}'
+    def subscribe(self, topic: str, callback: Callback, subscription: str | None = None):
+        """
+        Call `callback` for every message on `topic`, which may contain wildcards. By default, we
+        subscribe to `topic` at the broker. Several topics can share a single broker subscription
+        by passing the same wildcard `subscription`.
+        """
+        topic = self._prefix_topic(topic)
+        subscription = self._prefix_topic(subscription) if subscription else topic
+
+        self.routes.add(topic, callback)
+
+        if subscription not in self.subscriptions:
+            self.subscriptions[subscription] = 0
+            logger.debug(f'Subscribed to {subscription}')
+            self.client.subscribe(subscription)
+        self.subscriptions[subscription] += 1
+
+
+    def unsubscribe(self, topic: str, callback: Callback, subscription: str | None = None):
+        topic = self._prefix_topic(topic)
+        subscription = self._prefix_topic(subscription) if subscription else topic
 
-        if topic not in self.callbacks:
+        if subscription not in self.subscriptions:
             return
 
-        try:
-            self.callbacks[topic].remove(callback)
-        except ValueError:
-            pass
+        self.routes.remove(topic, callback)
 
-        if len(self.callbacks[topic]) == 0:
-            del self.callbacks[topic]
-            logger.debug(f'Unsubscribed from {topic}')
-            self.client.unsubscribe(topic)
+        self.subscriptions[subscription] -= 1
+        if self.subscriptions[subscription] == 0:
+            del self.subscriptions[subscription]
+            logger.debug(f'Unsubscribed from {subscription}')
+            self.client.unsubscribe(subscription)
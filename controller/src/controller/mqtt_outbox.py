@@ -0,0 +1,180 @@
+import atexit
+import itertools
+import json
+import logging
+import pathlib
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+from . import util
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutgoingMessage:
+    topic: str
+    payload: str
+    qos: int = 0
+    retain: bool = False
+
+
+class Outbox:
+    """
+    Holds the messages that were published while we were disconnected from the broker.
+
+    A retained message replaces the previous retained message on its topic: the broker would only
+    keep the latest one anyway, and our states are of no use once a newer one is known. Other
+    messages are all kept. When the outbox is full, the oldest message is dropped.
+
+    If a path is given, the outbox is stored there, so that it survives a restart. While we're
+    disconnected, a state is published every few seconds, so the outbox isn't saved on every change:
+    a background thread saves it `save_delay` after the first unsaved change, together with the
+    changes that followed. It is also saved on exit.
+    """
+
+    path: pathlib.Path | None
+    size: int
+    save_delay: float
+    # Retained messages are keyed by their topic, others by a sequence number. Dicts keep their
+    # insertion order, so the first message is the oldest one.
+    messages: dict[str | int, OutgoingMessage]
+    sequence: itertools.count
+    condition: threading.Condition
+    # Held while saving, so that an older snapshot can't overwrite a newer one
+    save_lock: threading.Lock
+    unsaved: bool = False
+    dropped: int = 0
+
+
+    def __init__(self, path: pathlib.Path | None, size: int, save_delay: timedelta):
+        self.path = path
+        self.size = size
+        self.save_delay = save_delay.total_seconds()
+        self.messages = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.save_lock = threading.Lock()
+        self._load()
+
+        if path is not None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+            atexit.register(self.save)
+
+
+    def __len__(self):
+        return len(self.messages)
+
+
+    def put(self, message: OutgoingMessage) -> None:
+        with self.condition:
+            self._put(message)
+            self._trim()
+            self._changed()
+
+
+    def requeue(self, messages: list[OutgoingMessage]) -> None:
+        """
+        Put back messages that couldn't be published, before the messages that were put in the
+        meantime. Retained messages that were replaced in the meantime are left out.
+        """
+        with self.condition:
+            newer = self.messages
+            self.messages = {}
+            for message in messages:
+                if not (message.retain and message.topic in newer):
+                    self._put(message)
+            self.messages.update(newer)
+            self._trim()
+            self._changed()
+
+
+    def pop_all(self) -> list[OutgoingMessage]:
+        with self.condition:
+            messages = list(self.messages.values())
+            self.messages = {}
+            if messages:
+                self._changed()
+            return messages
+
+
+    def save(self) -> None:
+        """Save the outbox right away, if it has unsaved changes."""
+        if self.path is None:
+            return
+
+        with self.save_lock:
+            with self.condition:
+                if not self.unsaved:
+                    return
+                self.unsaved = False
+                data = json.dumps([asdict(message) for message in self.messages.values()])
+
+            try:
+                util.atomic_write(self.path, data.encode())
+            except OSError as e:
+                logger.error(f'Could not write MQTT outbox {self.path}: {e}')
+
+
+    def _put(self, message: OutgoingMessage) -> None:
+        if message.retain:
+            # Move the topic to the end, it now holds the newest message
+            self.messages.pop(message.topic, None)
+            self.messages[message.topic] = message
+        else:
+            self.messages[next(self.sequence)] = message
+
+
+    def _trim(self) -> None:
+        while len(self.messages) > self.size:
+            del self.messages[next(iter(self.messages))]
+            self.dropped += 1
+
+
+    def _changed(self) -> None:
+        self.unsaved = True
+        self.condition.notify_all()
+
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.unsaved)
+            time.sleep(self.save_delay)
+            self.save()
+
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+
+        try:
+            data = json.loads(self.path.read_bytes())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f'Could not read MQTT outbox {self.path}: {e}')
+            return
+
+        if not isinstance(data, list):
+            logger.error(f'Ignoring invalid MQTT outbox {self.path}')
+            return
+
+        invalid = 0
+        for message_data in data[-self.size:]:
+            try:
+                message = OutgoingMessage(**message_data)
+                if not isinstance(message.topic, str) or not isinstance(message.payload, str):
+                    raise TypeError('Topic and payload must be strings')
+            except (TypeError, KeyError):
+                invalid += 1
+                continue
+            self._put(message)
+
+        if invalid:
+            logger.warning(f'Discarded {invalid} invalid messages from MQTT outbox {self.path}')
+        if self.messages:
+            logger.info(f'Loaded {len(self.messages)} unsent MQTT messages')
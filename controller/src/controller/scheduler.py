@@ -0,0 +1,73 @@
+import heapq
+import time
+from datetime import timedelta
+
+from . import util
+
+
+class Scheduler(metaclass=util.Singleton):
+    """
+    Keeps track of when the periodic duties of the different components are due.
+
+    Deadlines are identified by name, and are expressed on the monotonic clock, so they are not
+    affected when NTP corrects the system clock. The clock is read once per tick, in `tick()`:
+    all checks during a tick compare against that same moment.
+    """
+
+    now: float
+    deadlines: dict[str, float]
+    # A heap of (deadline, name) tuples. Entries that have been rescheduled or cancelled are left
+    # in the heap, and skipped when they reach the top.
+    heap: list[tuple[float, str]]
+
+    def __init__(self):
+        self.now = time.monotonic()
+        self.deadlines = {}
+        self.heap = []
+
+
+    def tick(self) -> None:
+        self.now = time.monotonic()
+
+
+    def schedule(self, name: str, delay: timedelta) -> None:
+        self.schedule_at(name, self.now + delay.total_seconds())
+
+    def schedule_at(self, name: str, deadline: float) -> None:
+        if self.deadlines.get(name) == deadline:
+            return
+
+        self.deadlines[name] = deadline
+        heapq.heappush(self.heap, (deadline, name))
+
+        if len(self.heap) > 2 * len(self.deadlines) + 16:
+            self.heap = [(deadline, name) for name, deadline in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+
+    def cancel(self, name: str) -> None:
+        self.deadlines.pop(name, None)
+
+
+    def is_due(self, name: str) -> bool:
+        deadline = self.deadlines.get(name)
+        return deadline is not None and deadline <= self.now
+
+    def is_pending(self, name: str) -> bool:
+        deadline = self.deadlines.get(name)
+        return deadline is not None and deadline > self.now
+
+
+    def get_next_deadline(self) -> float | None:
+        """
+        Return the first deadline that is still in the future. Deadlines in the past are either
+        handled already, or are waiting for something else (e.g. a verification waiting for the
+        current movement to end), so they don't need to wake us up.
+        """
+        while self.heap:
+            deadline, name = self.heap[0]
+            if self.deadlines.get(name) == deadline and deadline > self.now:
+                return deadline
+            heapq.heappop(self.heap)
+
+        return None
@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import pathlib
+
+from . import util
+
+logger = logging.getLogger(__name__)
+
+
+class StateJournal:
+    """
+    A crash-safe, append-only journal of a piece of state.
+
+    Every change is appended as a single JSON line, which is cheap on an SD card. When loading,
+    the last complete line wins: a line that was cut short by a power cut is ignored. Once the
+    journal holds `compact_after` records, it is atomically rewritten with only the latest one.
+    """
+
+    path: pathlib.Path
+    compact_after: int
+    records: int = 0
+    last_record: str | None = None
+
+
+    def __init__(self, path: pathlib.Path, compact_after: int):
+        self.path = path
+        self.compact_after = compact_after
+
+
+    def load(self) -> dict | None:
+        try:
+            lines = self.path.read_bytes().splitlines()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f'Could not read state journal {self.path}: {e}')
+            return None
+
+        self.records = len(lines)
+        for line in reversed(lines):
+            try:
+                state = json.loads(line)
+            except ValueError:
+                continue
+
+            self.last_record = line.decode()
+            return state
+
+        return None
+
+
+    def append(self, state: dict) -> None:
+        record = json.dumps(state, cls=util.JSONEncoder)
+        if record == self.last_record:
+            return
+        self.last_record = record
+
+        data = (record + '\n').encode()
+        try:
+            if self.records >= self.compact_after:
+                util.atomic_write(self.path, data)
+                self.records = 1
+            else:
+                with open(self.path, 'ab') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                self.records += 1
+        except OSError as e:
+            logger.error(f'Could not write state journal {self.path}: {e}')
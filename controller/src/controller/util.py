@@ -1,14 +1,26 @@
 import collections.abc
 import enum
 import json
+import os
+import pathlib
 from dataclasses import dataclass
 from datetime import datetime
 
 
 class Mode(enum.Enum):
     GPIO = enum.auto()
+    GPIO_REGISTERS = enum.auto()
     KEYBOARD = enum.auto()
     MQTT = enum.auto()
+    # No hardware: inputs are pushed by tests and simulations, outputs are only recorded
+    FAKE = enum.auto()
+
+
+class LoopMode(enum.Enum):
+    # Run a full tick every TICK_INTERVAL
+    TICK = enum.auto()
+    # Sleep until an input changes, an MQTT message arrives or the next deadline expires
+    EVENT = enum.auto()
 
 
 class Orientation(enum.Enum):
@@ -49,7 +61,7 @@ class Movement(metaclass=MovementMetaclass):
     direction: Direction
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash((self.orientation, self.direction))
 
     def __eq__(self, other):
         return self.orientation == other.orientation and self.direction == other.direction
@@ -101,3 +113,23 @@ def datetime_or_none(dt: datetime):
         return None
     else:
         return dt
+
+
+def atomic_write(path: pathlib.Path, data: bytes):
+    """
+    Write a file so that, even after a power cut, it contains either the old or the new data, but
+    never a mix of both.
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+    # Make sure the rename itself is persisted
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
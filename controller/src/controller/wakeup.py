@@ -0,0 +1,44 @@
+import selectors
+import socket
+
+from . import util
+
+
+class Wakeup(metaclass=util.Singleton):
+    """
+    Lets other threads wake up the main loop before its next deadline.
+
+    We use a socketpair instead of a threading.Event: writing a byte to a non-blocking socket
+    doesn't take any locks, so notify() is also safe to call from a signal handler.
+    """
+
+    selector: selectors.BaseSelector
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self._reader, selectors.EVENT_READ)
+
+
+    def notify(self) -> None:
+        try:
+            self._writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # The buffer is full, so a wakeup is already pending
+            pass
+
+
+    def wait(self, timeout: float | None) -> None:
+        self.selector.select(timeout)
+        self._drain()
+
+
+    def _drain(self) -> None:
+        try:
+            while self._reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
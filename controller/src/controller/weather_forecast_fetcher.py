@@ -1,16 +1,22 @@
 import dataclasses
 import logging
+import threading
+import time
+import typing
 from datetime import datetime, timedelta
 
+import numpy as np
 import openmeteo_requests
 from openmeteo_sdk.VariablesWithTime import VariablesWithTime
 
-from . import config
+from . import config, forecast_cache
+from .scheduler import Scheduler
+from .wakeup import Wakeup
 
 logger = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class WeatherForecast:
     timestamp: datetime
     temperature: float
@@ -19,98 +25,292 @@ class WeatherForecast:
     solar_radiation: float
 
 
+@dataclasses.dataclass(frozen=True)
+class ForecastTable:
+    """A forecast in columnar form: one read-only array per variable, all indexed by time."""
+
+    # Unix timestamps, in seconds
+    timestamps: np.ndarray
+    temperature: np.ndarray
+    wind_gust: np.ndarray
+    rain_event: np.ndarray
+    solar_radiation: np.ndarray
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class _Row(typing.NamedTuple):
+    """A single row of a ForecastTable, converted to plain floats."""
+    timestamp: float
+    temperature: float
+    wind_gust: float
+    rain_event: float
+    solar_radiation: float
+
+
+class ForecastInterpolator:
+    """
+    Interpolates a ForecastTable at arbitrary timestamps.
+
+    Forecasts have a fixed interval, so the rows around a timestamp can be looked up directly. If
+    the interval turns out not to be fixed, we fall back to a binary search. The rows around the
+    last lookup are cached, since consecutive ticks almost always fall in the same bucket.
+    """
+
+    table: ForecastTable
+    start: float
+    interval: float | None
+
+    bucket: int | None = None
+    prev_row: _Row
+    next_row: _Row
+
+
+    def __init__(self, table: ForecastTable):
+        self.table = table
+        self.start = float(table.timestamps[0]) if len(table) else 0
+
+        intervals = np.diff(table.timestamps)
+        if len(intervals) and np.all(intervals == intervals[0]):
+            self.interval = float(intervals[0])
+        else:
+            self.interval = None
+
+
+    def at(self, timestamp: datetime) -> WeatherForecast | None:
+        """Interpolate the forecast at a single timestamp. Return None outside of the forecast."""
+
+        seconds = timestamp.timestamp()
+        bucket = self._get_bucket(seconds)
+        if bucket < 0 or bucket >= len(self.table) - 1:
+            return None
+
+        if bucket != self.bucket:
+            self.bucket = bucket
+            self.prev_row = self._get_row(bucket)
+            self.next_row = self._get_row(bucket + 1)
+
+        prev_row = self.prev_row
+        next_row = self.next_row
+        next_factor = (seconds - prev_row.timestamp) / (next_row.timestamp - prev_row.timestamp)
+        prev_factor = 1 - next_factor
+
+        return WeatherForecast(
+            timestamp=timestamp,
+            temperature=prev_row.temperature * prev_factor + next_row.temperature * next_factor,
+            wind_gust=max(prev_row.wind_gust, next_row.wind_gust),
+            rain_event=next_row.rain_event,
+            solar_radiation=(
+                prev_row.solar_radiation * prev_factor
+                + next_row.solar_radiation * next_factor
+            ),
+        )
+
+
+    def at_many(self, timestamps: np.ndarray) -> ForecastTable:
+        """
+        Interpolate the forecast at an array of Unix timestamps in one go. Timestamps outside of
+        the forecast get NaN values.
+        """
+
+        table = self.table
+        if len(table) < 2:
+            nan = np.full(len(timestamps), np.nan)
+            return ForecastTable(timestamps, nan, nan, nan, nan)
+
+        if self.interval is not None:
+            buckets = np.floor((timestamps - self.start) / self.interval).astype(np.int64)
+        else:
+            buckets = np.searchsorted(table.timestamps, timestamps, side='right') - 1
+        valid = (buckets >= 0) & (buckets < len(table) - 1)
+
+        prev_index = np.clip(buckets, 0, len(table) - 2)
+        next_index = prev_index + 1
+        next_factor = (
+            (timestamps - table.timestamps[prev_index])
+            / (table.timestamps[next_index] - table.timestamps[prev_index])
+        )
+        prev_factor = 1 - next_factor
+
+        columns = {
+            'temperature': (
+                table.temperature[prev_index] * prev_factor
+                + table.temperature[next_index] * next_factor
+            ),
+            'wind_gust': np.maximum(table.wind_gust[prev_index], table.wind_gust[next_index]),
+            'rain_event': table.rain_event[next_index],
+            'solar_radiation': (
+                table.solar_radiation[prev_index] * prev_factor
+                + table.solar_radiation[next_index] * next_factor
+            ),
+        }
+        for column in columns.values():
+            column[~valid] = np.nan
+
+        return ForecastTable(timestamps=timestamps, **columns)
+
+
+    def _get_bucket(self, seconds: float) -> int:
+        """Return the index of the last row at or before the given timestamp."""
+        if self.interval is not None:
+            return int((seconds - self.start) // self.interval)
+        else:
+            return int(np.searchsorted(self.table.timestamps, seconds, side='right')) - 1
+
+
+    def _get_row(self, index: int) -> _Row:
+        table = self.table
+        return _Row(
+            timestamp=float(table.timestamps[index]),
+            temperature=float(table.temperature[index]),
+            wind_gust=float(table.wind_gust[index]),
+            rain_event=float(table.rain_event[index]),
+            solar_radiation=float(table.solar_radiation[index]),
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class ForecastSnapshot:
+    table: ForecastTable
+    # The time of the fetch on the monotonic clock
+    fetched: float
+
+
 class WeatherForecastFetcher:
     url = 'https://api.open-meteo.com/v1/forecast'
+    # Maps Open-Meteo variables to the ForecastTable column they are stored in
+    columns = {
+        'temperature_2m': 'temperature',
+        'wind_gusts_10m': 'wind_gust',
+        'precipitation': 'rain_event',
+        'shortwave_radiation': 'solar_radiation',
+    }
     params = {
         'latitude': 51.052,
         'longitude': 3.743,
-        'hourly': ['temperature_2m', 'wind_gusts_10m', 'precipitation', 'shortwave_radiation'],
+        'hourly': list(columns),
         'timezone': 'Europe/Brussels',
         'forecast_days': 2,
     }
 
-    forecasts: list[WeatherForecast] = []
-    last_fetch: datetime | None = None
+    scheduler: Scheduler
+    client: openmeteo_requests.Client
+    # The fetch thread replaces the snapshot as a whole, so the control loop can read it without
+    # locking.
+    snapshot: ForecastSnapshot | None = None
+    # The snapshot that is currently used by the control loop, and its interpolator
+    current_snapshot: ForecastSnapshot | None = None
+    interpolator: ForecastInterpolator | None = None
+
+
+    def __init__(self):
+        self.scheduler = Scheduler()
+        # Reuse the same client (and its connection pool) for every fetch
+        self.client = openmeteo_requests.Client()
+
+        self._load_cache()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
 
 
     def get_forecast(self):
-        self._update_forecast()
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
 
-        if (
-            self.last_fetch is not None
-            and datetime.now() - self.last_fetch < config.WEATHER_FORECAST_VALIDITY
-        ):
-            return self._interpolate(self.forecasts, datetime.now())
+        age = self.scheduler.now - snapshot.fetched
+        if snapshot is not self.current_snapshot:
+            self.current_snapshot = snapshot
+            self.interpolator = ForecastInterpolator(snapshot.table)
+            self.scheduler.schedule(
+                'forecast_expiry',
+                config.WEATHER_FORECAST_VALIDITY - timedelta(seconds=age),
+            )
+
+        if age < config.WEATHER_FORECAST_VALIDITY.total_seconds():
+            assert self.interpolator is not None
+            return self.interpolator.at(datetime.now())
         else:
             return None
 
 
-    def _update_forecast(self):
-        if (
-            self.last_fetch is not None
-            and datetime.now() - self.last_fetch < .5 * config.WEATHER_FORECAST_VALIDITY
-        ):
+    def _run(self):
+        # If we loaded a recent forecast from the cache, we don't need to refresh it right away
+        if self.snapshot is not None:
+            age = time.monotonic() - self.snapshot.fetched
+            time.sleep(max(config.WEATHER_FORECAST_REFRESH_INTERVAL.total_seconds() - age, 0))
+
+        while True:
+            table = self._fetch_forecast()
+            if table is not None:
+                self.snapshot = ForecastSnapshot(table, time.monotonic())
+                Wakeup().notify()
+                self._save_cache(table)
+                interval = config.WEATHER_FORECAST_REFRESH_INTERVAL
+            else:
+                interval = config.WEATHER_FORECAST_RETRY_INTERVAL
+
+            time.sleep(interval.total_seconds())
+
+
+    def _load_cache(self):
+        cached = forecast_cache.load(config.WEATHER_FORECAST_CACHE_PATH)
+        if cached is None:
+            return
+
+        columns, fetched = cached
+        # The fetch time is stored as a Unix timestamp, so we have to rely on the wall clock here
+        age = time.time() - fetched
+        if not 0 <= age < config.WEATHER_FORECAST_VALIDITY.total_seconds():
+            logger.info(f'Ignoring cached weather forecast from {datetime.fromtimestamp(fetched)}')
             return
 
-        forecasts = self._fetch_forecast()
-        if forecasts is not None:
-            self.forecasts = forecasts
-            self.last_fetch = datetime.now()
+        logger.info(f'Loaded cached weather forecast from {datetime.fromtimestamp(fetched)}')
+        self.snapshot = ForecastSnapshot(ForecastTable(**columns), time.monotonic() - age)
+
+
+    def _save_cache(self, table: ForecastTable):
+        columns = {field.name: getattr(table, field.name) for field in dataclasses.fields(table)}
+        try:
+            forecast_cache.save(config.WEATHER_FORECAST_CACHE_PATH, columns, time.time())
+        except OSError as e:
+            logger.error(f'Could not write forecast cache: {e}')
 
 
     def _fetch_forecast(self):
         logger.info('Fetch weather forecast')
 
         try:
-            openmeteo = openmeteo_requests.Client()
-            responses = openmeteo.weather_api(self.url, params=self.params)
+            responses = self.client.weather_api(
+                self.url,
+                params=self.params,
+                timeout=config.WEATHER_FORECAST_TIMEOUT.total_seconds(),
+            )
             response = responses[0]
             hourly = response.Hourly()
 
             if hourly is None:
                 return
 
-            reports = self._parse_forecast(hourly)
-            return reports
+            return self._parse_forecast(hourly)
         except Exception as e:
             logger.exception(e)
 
 
-    def _parse_forecast(self, hourly: VariablesWithTime):
-        reports: list[WeatherForecast] = []
-        start = datetime.fromtimestamp(hourly.Time())
-        end = datetime.fromtimestamp(hourly.TimeEnd())
-        interval = timedelta(seconds=hourly.Interval())
-        for i in range(int((end - start) / interval) - 1):
-            temperature = hourly.Variables(self.params['hourly'].index('temperature_2m')).Values(i)  # type: ignore
-            wind_gust = hourly.Variables(self.params['hourly'].index('wind_gusts_10m')).Values(i)   # type: ignore
-            precipitation = hourly.Variables(self.params['hourly'].index('precipitation')).Values(i)  # type: ignore
-            shortwave_radiation = hourly.Variables(self.params['hourly'].index('shortwave_radiation')).Values(i)  # type: ignore
-
-            report = WeatherForecast(
-                timestamp=start + i * interval,
-                temperature=temperature,
-                wind_gust=wind_gust,
-                rain_event=precipitation,
-                solar_radiation=shortwave_radiation,
-            )
-            reports.append(report)
-
-        return reports
+    def _parse_forecast(self, hourly: VariablesWithTime) -> ForecastTable:
+        timestamps = np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype=np.float64)
 
+        # The variables in the response are in the same order as in the request
+        columns = {}
+        for i, variable in enumerate(self.params['hourly']):
+            values = hourly.Variables(i).ValuesAsNumpy()  # type: ignore
+            # Copy the values out of the response buffer, so it can be garbage collected
+            columns[self.columns[variable]] = values[:len(timestamps)].astype(np.float64)
 
-    def _interpolate(self, reports: list[WeatherForecast], timestamp: datetime):
-        prev_report = next(report for report in reports[::-1] if report.timestamp <= timestamp)
-        next_report = next(report for report in reports if report.timestamp > timestamp)
+        for column in (timestamps, *columns.values()):
+            column.flags.writeable = False
 
-        prev_factor = 1 - (timestamp - prev_report.timestamp).total_seconds() / 3600
-        next_factor = 1 - prev_factor
+        return ForecastTable(timestamps=timestamps, **columns)
 
-        report = WeatherForecast(
-            timestamp=timestamp,
-            temperature=prev_report.temperature * prev_factor + next_report.temperature * next_factor,
-            wind_gust=max(prev_report.wind_gust, next_report.wind_gust),
-            rain_event=next_report.rain_event,
-            solar_radiation=prev_report.solar_radiation * prev_factor + next_report.solar_radiation * next_factor,
-        )
-        return report
@@ -26,6 +26,7 @@ class WeatherReport:
     outdoor_data_source: Datasource = Datasource.NONE
     outdoor_temperature: float | None = None
     outdoor_wind_gust: float | None = None
+    outdoor_wind_gust_max: float | None = None
     outdoor_rain_event: float | None = None
     outdoor_solar_radiation: float | None = None
 
@@ -41,6 +42,7 @@ class WeatherReport:
             self.outdoor_data_source = Datasource.WEATHERSTATION
             self.outdoor_temperature = station_report.outdoor_temperature
             self.outdoor_wind_gust = station_report.outdoor_wind_gust
+            self.outdoor_wind_gust_max = station_report.outdoor_wind_gust_max
             self.outdoor_rain_event = station_report.outdoor_rain_event
             self.outdoor_solar_radiation = station_report.outdoor_solar_radiation
 
@@ -52,6 +54,7 @@ class WeatherReport:
         self.outdoor_data_source = Datasource.FORECAST
         self.outdoor_temperature = forecast.temperature
         self.outdoor_wind_gust = forecast.wind_gust
+        self.outdoor_wind_gust_max = forecast.wind_gust
         self.outdoor_rain_event = forecast.rain_event
         self.outdoor_solar_radiation = forecast.solar_radiation
 
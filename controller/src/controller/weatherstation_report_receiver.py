@@ -4,6 +4,7 @@ from datetime import datetime
 
 from . import config
 from .mqtt_client import MQTTClient
+from .scheduler import Scheduler
 
 
 @dataclasses.dataclass
@@ -12,6 +13,7 @@ class WeatherstationReport:
     indoor_temperature: float | None  # ˚C
     outdoor_temperature: float | None  # ˚C
     outdoor_wind_gust: float | None  # km/h
+    outdoor_wind_gust_max: float | None  # km/h, the maximum of the past few minutes
     outdoor_rain_event: float | None  # mm in the past hour
     outdoor_solar_radiation: float | None  # W/m²
 
@@ -19,6 +21,8 @@ class WeatherstationReport:
 class WeatherstationReportReceiver:
     mqtt_client: MQTTClient
     report: WeatherstationReport | None = None
+    # The report for which we have scheduled an expiry timer
+    scheduled_report: WeatherstationReport | None = None
     startup_time: datetime = datetime.now()
 
     def __init__(self):
@@ -27,8 +31,19 @@ class WeatherstationReportReceiver:
 
 
     def get_report(self):
-        if self.report and datetime.now() - self.report.timestamp < config.WEATHER_REPORT_VALIDITY:
-            return self.report
+        report = self.report
+        if report is None:
+            return None
+
+        # The validity of a report depends on its own timestamp, so we can't avoid the wall clock
+        # here. We do make sure the main loop wakes up when the report expires.
+        age = datetime.now() - report.timestamp
+        if report is not self.scheduled_report:
+            self.scheduled_report = report
+            Scheduler().schedule('weather_report_expiry', config.WEATHER_REPORT_VALIDITY - age)
+
+        if age < config.WEATHER_REPORT_VALIDITY:
+            return report
         else:
             return None
 
@@ -41,6 +56,7 @@ class WeatherstationReportReceiver:
             indoor_temperature=message.get('indoor_temperature'),
             outdoor_temperature=message.get('outdoor_temperature'),
             outdoor_wind_gust=message.get('outdoor_wind_gust'),
+            outdoor_wind_gust_max=message.get('outdoor_wind_gust_max'),
             outdoor_rain_event=message.get('outdoor_rain_event'),
             outdoor_solar_radiation=message.get('outdoor_solar_radiation'),
         )
@@ -0,0 +1,49 @@
+import pathlib
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src'))
+
+from controller import config, util  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """Run every test without hardware, network or persistent state, and with fresh singletons."""
+    monkeypatch.setattr(config, 'MODE', util.Mode.FAKE)
+    monkeypatch.setattr(config, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(config, 'ROOF_STATE_JOURNAL_PATH', tmp_path / 'roof_state.jsonl')
+    monkeypatch.setattr(config, 'MQTT_OUTBOX_PATH', tmp_path / 'mqtt_outbox.json')
+    monkeypatch.setattr(config, 'WEATHER_FORECAST_CACHE_PATH', tmp_path / 'forecast.bin')
+    monkeypatch.setattr(config, 'SEND_HEALTHCHECKS', False)
+    # Nothing listens on port 9, so the MQTT client just keeps on trying to connect in the background
+    monkeypatch.setattr(config, 'MQTT_HOST', '127.0.0.1')
+    monkeypatch.setattr(config, 'MQTT_PORT', 9)
+    monkeypatch.setattr(util.Singleton, '_instances', {})
+
+
+class FakeClock:
+    """Replaces time.monotonic() and time.time(), so tests can let time pass instantly."""
+
+    def __init__(self):
+        self.now = 1000.
+        self.offset = time.time() - self.now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now + self.offset
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(time, 'time', clock.time)
+    return clock
@@ -0,0 +1,259 @@
+"""
+A minimal MQTT 3.1.1 broker that runs in the test process, so the MQTT client can be tested against a
+real connection that can be cut and restored at will.
+
+It knows just enough of the protocol for the controller: CONNECT, SUBSCRIBE, UNSUBSCRIBE, PUBLISH
+with QoS 0 and 1, retained messages, PINGREQ and DISCONNECT. Messages are always forwarded with QoS
+0, and a restarted broker has forgotten all its subscriptions and retained messages, just like a
+broker without persistence.
+"""
+
+import socket
+import struct
+import threading
+from dataclasses import dataclass
+
+import paho.mqtt.client
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+@dataclass
+class PublishedMessage:
+    topic: str
+    payload: bytes
+    qos: int
+    retain: bool
+
+
+def encode_packet(packet_type: int, body: bytes, flags: int = 0) -> bytes:
+    header = bytearray([packet_type << 4 | flags])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack('!H', len(data)) + data
+
+
+def decode_string(data: bytes, offset: int) -> tuple[str, int]:
+    length, = struct.unpack_from('!H', data, offset)
+    offset += 2
+    return data[offset:offset + length].decode(), offset + length
+
+
+class Connection:
+    def __init__(self, broker: 'MQTTBroker', sock: socket.socket):
+        self.broker = broker
+        self.socket = sock
+        self.subscriptions = set()
+        self.send_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def send(self, packet: bytes) -> None:
+        with self.send_lock:
+            try:
+                self.socket.sendall(packet)
+            except OSError:
+                pass
+
+
+    def send_publish(self, message: PublishedMessage) -> None:
+        self.send(encode_packet(
+            PUBLISH,
+            encode_string(message.topic) + message.payload,
+            flags=int(message.retain),
+        ))
+
+
+    def close(self) -> None:
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('Connection closed')
+            data += chunk
+        return data
+
+
+    def _read_packet(self) -> tuple[int, int, bytes]:
+        first, = self._read_exactly(1)
+        length = 0
+        multiplier = 1
+        while True:
+            byte, = self._read_exactly(1)
+            length += (byte & 0x7f) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0f, self._read_exactly(length)
+
+
+    def _run(self) -> None:
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if packet_type == DISCONNECT:
+                    break
+                self._handle(packet_type, flags, body)
+        except OSError:
+            pass
+        finally:
+            self.broker.remove_connection(self)
+            self.close()
+
+
+    def _handle(self, packet_type: int, flags: int, body: bytes) -> None:
+        if packet_type == CONNECT:
+            self.send(encode_packet(CONNACK, b'\x00\x00'))
+
+        elif packet_type == PUBLISH:
+            qos = flags >> 1 & 0x03
+            topic, offset = decode_string(body, 0)
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+            self.broker.publish(PublishedMessage(topic, body[offset:], qos, bool(flags & 0x01)))
+            if qos:
+                self.send(encode_packet(PUBACK, packet_id))
+
+        elif packet_type == SUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            topic_filters = []
+            while offset < len(body):
+                topic_filter, offset = decode_string(body, offset)
+                offset += 1
+                topic_filters.append(topic_filter)
+            self.subscriptions.update(topic_filters)
+            self.send(encode_packet(SUBACK, packet_id + bytes(len(topic_filters))))
+            for message in self.broker.get_retained(topic_filters):
+                self.send_publish(message)
+
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = decode_string(body, offset)
+                self.subscriptions.discard(topic_filter)
+            self.send(encode_packet(UNSUBACK, packet_id))
+
+        elif packet_type == PINGREQ:
+            self.send(encode_packet(PINGRESP, b''))
+
+
+    def matches(self, topic: str) -> bool:
+        return any(
+            paho.mqtt.client.topic_matches_sub(subscription, topic)
+            for subscription in self.subscriptions
+        )
+
+
+class MQTTBroker:
+    """
+    Listens on 127.0.0.1. The first start picks a free port; a restart listens on the same port, so
+    clients can reconnect.
+    """
+
+    port: int = 0
+    # Every message that was published to the broker, including the ones with QoS 0
+    published: list[PublishedMessage]
+
+
+    def __init__(self):
+        self.published = []
+        self.lock = threading.Lock()
+        self.server = None
+
+
+    def start(self) -> None:
+        self.connections = []
+        self.retained = {}
+        self.server = socket.create_server(('127.0.0.1', self.port))
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._accept, args=(self.server,), daemon=True)
+        self.thread.start()
+
+
+    def stop(self) -> None:
+        """Stop listening and drop every connection."""
+        if self.server is None:
+            return
+        # Closing alone doesn't wake up the thread in accept(), which keeps the port in use
+        self.server.shutdown(socket.SHUT_RDWR)
+        self.server.close()
+        self.server = None
+        with self.lock:
+            connections = list(self.connections)
+            self.connections = []
+        for connection in connections:
+            connection.close()
+
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+
+    def publish(self, message: PublishedMessage) -> None:
+        with self.lock:
+            self.published.append(message)
+            if message.retain:
+                if message.payload:
+                    self.retained[message.topic] = message
+                else:
+                    self.retained.pop(message.topic, None)
+            connections = [c for c in self.connections if c.matches(message.topic)]
+
+        for connection in connections:
+            connection.send_publish(PublishedMessage(message.topic, message.payload, 0, False))
+
+
+    def get_retained(self, topic_filters: list[str]) -> list[PublishedMessage]:
+        with self.lock:
+            return [
+                message for topic, message in self.retained.items()
+                if any(paho.mqtt.client.topic_matches_sub(f, topic) for f in topic_filters)
+            ]
+
+
+    def remove_connection(self, connection: Connection) -> None:
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+
+
+    def _accept(self, server: socket.socket) -> None:
+        while True:
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections.append(Connection(self, sock))
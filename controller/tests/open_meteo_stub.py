@@ -0,0 +1,144 @@
+"""
+A local stand-in for the Open-Meteo API, which serves canned forecasts in the same flatbuffers
+format, so the forecast fetcher can be tested offline.
+"""
+
+from __future__ import annotations
+
+import http.server
+import threading
+import time
+import urllib.parse
+
+import flatbuffers
+import numpy as np
+from openmeteo_sdk.Unit import Unit
+from openmeteo_sdk.Variable import Variable
+
+# The variable, unit and altitude of each variable that the fetcher requests
+VARIABLES = {
+    'temperature_2m': (Variable.temperature, Unit.celsius, 2),
+    'wind_gusts_10m': (Variable.wind_gusts, Unit.kilometres_per_hour, 10),
+    'precipitation': (Variable.precipitation, Unit.millimetre, 0),
+    'shortwave_radiation': (Variable.shortwave_radiation, Unit.watt_per_square_metre, 0),
+}
+
+
+def build_response(
+    start: int,
+    interval: int,
+    columns: dict[str, np.ndarray],
+    section: str = 'hourly',
+) -> bytes:
+    """
+    Build a response with a single location, with `columns` (Open-Meteo variable name: values) at
+    `interval` seconds from `start`, in the `hourly` or `minutely_15` section. The SDK has no
+    builders, so the tables are built by the slots of their fields.
+    """
+    builder = flatbuffers.Builder(1024)
+
+    variables = []
+    for name, values in columns.items():
+        variable, unit, altitude = VARIABLES[name]
+        values_vector = builder.CreateNumpyVector(np.asarray(values, dtype=np.float32))
+        builder.StartObject(13)
+        builder.PrependUint8Slot(0, variable, 0)
+        builder.PrependUint8Slot(1, unit, 0)
+        builder.PrependUOffsetTRelativeSlot(3, values_vector, 0)
+        builder.PrependInt16Slot(5, altitude, 0)
+        variables.append(builder.EndObject())
+
+    builder.StartVector(4, len(variables), 4)
+    for variable in reversed(variables):
+        builder.PrependUOffsetTRelative(variable)
+    variables_vector = builder.EndVector()
+
+    length = len(next(iter(columns.values())))
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + length * interval, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variables_vector, 0)
+    variables_with_time = builder.EndObject()
+
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, 51.052, 0)
+    builder.PrependFloat32Slot(1, 3.743, 0)
+    builder.PrependUOffsetTRelativeSlot(
+        {'hourly': 11, 'minutely_15': 12}[section],
+        variables_with_time,
+        0,
+    )
+    builder.Finish(builder.EndObject())
+
+    # Every message is prefixed with its length
+    message = builder.Output()
+    return len(message).to_bytes(4, 'little') + bytes(message)
+
+
+def build_forecast(start: int, count: int, interval: int = 3600) -> dict[str, np.ndarray]:
+    """
+    `count` values every `interval` seconds of days with a temperature between 10 and 20˚C, some
+    gusts of wind, and a shower at noon.
+    """
+    timestamps = start + interval * np.arange(count)
+    hour = (timestamps % 86400) / 3600
+    return {
+        'temperature_2m': 15 - 5 * np.cos(2 * np.pi * hour / 24),
+        'wind_gusts_10m': 20 + 10 * np.sin(2 * np.pi * hour / 6),
+        'precipitation': np.where((hour >= 12) & (hour < 13), 1.5, 0),
+        'shortwave_radiation': np.maximum(0, 600 * np.sin(2 * np.pi * (hour - 6) / 24)),
+    }
+
+
+class OpenMeteoStub:
+    """
+    Serves `response` on every request, after waiting `delay` seconds, or fails with `status` if it
+    is set. Every request is recorded with its time on the monotonic clock and its parameters.
+    """
+
+    response: bytes
+    delay: float = 0
+    status: int | None = None
+    requests: list[tuple[float, dict[str, list[str]]]]
+
+
+    def __init__(self, response: bytes):
+        self.response = response
+        self.requests = []
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((
+                    time.monotonic(),
+                    urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query),
+                ))
+                time.sleep(stub.delay)
+                if stub.status is not None:
+                    self.send_error(stub.status)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(stub.response)))
+                self.end_headers()
+                self.wfile.write(stub.response)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1/forecast'
+
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,91 @@
+"""
+Runs the Controller against replayed weather reports, with the fake motor IO and a fake clock, so
+hours of operation take a fraction of a second.
+"""
+
+from datetime import datetime, timedelta
+
+from controller import controller as controller_module
+from controller.controller import Controller
+from controller.scheduler import Scheduler
+from controller.weather_monitor import Datasource, WeatherReport
+
+
+class ReplayWeatherMonitor:
+    """Serves the report that was set last, as if it came from the weather station."""
+
+    report: WeatherReport
+
+
+    def __init__(self):
+        self.report = WeatherReport()
+
+
+    def set_report(
+        self,
+        timestamp: datetime,
+        indoor_temperature: float,
+        outdoor_temperature: float = 15,
+        wind_gust: float = 0,
+        rain_event: float = 0,
+    ) -> None:
+        report = WeatherReport()
+        report.timestamp = timestamp
+        report.indoor_data_source = Datasource.WEATHERSTATION
+        report.indoor_temperature = indoor_temperature
+        report.outdoor_data_source = Datasource.WEATHERSTATION
+        report.outdoor_temperature = outdoor_temperature
+        report.outdoor_wind_gust = wind_gust
+        report.outdoor_wind_gust_max = wind_gust
+        report.outdoor_rain_event = rain_event
+        report.outdoor_solar_radiation = 0
+        self.report = report
+
+
+    def get_report(self) -> WeatherReport:
+        return self.report
+
+
+class Simulation:
+    def __init__(self, clock, monkeypatch):
+        self.clock = clock
+        self.start = datetime.now()
+        self.weather_monitor = ReplayWeatherMonitor()
+        monkeypatch.setattr(controller_module, 'WeatherMonitor', lambda: self.weather_monitor)
+        self.controller = Controller()
+        self.motor_controller = self.controller.motor_controller
+        self.movement_planner = self.controller.movement_planner
+        self.scheduler = Scheduler()
+
+
+    @property
+    def elapsed(self) -> float:
+        return self.clock.now - self.start_clock
+
+    @property
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+
+    def report(self, indoor_temperature: float, **kwargs) -> None:
+        self.weather_monitor.set_report(self.now, indoor_temperature, **kwargs)
+
+
+    def run(self, seconds: float, step: float = 1, on_tick=None) -> None:
+        for _ in range(int(seconds / step)):
+            self.clock.advance(step)
+            self.controller.tick()
+            if on_tick:
+                on_tick()
+
+
+    def shutdown(self) -> None:
+        self.motor_controller.shutdown()
+
+
+    def __enter__(self):
+        self.start_clock = self.clock.now
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
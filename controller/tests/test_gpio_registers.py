@@ -0,0 +1,115 @@
+import struct
+import time
+from datetime import timedelta
+
+import pytest
+
+from controller import util
+from controller.motor_io.gpio import GPIO
+from controller.motor_io.gpio_registers import MMapRegisters, RegisterGPIO
+
+NORTH_OPEN = util.Movement(util.Orientation.NORTH, util.Direction.OPEN)
+NORTH_CLOSE = util.Movement(util.Orientation.NORTH, util.Direction.CLOSE)
+SOUTH_OPEN = util.Movement(util.Orientation.SOUTH, util.Direction.OPEN)
+SOUTH_CLOSE = util.Movement(util.Orientation.SOUTH, util.Direction.CLOSE)
+
+# Pin numbers map to GPIO numbers 32 * port + bit
+PINS = {
+    # Inputs on PA, outputs on PB
+    1: 32 * 0 + 3,
+    2: 32 * 1 + 4,
+    3: 32 * 0 + 5,
+    4: 32 * 1 + 5,
+    # The south roof has its outputs on PL, in the second register block
+    5: 32 * 0 + 20,
+    6: 32 * 11 + 0,
+    7: 32 * 0 + 31,
+    8: 32 * 11 + 31,
+}
+CONFIG = {
+    NORTH_OPEN: GPIO.MovementConfig(1, 2, GPIO.PinMode.ACTIVE_HIGH),
+    NORTH_CLOSE: GPIO.MovementConfig(3, 4, GPIO.PinMode.ACTIVE_LOW),
+    SOUTH_OPEN: GPIO.MovementConfig(5, 6, GPIO.PinMode.ACTIVE_HIGH),
+    SOUTH_CLOSE: GPIO.MovementConfig(7, 8, GPIO.PinMode.ACTIVE_LOW),
+}
+PA = 0 * RegisterGPIO.PORT_SIZE + RegisterGPIO.DATA_OFFSET
+PB = 1 * RegisterGPIO.PORT_SIZE + RegisterGPIO.DATA_OFFSET
+PL = 0 * RegisterGPIO.PORT_SIZE + RegisterGPIO.DATA_OFFSET
+# The second block doesn't start on a page boundary, so it is found at an offset in its page
+BLOCK_ADDRESSES = (0, 0x800)
+
+
+@pytest.fixture
+def register_blocks(tmp_path):
+    path = tmp_path / 'registers'
+    path.write_bytes(bytes(0x1000))
+    return [
+        MMapRegisters(str(path), address, RegisterGPIO.BLOCK_SIZE)
+        for address in BLOCK_ADDRESSES
+    ]
+
+
+def create_gpio(register_blocks):
+    return RegisterGPIO(
+        CONFIG,
+        register_blocks,
+        PINS.__getitem__,
+        timedelta(milliseconds=5),
+        timedelta(milliseconds=30),
+        64,
+    )
+
+
+def test_registers_are_backed_by_file(tmp_path, register_blocks):
+    register_blocks[1].write(PL, 0x12345678)
+    data = (tmp_path / 'registers').read_bytes()
+    assert struct.unpack_from('<I', data, BLOCK_ADDRESSES[1] + PL)[0] == 0x12345678
+    assert register_blocks[1].read(PL) == 0x12345678
+
+
+def test_write_many_leaves_other_pins_untouched(register_blocks):
+    pa, pio_l = register_blocks
+    pa.write(PB, 0xa5a5a5a5)
+    pio_l.write(PL, 0x0f0f0f0f)
+    gpio = create_gpio(register_blocks)
+
+    gpio.write_many({NORTH_OPEN: True})
+    assert pa.read(PB) == 0xa5a5a5a5 | 1 << 4
+
+    # Active low: deactivating sets the bit, activating clears it
+    gpio.write_many({NORTH_OPEN: False, NORTH_CLOSE: True})
+    assert pa.read(PB) == 0xa5a5a5a5 & ~(1 << 4) & ~(1 << 5)
+    gpio.write_many({NORTH_CLOSE: False})
+    assert pa.read(PB) == 0xa5a5a5a5 & ~(1 << 4) | 1 << 5
+
+    gpio.write_many({SOUTH_OPEN: False, SOUTH_CLOSE: True})
+    assert pio_l.read(PL) == 0x0f0f0f0f & ~(1 << 0) & ~(1 << 31)
+    gpio.write_many({SOUTH_OPEN: True, SOUTH_CLOSE: False})
+    assert pio_l.read(PL) == 0x0f0f0f0f | 1 << 0 | 1 << 31
+    # The other port of the first block wasn't written
+    assert pa.read(PA) == 0
+
+
+def test_read_all_decodes_input_levels(register_blocks):
+    pa, _ = register_blocks
+    # Only bits 3 and 31 are inputs of ours, the rest is noise from other pins
+    pa.write(PA, 1 << 3 | 1 << 31 | 1 << 4 | 1 << 6)
+    gpio = create_gpio(register_blocks)
+    assert gpio.read_all() == {
+        NORTH_OPEN: True,
+        NORTH_CLOSE: False,
+        SOUTH_OPEN: False,
+        SOUTH_CLOSE: True,
+    }
+
+    # The poll thread notices the change of PA5
+    pa.write(PA, 1 << 3 | 1 << 5 | 1 << 31)
+    deadline = time.monotonic() + 5
+    while not gpio.read(NORTH_CLOSE) and time.monotonic() < deadline:
+        time.sleep(.01)
+    assert gpio.read_all() == {
+        NORTH_OPEN: True,
+        NORTH_CLOSE: True,
+        SOUTH_OPEN: False,
+        SOUTH_CLOSE: True,
+    }
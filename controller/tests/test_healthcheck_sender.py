@@ -0,0 +1,124 @@
+import enum
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+import requests
+
+from controller import config
+from controller.healthcheck_sender import HealthcheckSender
+
+
+class Status(enum.Enum):
+    OK = 0
+    FAILED = 1
+    CRASHED = 2
+
+
+class StubResponse:
+    def raise_for_status(self):
+        pass
+
+
+class StubSession:
+    """Records the URLs that are posted to. Each post blocks until it is released, or fails."""
+
+    def __init__(self):
+        self.posts = []
+        self.failing = False
+        self.blocked = False
+        self.release = threading.Event()
+        self.condition = threading.Condition()
+
+
+    def post(self, url, timeout):
+        with self.condition:
+            self.posts.append(url)
+            self.condition.notify_all()
+        if self.blocked:
+            self.release.wait(timeout)
+        if self.failing:
+            raise requests.ConnectionError('Endpoint unreachable')
+        return StubResponse()
+
+
+    def wait_posts(self, count, timeout=5):
+        with self.condition:
+            assert self.condition.wait_for(lambda: len(self.posts) >= count, timeout)
+
+
+@pytest.fixture
+def session():
+    return StubSession()
+
+
+@pytest.fixture
+def sender(session, monkeypatch):
+    monkeypatch.setattr(config, 'HEALTHCHECK_RETRIES', 2)
+    monkeypatch.setattr(config, 'HEALTHCHECK_RETRY_BACKOFF', timedelta(seconds=10))
+    sender = HealthcheckSender('https://healthcheck.invalid/check')
+    sender.session = session
+    return sender
+
+
+def test_only_latest_status_is_sent(sender, session):
+    session.blocked = True
+    sender.submit(Status.OK)
+    session.wait_posts(1)
+
+    # While the first status is being sent, the next ones replace each other
+    sender.submit(Status.FAILED)
+    sender.submit(Status.CRASHED)
+    session.blocked = False
+    session.release.set()
+    sender.flush(5)
+
+    assert session.posts == [
+        'https://healthcheck.invalid/check/0',
+        'https://healthcheck.invalid/check/2',
+    ]
+    assert sender.failures == 0
+
+
+def test_newer_status_preempts_retry(sender, session):
+    session.failing = True
+    sender.submit(Status.OK)
+    session.wait_posts(1)
+
+    # The retry is 10 seconds away, but the newer status is sent right away
+    session.failing = False
+    start = time.monotonic()
+    sender.submit(Status.FAILED)
+    sender.flush(5)
+
+    assert time.monotonic() - start < 5
+    assert session.posts == [
+        'https://healthcheck.invalid/check/0',
+        'https://healthcheck.invalid/check/1',
+    ]
+    assert sender.failures == 1
+
+
+def test_flush_waits_for_pending_status(sender, session):
+    session.blocked = True
+    sender.submit(Status.CRASHED)
+    session.wait_posts(1)
+    threading.Timer(.1, session.release.set).start()
+
+    sender.flush(5)
+    assert session.posts == ['https://healthcheck.invalid/check/2']
+    assert sender.last_sent.timestamp() > 0
+
+
+def test_flush_returns_after_last_attempt(sender, session, monkeypatch):
+    monkeypatch.setattr(config, 'HEALTHCHECK_RETRY_BACKOFF', timedelta(milliseconds=100))
+    session.failing = True
+    start = time.monotonic()
+    sender.submit(Status.CRASHED)
+    sender.flush(5)
+
+    # Three attempts, with backoffs of .1 and .2 seconds, but no wait after the last one (.4)
+    assert len(session.posts) == 3
+    assert time.monotonic() - start < .6
+    assert sender.failures == 3
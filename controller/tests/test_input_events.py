@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+import pytest
+
+from controller import util
+from controller.motor_io.fake import FakeIO
+from controller.scheduler import Scheduler
+
+NORTH_OPEN = util.Movement(util.Orientation.NORTH, util.Direction.OPEN)
+NORTH_CLOSE = util.Movement(util.Orientation.NORTH, util.Direction.CLOSE)
+
+
+def create_io(size=64):
+    return FakeIO(timedelta(milliseconds=30), size)
+
+
+def test_press_and_release():
+    io = create_io()
+    io.push(NORTH_OPEN, True, 1)
+    assert io.input_events.read(NORTH_OPEN, now=1.1)
+    assert io.input_events.read(NORTH_OPEN, now=1.2)
+
+    io.push(NORTH_OPEN, False, 2)
+    assert not io.input_events.read(NORTH_OPEN, now=2.1)
+    assert not io.input_events.read(NORTH_CLOSE, now=2.1)
+
+
+def test_contact_bounce_is_ignored():
+    io = create_io()
+    # Press with bounce: the first edge is accepted right away, the rest within 30ms are ignored
+    io.push_edges(NORTH_OPEN, [(1, True), (1.002, False), (1.004, True), (1.009, False), (1.012, True)])
+    assert io.input_events.read(NORTH_OPEN, now=1.013)
+    assert io.input_events.states[NORTH_OPEN].last_change == 1
+
+    # Release with bounce
+    io.push_edges(NORTH_OPEN, [(2, False), (2.003, True), (2.006, False)])
+    assert not io.input_events.read(NORTH_OPEN, now=2.1)
+
+
+def test_bounce_ending_in_ignored_edge_settles():
+    io = create_io()
+    # The release comes within the debounce time of the press, so it is ignored at first
+    io.push_edges(NORTH_OPEN, [(1, True), (1.01, False)])
+    assert io.input_events.read(NORTH_OPEN, now=1.02)
+    # Once the input has been stable for the debounce time, the last edge wins
+    assert not io.input_events.read(NORTH_OPEN, now=1.05)
+
+
+def test_short_tap_between_reads_is_latched():
+    io = create_io()
+    io.push_edges(NORTH_OPEN, [(1, True), (1.05, False)])
+    # The tap ended before we read the input, but it isn't missed...
+    assert io.input_events.read(NORTH_OPEN, now=2)
+    # ...and it is only reported once
+    assert not io.input_events.read(NORTH_OPEN, now=2.1)
+
+
+def test_read_all_latches_every_input():
+    io = create_io()
+    io.push_edges(NORTH_OPEN, [(1, True), (1.05, False)])
+    io.push_edges(NORTH_CLOSE, [(1.1, True)])
+    inputs = io.input_events.read_all(now=2)
+    assert inputs[NORTH_OPEN] and inputs[NORTH_CLOSE]
+    inputs = io.input_events.read_all(now=2.1)
+    assert not inputs[NORTH_OPEN] and inputs[NORTH_CLOSE]
+
+
+def test_buffer_overflow_drops_oldest_events():
+    io = create_io(size=4)
+    io.push_edges(NORTH_OPEN, [(i, i % 2 == 0) for i in range(10)])
+    # Only the last 4 edges are kept: the press among them is latched, the last release wins
+    assert io.input_events.read(NORTH_OPEN, now=20)
+    assert not io.input_events.read(NORTH_OPEN, now=21)
+    assert io.input_events.dropped == 0
+
+
+def test_input_listener_is_notified():
+    io = create_io()
+    notified = []
+    io.set_input_listener(lambda: notified.append(True))
+    io.push(NORTH_OPEN, True)
+    assert notified
+
+
+def test_outputs_are_recorded():
+    io = create_io()
+    io.write_many({NORTH_OPEN: True})
+    assert io.outputs[NORTH_OPEN]
+    io.write_many({NORTH_OPEN: False, NORTH_CLOSE: True})
+    assert io.outputs[NORTH_CLOSE] and not io.outputs[NORTH_OPEN]
+    assert [(movement, active) for _, movement, active in io.output_log] == [
+        (NORTH_OPEN, True),
+        (NORTH_OPEN, False),
+        (NORTH_CLOSE, True),
+    ]
+
+
+def test_ignored_edge_schedules_settle_deadline():
+    scheduler = Scheduler()
+    io = create_io()
+    start = scheduler.now + 1
+    # A short tap: the release is ignored as bounce at first
+    io.push_edges(NORTH_OPEN, [(start, True), (start + .01, False)])
+    assert io.input_events.read(NORTH_OPEN, now=start + .02)
+
+    # The main loop is woken up once the input has settled, and then sees the release
+    deadline = scheduler.get_next_deadline()
+    assert deadline == pytest.approx(start + .04)
+    assert not io.input_events.read(NORTH_OPEN, now=deadline)
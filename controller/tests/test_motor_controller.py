@@ -0,0 +1,147 @@
+import pytest
+
+from controller import config, util
+from controller.motor_controller import MotorController
+from controller.scheduler import Scheduler
+
+NORTH = util.Orientation.NORTH
+DURATION = config.ROOF_MOVEMENT_DURATION.total_seconds()
+
+
+@pytest.fixture
+def motor_controller(clock, monkeypatch):
+    monkeypatch.setattr(config, 'ROOF_VERIFICATION_ON_STARTUP', False)
+    motor_controller = MotorController()
+    yield motor_controller
+    motor_controller.shutdown()
+
+
+def run(motor_controller, clock, seconds, step=1):
+    scheduler = Scheduler()
+    for _ in range(int(seconds / step)):
+        clock.advance(step)
+        scheduler.tick()
+        motor_controller.tick()
+
+
+@pytest.mark.parametrize('start_position', [i / 20 for i in range(1, 20)])
+def test_piggybacked_opening_counts_as_verification(motor_controller, clock, start_position):
+    motor_controller.last_stable_position[NORTH] = start_position
+    motor_controller.target_position[NORTH] = start_position
+    motor_controller.confidence[NORTH] = .5
+
+    motor_controller.set_target_position(NORTH, 1)
+    run(motor_controller, clock, 1)
+    # The opening is extended to a full run...
+    assert motor_controller.current_actions[NORTH].is_verification
+    run(motor_controller, clock, DURATION + 5)
+
+    # ...which counts as a verification
+    assert NORTH not in motor_controller.current_actions
+    assert motor_controller.last_stable_position[NORTH] == 1
+    assert motor_controller.confidence[NORTH] == 1
+
+
+def test_cancelled_verification_does_not_count(motor_controller, clock):
+    motor_controller.confidence[NORTH] = .5
+    motor_controller.verify_position(NORTH)
+    run(motor_controller, clock, 10)
+    assert motor_controller.current_actions[NORTH].is_verification
+
+    # Someone stops the movement halfway
+    motor_controller.set_target_position(NORTH, motor_controller.current_position[NORTH])
+    run(motor_controller, clock, 5)
+    assert NORTH not in motor_controller.current_actions
+    assert motor_controller.confidence[NORTH] < .5
+
+
+def test_regular_movement_is_not_a_verification(motor_controller, clock):
+    motor_controller.set_target_position(NORTH, .5)
+    run(motor_controller, clock, DURATION)
+    assert motor_controller.last_stable_position[NORTH] == pytest.approx(.5, abs=.01)
+    assert motor_controller.confidence[NORTH] < 1
+
+
+def restart(motor_controller, clock, downtime):
+    motor_controller.shutdown()
+    clock.advance(downtime)
+    Scheduler().tick()
+    return MotorController()
+
+
+def test_restart_after_clean_shutdown_does_not_verify(motor_controller, clock):
+    motor_controller.set_target_position(NORTH, .5)
+    run(motor_controller, clock, DURATION)
+    assert motor_controller.confidence[NORTH] > config.ROOF_VERIFICATION_MIN_CONFIDENCE
+
+    # A docker restart: the roof keeps on closing while we're down
+    restarted = restart(motor_controller, clock, 10)
+    try:
+        position = .5 - 10 / DURATION
+        assert restarted.last_stable_position[NORTH] == pytest.approx(position, abs=.01)
+        # It finishes closing, without a verification
+        assert restarted.target_position[NORTH] == 0
+        run(restarted, clock, 1)
+        assert not restarted.current_actions[NORTH].is_verification
+        run(restarted, clock, DURATION)
+        assert restarted.current_position[NORTH] == 0
+        assert not Scheduler().is_due(restarted._verification_overdue_timer(NORTH))
+    finally:
+        restarted.shutdown()
+
+
+def test_long_shutdown_counts_as_verification(motor_controller, clock):
+    motor_controller.set_target_position(NORTH, .5)
+    run(motor_controller, clock, DURATION)
+    motor_controller.confidence[NORTH] = .5
+
+    restarted = restart(motor_controller, clock, DURATION + 10)
+    try:
+        assert restarted.last_stable_position[NORTH] == 0
+        assert restarted.target_position[NORTH] == 0
+        assert restarted.confidence[NORTH] == 1
+        run(restarted, clock, 1)
+        assert NORTH not in restarted.current_actions
+    finally:
+        restarted.shutdown()
+
+
+def test_restart_after_crash_while_opening_verifies(motor_controller, clock):
+    motor_controller.set_target_position(NORTH, 1)
+    run(motor_controller, clock, 10)
+    assert NORTH in motor_controller.current_actions
+
+    # A crash doesn't call shutdown(): the journal still holds the opening action
+    motor_controller.is_shut_down = True
+    clock.advance(10)
+    Scheduler().tick()
+    restarted = MotorController()
+    try:
+        assert restarted.last_stable_position[NORTH] == 0
+        run(restarted, clock, 1)
+        assert restarted.current_actions[NORTH].is_verification
+    finally:
+        restarted.shutdown()
+
+
+def test_idle_roof_is_verified_within_six_hours(motor_controller, clock):
+    # Before piggy-backing, a verification ran every 6 hours. The position may not drift for longer.
+    run(motor_controller, clock, 6 * 3600 - 120, step=60)
+    assert NORTH not in motor_controller.current_actions
+    run(motor_controller, clock, 180, step=60)
+    assert motor_controller.current_actions[NORTH].is_verification
+
+
+def test_verification_is_piggybacked_before_it_is_forced(motor_controller, clock):
+    motor_controller.set_target_position(NORTH, .5)
+    run(motor_controller, clock, DURATION)
+    run(motor_controller, clock, config.ROOF_VERIFICATION_INTERVAL.total_seconds(), step=60)
+    assert NORTH not in motor_controller.current_actions
+
+    # Opening fully is extended into a verification, before the separate run is due
+    motor_controller.set_target_position(NORTH, 1)
+    run(motor_controller, clock, 1)
+    assert motor_controller.current_actions[NORTH].is_verification
+    run(motor_controller, clock, DURATION + 5)
+    assert motor_controller.confidence[NORTH] == 1
+    assert not Scheduler().is_due(motor_controller._verification_overdue_timer(NORTH))
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+import pytest
+
+from controller import util
+from controller.motor_controller import MotorController
+from controller.motor_io.base import MotorIO
+from controller.motor_io.fake import FakeIO
+
+NORTH_OPEN = util.Movement(util.Orientation.NORTH, util.Direction.OPEN)
+NORTH_CLOSE = util.Movement(util.Orientation.NORTH, util.Direction.CLOSE)
+SOUTH_OPEN = util.Movement(util.Orientation.SOUTH, util.Direction.OPEN)
+
+
+class PerPinIO(MotorIO):
+    """A backend without batched IO, which relies on the defaults of MotorIO."""
+
+    def __init__(self):
+        self.inputs = {movement: False for movement in util.Movement}
+        self.writes = []
+
+    def read(self, movement):
+        return self.inputs[movement]
+
+    def write(self, movement, active):
+        self.writes.append((movement, active))
+
+
+def push_taps(io):
+    io.push_edges(NORTH_OPEN, [(1, True), (1.05, False)])
+    io.push_edges(NORTH_CLOSE, [(1.1, True)])
+    io.push_edges(SOUTH_OPEN, [(1.2, True), (1.25, False), (1.3, True)])
+
+
+def test_read_all_matches_per_pin_reads():
+    batched = FakeIO(timedelta(milliseconds=30), 64)
+    per_pin = FakeIO(timedelta(milliseconds=30), 64)
+    push_taps(batched)
+    push_taps(per_pin)
+
+    for now in (2, 2.1):
+        assert batched.input_events.read_all(now=now) == {
+            movement: per_pin.input_events.read(movement, now=now)
+            for movement in util.Movement
+        }
+
+
+def test_default_read_all_reads_every_pin():
+    io = PerPinIO()
+    io.inputs[NORTH_CLOSE] = True
+    assert io.read_all() == {movement: movement == NORTH_CLOSE for movement in util.Movement}
+
+
+def test_default_write_many_deactivates_first():
+    io = PerPinIO()
+    io.write_many({NORTH_OPEN: True, NORTH_CLOSE: False})
+    assert io.writes == [(NORTH_CLOSE, False), (NORTH_OPEN, True)]
+
+
+def test_fake_write_many_is_one_batched_write(monkeypatch):
+    io = FakeIO(timedelta(milliseconds=30), 64)
+    def write(movement, active):
+        pytest.fail('Wrote a single output')
+    monkeypatch.setattr(io, 'write', write)
+    io.write_many({NORTH_OPEN: True, SOUTH_OPEN: True})
+    io.write_many({NORTH_OPEN: False, NORTH_CLOSE: True})
+    assert io.outputs == {
+        NORTH_OPEN: False,
+        NORTH_CLOSE: True,
+        SOUTH_OPEN: True,
+        util.Movement(util.Orientation.SOUTH, util.Direction.CLOSE): False,
+    }
+    # All outputs of a batch are written at the same time, deactivations first
+    assert [(movement, active) for _, movement, active in io.output_log[2:]] == [
+        (NORTH_OPEN, False),
+        (NORTH_CLOSE, True),
+    ]
+
+
+def test_motor_controller_writes_one_batch_per_change(clock):
+    motor_controller = MotorController()
+    batches = []
+    write_many = motor_controller.motor_io.write_many
+    def counting_write_many(outputs):
+        batches.append(dict(outputs))
+        write_many(outputs)
+    motor_controller.motor_io.write_many = counting_write_many
+
+    # Starting a motor stops the opposite one in the same batch
+    motor_controller.write(NORTH_OPEN, True)
+    assert batches == [{NORTH_CLOSE: False, NORTH_OPEN: True}]
+
+    # Shutting down closes both roofs at once
+    motor_controller.shutdown()
+    assert len(batches) == 2
+    assert len(batches[1]) == len(list(util.Movement))
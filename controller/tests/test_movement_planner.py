@@ -0,0 +1,117 @@
+import math
+
+import pytest
+from simulation import Simulation
+
+from controller import config, util
+
+NORTH = util.Orientation.NORTH
+SOUTH = util.Orientation.SOUTH
+NORTH_CLOSE = util.Movement(NORTH, util.Direction.CLOSE)
+
+
+@pytest.fixture(autouse=True)
+def no_startup_verification(monkeypatch):
+    monkeypatch.setattr(config, 'ROOF_VERIFICATION_ON_STARTUP', False)
+
+
+def open_to_first_step(sim):
+    sim.report(20)
+    sim.run(200)
+    sim.report(27.5)
+    sim.run(60)
+    assert sim.motor_controller.current_position[NORTH] == pytest.approx(.15)
+
+
+def test_high_wind_closes_roof_with_held_back_close(clock, monkeypatch):
+    with Simulation(clock, monkeypatch) as sim:
+        open_to_first_step(sim)
+        # Closing right after opening is a small reversal, which is held back
+        sim.report(24)
+        sim.run(60)
+        assert sim.movement_planner.requested[NORTH] == 0
+        assert sim.motor_controller.target_position[NORTH] == pytest.approx(.15)
+
+        # High wind doesn't wait for the held back close: the roof is closed right away, with a
+        # full closing cycle
+        sim.report(24, wind_gust=60)
+        sim.run(2)
+        action = sim.motor_controller.current_actions[NORTH]
+        assert action.direction == util.Direction.CLOSE
+        assert action.is_verification
+        assert NORTH not in sim.movement_planner.requested
+
+        # The automatic close doesn't cut the closing cycle short
+        sim.run(config.ROOF_MOVEMENT_DURATION.total_seconds() - 10)
+        assert sim.motor_controller.current_actions[NORTH].is_verification
+        sim.run(20)
+        assert sim.motor_controller.current_position[NORTH] == 0
+        assert sim.motor_controller.confidence[NORTH] == 1
+
+
+def test_high_wind_stops_opening_with_held_back_close(clock, monkeypatch):
+    with Simulation(clock, monkeypatch) as sim:
+        sim.report(20)
+        sim.run(200)
+        sim.report(27.5)
+        sim.run(5)
+        assert sim.motor_controller.current_actions[NORTH].direction == util.Direction.OPEN
+
+        # The close is held back while the roof is still opening...
+        sim.report(24)
+        sim.run(5)
+        assert sim.movement_planner.requested[NORTH] == 0
+        # ...but high wind stops the opening right away
+        sim.report(24, wind_gust=60)
+        sim.run(2)
+        assert sim.motor_controller.current_actions[NORTH].direction == util.Direction.CLOSE
+
+        opened = []
+        def check_not_opening():
+            for action in sim.motor_controller.current_actions.values():
+                if action.direction == util.Direction.OPEN:
+                    opened.append(sim.elapsed)
+        sim.report(30, wind_gust=10)
+        sim.run(config.HIGH_WIND_CURFEW.total_seconds() - 10, on_tick=check_not_opening)
+        assert not opened
+
+
+def test_held_back_movements_are_dropped_during_manual_curfew(clock, monkeypatch):
+    with Simulation(clock, monkeypatch) as sim:
+        open_to_first_step(sim)
+        sim.report(24)
+        sim.run(60)
+        assert sim.movement_planner.requested[SOUTH] == 0
+
+        # Someone closes the north roof by hand
+        io = sim.motor_controller.motor_io
+        io.push_edges(NORTH_CLOSE, [(clock.now, True), (clock.now + .2, False)])
+        sim.run(config.MOVEMENT_REVERSAL_WINDOW.total_seconds() + 60)
+
+        # The south roof is left alone until the manual curfew is over
+        assert sim.motor_controller.current_position[NORTH] == 0
+        assert sim.motor_controller.current_position[SOUTH] == pytest.approx(.15)
+        assert not sim.movement_planner.requested
+
+
+def replay_oscillating_temperature(clock, monkeypatch):
+    """Replay 6 hours of a temperature that oscillates around the boundary of a position step."""
+    with Simulation(clock, monkeypatch) as sim:
+        sim.report(20)
+        sim.run(200)
+        for minute in range(6 * 60):
+            sim.report(26 + 2 * math.sin(2 * math.pi * minute / 14))
+            sim.run(60, step=5)
+
+        return sim.motor_controller.reversals, sim.motor_controller.actuation_seconds
+
+
+def test_replay_reversals_are_held_back(clock, monkeypatch):
+    reversals, actuation_seconds = replay_oscillating_temperature(clock, monkeypatch)
+
+    monkeypatch.setattr(config, 'MOVEMENT_REVERSAL_WINDOW', config.MOVEMENT_REVERSAL_WINDOW * 0)
+    unplanned_reversals, unplanned_actuation_seconds = replay_oscillating_temperature(clock, monkeypatch)
+
+    assert unplanned_reversals > 20
+    assert reversals < unplanned_reversals / 2
+    assert actuation_seconds < unplanned_actuation_seconds / 2
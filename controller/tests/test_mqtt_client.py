@@ -0,0 +1,80 @@
+import time
+
+import pytest
+from mqtt_broker import MQTTBroker, PublishedMessage
+
+from controller import config
+from controller.mqtt_client import MQTTClient
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError('Condition not met')
+        time.sleep(.01)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = MQTTBroker()
+    broker.start()
+    monkeypatch.setattr(config, 'MQTT_PORT', broker.port)
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def mqtt_client(broker):
+    mqtt_client = MQTTClient()
+    wait_for(mqtt_client.client.is_connected)
+    yield mqtt_client
+    mqtt_client.client.disconnect()
+    mqtt_client.client.loop_stop()
+
+
+def receive(mqtt_client, messages, count):
+    def received():
+        mqtt_client.process_messages()
+        return len(messages) >= count
+    wait_for(received)
+
+
+def test_subscriptions_are_restored_after_broker_restart(broker, mqtt_client):
+    messages = []
+    mqtt_client.subscribe('roof/+/open', lambda topic, payload: messages.append((topic, payload)))
+    wait_for(lambda: broker.connections and broker.connections[0].subscriptions)
+    broker.publish(PublishedMessage('weatherstation/roof/north/open', b'1', 0, False))
+    receive(mqtt_client, messages, 1)
+
+    broker.restart()
+    wait_for(lambda: mqtt_client.reconnects == 1)
+    wait_for(lambda: broker.connections and broker.connections[0].subscriptions)
+    broker.publish(PublishedMessage('weatherstation/roof/north/open', b'0', 0, False))
+    receive(mqtt_client, messages, 2)
+
+    assert messages == [('roof/north/open', '1'), ('roof/north/open', '0')]
+    assert mqtt_client.reconnect_time.count == 1
+
+
+def test_outbox_is_drained_on_reconnect(broker, mqtt_client):
+    broker.stop()
+    wait_for(lambda: not mqtt_client.client.is_connected())
+
+    mqtt_client.publish('state', 'old', qos=1, retain=True)
+    mqtt_client.publish('state', 'new', qos=1, retain=True)
+    assert len(mqtt_client.outbox) == 1
+
+    broker.start()
+    wait_for(lambda: len(broker.published) == 1)
+    assert broker.published == [PublishedMessage('weatherstation/state', b'new', 1, True)]
+    assert mqtt_client.outbox_drained == 1
+    assert len(mqtt_client.outbox) == 0
+    assert mqtt_client.reconnects == 1
+
+
+def test_publish_while_connected_skips_outbox(broker, mqtt_client):
+    mqtt_client.publish('state', 'current', qos=1, retain=True)
+    wait_for(lambda: len(broker.published) == 1)
+    assert mqtt_client.outbox_drained == 0
+    assert len(mqtt_client.outbox) == 0
@@ -0,0 +1,68 @@
+from controller import config, util
+from controller.motor_io.mqtt import MQTTIO
+from controller.mqtt_client import MQTTClient
+from controller.wakeup import Wakeup
+
+NORTH_OPEN = util.Movement(util.Orientation.NORTH, util.Direction.OPEN)
+
+
+class FakeMessage:
+    def __init__(self, topic, payload, retain=False):
+        self.topic = topic
+        self.payload = payload.encode()
+        self.timestamp = 0
+        self.retain = retain
+
+
+def count_wakeups(wakeup):
+    count = 0
+    try:
+        while wakeup._reader.recv(1):
+            count += 1
+    except BlockingIOError:
+        pass
+    return count
+
+
+def test_message_wakes_up_main_loop_once():
+    io = MQTTIO(config.MQTT_IO_CONFIG)
+    wakeup = Wakeup()
+    io.set_input_listener(wakeup.notify)
+    mqtt_client = MQTTClient()
+
+    mqtt_client._on_message(None, None, FakeMessage('weatherstation/roof/north/open', '1'))
+    mqtt_client.process_messages()
+
+    assert io.read(NORTH_OPEN)
+    assert count_wakeups(wakeup) == 1
+
+
+def test_repeated_messages_are_all_handled():
+    mqtt_client = MQTTClient()
+    payloads = []
+    mqtt_client.subscribe('roof/north/open', lambda topic, payload: payloads.append(payload))
+
+    # Two identical button presses
+    mqtt_client._on_message(None, None, FakeMessage('weatherstation/roof/north/open', '1'))
+    mqtt_client._on_message(None, None, FakeMessage('weatherstation/roof/north/open', '1'))
+    mqtt_client.process_messages()
+    assert payloads == ['1', '1']
+    assert mqtt_client.duplicates == 0
+
+
+def test_retained_redelivery_is_skipped():
+    mqtt_client = MQTTClient()
+    payloads = []
+    mqtt_client.subscribe('roof/north/open', lambda topic, payload: payloads.append(payload))
+
+    mqtt_client._on_message(None, None, FakeMessage('weatherstation/roof/north/open', '1'))
+    # After a reconnect, the broker sends the retained message again
+    mqtt_client._on_message(
+        None, None, FakeMessage('weatherstation/roof/north/open', '1', retain=True),
+    )
+    mqtt_client._on_message(
+        None, None, FakeMessage('weatherstation/roof/north/open', '0', retain=True),
+    )
+    mqtt_client.process_messages()
+    assert payloads == ['1', '0']
+    assert mqtt_client.duplicates == 1
@@ -0,0 +1,123 @@
+import json
+import time
+from datetime import timedelta
+
+from controller import util
+from controller.mqtt_outbox import OutgoingMessage, Outbox
+
+
+def state(payload, topic='weatherstation/state'):
+    return OutgoingMessage(topic, payload, qos=1, retain=True)
+
+
+def event(payload, topic='weatherstation/event'):
+    return OutgoingMessage(topic, payload, qos=1)
+
+
+def count_writes(monkeypatch):
+    writes = []
+    atomic_write = util.atomic_write
+
+    def counting_atomic_write(path, data):
+        writes.append(data)
+        atomic_write(path, data)
+
+    monkeypatch.setattr(util, 'atomic_write', counting_atomic_write)
+    return writes
+
+
+def test_only_latest_retained_message_is_kept():
+    outbox = Outbox(None, 10, timedelta(seconds=30))
+    outbox.put(state('1'))
+    outbox.put(event('a'))
+    outbox.put(state('2'))
+    outbox.put(event('b'))
+    assert [message.payload for message in outbox.pop_all()] == ['a', '2', 'b']
+    assert len(outbox) == 0
+
+
+def test_oldest_messages_are_dropped_when_full():
+    outbox = Outbox(None, 3, timedelta(seconds=30))
+    for payload in 'abcde':
+        outbox.put(event(payload))
+    assert [message.payload for message in outbox.pop_all()] == ['c', 'd', 'e']
+    assert outbox.dropped == 2
+
+
+def test_requeued_messages_go_first_unless_replaced():
+    outbox = Outbox(None, 10, timedelta(seconds=30))
+    outbox.put(state('1', topic='a'))
+    outbox.put(state('1', topic='b'))
+    outbox.put(event('x'))
+    unsent = outbox.pop_all()
+
+    outbox.put(state('2', topic='a'))
+    outbox.requeue(unsent)
+    assert [(message.topic, message.payload) for message in outbox.pop_all()] == [
+        ('b', '1'),
+        ('weatherstation/event', 'x'),
+        ('a', '2'),
+    ]
+
+
+def test_saves_are_batched(tmp_path, monkeypatch):
+    writes = count_writes(monkeypatch)
+    outbox = Outbox(tmp_path / 'outbox.json', 100, timedelta(milliseconds=200))
+    for i in range(20):
+        outbox.put(event(str(i)))
+    # Nothing is written on the caller's thread
+    assert writes == []
+
+    deadline = time.monotonic() + 5
+    while not writes and time.monotonic() < deadline:
+        time.sleep(.01)
+    time.sleep(.1)
+    assert len(writes) == 1
+    assert len(json.loads(writes[0])) == 20
+
+
+def test_save_writes_pending_changes_only(tmp_path, monkeypatch):
+    writes = count_writes(monkeypatch)
+    outbox = Outbox(tmp_path / 'outbox.json', 100, timedelta(hours=1))
+    outbox.save()
+    assert writes == []
+
+    outbox.put(state('1'))
+    outbox.save()
+    outbox.save()
+    assert len(writes) == 1
+
+
+def test_outbox_survives_restart(tmp_path):
+    path = tmp_path / 'outbox.json'
+    outbox = Outbox(path, 100, timedelta(hours=1))
+    outbox.put(state('1'))
+    outbox.put(event('a'))
+    outbox.save()
+
+    restored = Outbox(path, 100, timedelta(hours=1))
+    assert restored.pop_all() == [state('1'), event('a')]
+
+
+def test_invalid_messages_are_discarded(tmp_path):
+    path = tmp_path / 'outbox.json'
+    path.write_text(json.dumps([
+        {'topic': 'weatherstation/state', 'payload': '1', 'qos': 1, 'retain': True},
+        {'topic': 'weatherstation/state'},
+        {'topic': 'weatherstation/state', 'payload': '2', 'unknown': True},
+        {'topic': None, 'payload': '3'},
+        'not a message',
+        {'topic': 'weatherstation/event', 'payload': 'a'},
+    ]))
+
+    outbox = Outbox(path, 100, timedelta(hours=1))
+    assert outbox.pop_all() == [
+        state('1'),
+        OutgoingMessage('weatherstation/event', 'a'),
+    ]
+
+
+def test_invalid_outbox_is_ignored(tmp_path):
+    path = tmp_path / 'outbox.json'
+    path.write_text(json.dumps({'topic': 'weatherstation/state', 'payload': '1'}))
+    assert len(Outbox(path, 100, timedelta(hours=1))) == 0
@@ -0,0 +1,127 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from open_meteo_stub import OpenMeteoStub, build_forecast, build_response
+
+from controller import config
+from controller.scheduler import Scheduler
+from controller.wakeup import Wakeup
+from controller.weather_forecast_fetcher import WeatherForecastFetcher
+
+
+@pytest.fixture
+def forecast():
+    start = int(time.time()) // 3600 * 3600 - 3600
+    return start, build_forecast(start, 48)
+
+
+@pytest.fixture
+def stub(forecast):
+    stub = OpenMeteoStub(build_response(forecast[0], 3600, forecast[1]))
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def fetcher_class(stub):
+    # The fetch threads of earlier tests keep on running, so every test gets its own class with
+    # its own url.
+    class Fetcher(WeatherForecastFetcher):
+        url = stub.url
+    return Fetcher
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(.01)
+
+
+def get_forecast(fetcher: WeatherForecastFetcher):
+    """Call get_forecast() like a tick would, and return the forecast and how long it took."""
+    Scheduler().tick()
+    start = time.monotonic()
+    forecast = fetcher.get_forecast()
+    return forecast, time.monotonic() - start
+
+
+def test_forecast_is_fetched_in_the_background(forecast, stub, fetcher_class):
+    stub.delay = .5
+    start = time.monotonic()
+    fetcher = fetcher_class()
+    assert time.monotonic() - start < .1
+
+    # The tick isn't blocked while the forecast is fetched
+    wait_for(lambda: stub.requests)
+    result, duration = get_forecast(fetcher)
+    assert result is None
+    assert duration < .05
+
+    # Once it has arrived, the main loop is woken up to use it
+    wait_for(lambda: fetcher.snapshot is not None)
+    assert Wakeup().selector.select(0)
+    result, _ = get_forecast(fetcher)
+    timestamps = forecast[0] + 3600 * np.arange(48)
+    expected = np.interp(time.time(), timestamps, forecast[1]['temperature_2m'])
+    assert result.temperature == pytest.approx(expected, abs=.01)
+
+    _, params = stub.requests[0]
+    assert params['hourly'] == list(WeatherForecastFetcher.columns)
+    assert params['format'] == ['flatbuffers']
+
+
+def test_slow_refresh_keeps_serving_last_forecast(stub, monkeypatch, fetcher_class):
+    monkeypatch.setattr(config, 'WEATHER_FORECAST_REFRESH_INTERVAL', timedelta(seconds=.3))
+    fetcher = fetcher_class()
+    wait_for(lambda: fetcher.snapshot is not None)
+    snapshot = fetcher.snapshot
+
+    stub.delay = 1
+    wait_for(lambda: len(stub.requests) >= 2)
+    result, duration = get_forecast(fetcher)
+    assert result is not None
+    assert duration < .05
+    assert fetcher.snapshot is snapshot
+
+
+def test_refresh_timing(stub, monkeypatch, fetcher_class):
+    monkeypatch.setattr(config, 'WEATHER_FORECAST_REFRESH_INTERVAL', timedelta(seconds=.3))
+    monkeypatch.setattr(config, 'WEATHER_FORECAST_RETRY_INTERVAL', timedelta(seconds=.1))
+    fetcher_class()
+    wait_for(lambda: len(stub.requests) >= 3)
+
+    stub.status = 500
+    count = len(stub.requests)
+    wait_for(lambda: len(stub.requests) >= count + 3)
+
+    times = [timestamp for timestamp, _ in stub.requests]
+    intervals = np.diff(times)
+    # A forecast is refreshed well before it expires, a failed fetch is retried sooner
+    assert intervals[:2] == pytest.approx([.3, .3], abs=.1)
+    assert intervals[count:count + 2] == pytest.approx([.1, .1], abs=.1)
+
+
+def test_cached_forecast_is_used_after_restart(stub, fetcher_class):
+    fetcher = fetcher_class()
+    wait_for(lambda: config.WEATHER_FORECAST_CACHE_PATH.exists())
+    count = len(stub.requests)
+
+    fetcher = fetcher_class()
+    assert fetcher.snapshot is not None
+    result, _ = get_forecast(fetcher)
+    assert result is not None
+    # It is only refreshed once it is due
+    time.sleep(.2)
+    assert len(stub.requests) == count
+
+
+def test_expired_forecast_is_not_used(stub, monkeypatch, fetcher_class):
+    fetcher = fetcher_class()
+    wait_for(lambda: fetcher.snapshot is not None)
+    monkeypatch.setattr(config, 'WEATHER_FORECAST_VALIDITY', timedelta(seconds=.1))
+    time.sleep(.2)
+    result, _ = get_forecast(fetcher)
+    assert result is None
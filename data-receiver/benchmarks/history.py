@@ -0,0 +1,105 @@
+"""
+Measures the latency of /history over a day, a month and a year of data.
+
+A year of states is written to a temporary history at the controller's publish interval, and pruned
+like the server would. Each range is then requested once with an empty cache, and a number of times
+after that, like a dashboard that keeps refreshing.
+
+    python benchmarks/history.py [--interval SECONDS] [--repeat N]
+"""
+
+import argparse
+import atexit
+import math
+import pathlib
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src' / 'data-receiver'))
+
+from app import app  # noqa: E402
+
+DATA_DIR = pathlib.Path(tempfile.mkdtemp())
+# Registered before the server's own exit handlers, so that it runs after them
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+app.config.update(
+    DATA_DIR=DATA_DIR,
+    RECENT_REPORTS_PATH=DATA_DIR / 'recent_reports.sqlite',
+    HISTORY_PATH=DATA_DIR / 'history.sqlite',
+    MQTT_HOST='127.0.0.1',
+    MQTT_PORT=9,
+)
+
+import server  # noqa: E402
+
+SERIES = 'state.weather_report.indoor.temperature'
+RANGES = [
+    ('1 day', timedelta(days=1), 60),
+    ('30 days', timedelta(days=30), 3600),
+    ('1 year', timedelta(days=365), 86400),
+]
+
+
+def populate(interval: int) -> int:
+    history = server.report_history
+    end = time.time()
+    start = end - timedelta(days=365).total_seconds()
+    count = 0
+    timestamp = start
+    while timestamp < end:
+        # Flush a day at a time, like the server does every few minutes
+        day_end = min(timestamp + 86400, end)
+        while timestamp < day_end:
+            history.add(timestamp, {SERIES: 20 + 5 * math.sin(timestamp / 86400 * 2 * math.pi)})
+            timestamp += interval
+            count += 1
+        history.flush()
+
+    history.last_prune = 0
+    history.add(end, {SERIES: 20})
+    history.flush()
+    return count
+
+
+def request(client, duration: timedelta, resolution: int) -> float:
+    end = datetime.now().astimezone()
+    start = time.perf_counter()
+    response = client.get('/history', query_string={
+        'series': SERIES,
+        'start': (end - duration).isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+    })
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.text
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=int, default=60, help='seconds between states')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = populate(args.interval)
+    print(f'Wrote {count} samples in {time.perf_counter() - start:.1f}s')
+
+    client = app.test_client()
+    print(f'{"range":>8} {"buckets":>8} {"cold (ms)":>10} {"warm p50 (ms)":>14} {"warm p99 (ms)":>14}')
+    for name, duration, resolution in RANGES:
+        server.history_query.cache.clear()
+        cold = request(client, duration, resolution)
+        warm = sorted(request(client, duration, resolution) for _ in range(args.repeat))
+        print(
+            f'{name:>8} {int(duration.total_seconds() / resolution):>8} {1000 * cold:>10.2f} '
+            f'{1000 * statistics.median(warm):>14.2f} {1000 * warm[int(0.99 * (len(warm) - 1))]:>14.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
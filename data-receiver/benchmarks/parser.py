@@ -0,0 +1,120 @@
+"""
+Measures the cost of parsing a weather station upload.
+
+The single pass of fields.Schema is compared to the parser that it replaced, which looked up every
+field separately, and logged a traceback for every field that the station left out. Both parse a
+typical upload, in which most of the optional fields are missing, and an upload with all the
+fields. The whole of get_report(), which also updates the rolling windows and the history, is
+timed for comparison.
+
+    python benchmarks/parser.py [--number N]
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src' / 'data-receiver'))
+
+from app import app  # noqa: E402
+
+DATA_DIR = pathlib.Path(tempfile.mkdtemp())
+# Registered before the server's own exit handlers, so that it runs after them
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+app.config.update(
+    DATA_DIR=DATA_DIR,
+    RECENT_REPORTS_PATH=DATA_DIR / 'recent_reports.sqlite',
+    HISTORY_PATH=DATA_DIR / 'history.sqlite',
+    MQTT_HOST='127.0.0.1',
+    MQTT_PORT=9,
+)
+
+import fields  # noqa: E402
+import server  # noqa: E402
+
+AUTH = {'ID': app.config['STATION_ID'], 'PASSWORD': app.config['STATION_KEY'], 'dateutc': 'now'}
+UPLOADS = {
+    'typical': dict(
+        AUTH,
+        tempf='68.5',
+        humidity='61',
+        windgustmph='4.5',
+        totalrainin='12.31',
+        indoortempf='77.2',
+    ),
+    'complete': dict(
+        AUTH,
+        tempf='68.5',
+        humidity='61',
+        dewptf='54.7',
+        windchillf='68.5',
+        winddir='225',
+        windspeedmph='3.1',
+        windgustmph='4.5',
+        rainin='0',
+        dailyrainin='0.02',
+        weeklyrainin='0.31',
+        monthlyrainin='1.2',
+        totalrainin='12.31',
+        solarradiation='320.5',
+        UV='3',
+        indoortempf='77.2',
+        indoorhumidity='55',
+        baromin='29.87',
+        lowbatt='0',
+    ),
+}
+
+
+def parse_per_field(args) -> dict:
+    """The parser before fields.Schema."""
+    report = {}
+    for key, field in server.report_schema.fields.items():
+        try:
+            data = args.get(field.name, None)
+            if data is None or data == fields.MISSING_VALUE:
+                raise ValueError(f'Parameter {field.name} not found')
+            report[key] = field.parse(data)
+        except Exception as e:
+            app.logger.exception(e)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    # Format the logged tracebacks like the server would, without printing them
+    app.logger.handlers = [logging.StreamHandler(open(os.devnull, 'w'))]
+    app.logger.propagate = False
+    app.logger.setLevel(logging.INFO)
+
+    parsers = {
+        'per field': parse_per_field,
+        'schema': server.report_schema.parse,
+        'get_report': lambda _: server.get_report(server.request),
+    }
+
+    print(f'{"upload":>9} {"parser":>10} {"us/upload":>10}')
+    for upload_name, upload in UPLOADS.items():
+        with app.test_request_context('/report', query_string=upload):
+            request_args = server.request.args
+            for parser_name, parse in parsers.items():
+                parse(request_args)
+                seconds = min(timeit.repeat(
+                    lambda: parse(request_args),
+                    number=args.number,
+                    repeat=5,
+                ))
+                print(f'{upload_name:>9} {parser_name:>10} {1e6 * seconds / args.number:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Load test of /report, publishing the reports over the connection that the server shares between
+requests, and with a new connection per report (paho.mqtt.publish.single), as the server used to.
+
+Both run with the production settings in gunicorn.conf.py, against a broker (by default the one from
+docker-compose), and get --requests requests from --concurrency clients. For each, the throughput,
+the median and 99th percentile latency, the number of requests that failed, and the number of
+reports that reached the broker are printed.
+
+    python benchmarks/report.py [--requests N] [--concurrency N] [--mqtt-port PORT]
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client
+import paho.mqtt.enums
+from serve import ENDPOINTS, GUNICORN, load, percentile, start_server, stop_server
+
+# serve has put the sources of the data receiver on the path
+import config
+
+PUBLISHERS = {
+    'single': GUNICORN + ['--bind', '127.0.0.1:{port}', 'wsgi_publish_single:app'],
+    'shared': GUNICORN + ['--bind', '127.0.0.1:{port}', 'wsgi:app'],
+}
+
+
+class Subscriber:
+    """Counts the reports that reach the broker."""
+
+    def __init__(self, args):
+        self.count = 0
+        self.lock = threading.Lock()
+        self.client = paho.mqtt.client.Client(paho.mqtt.enums.CallbackAPIVersion.VERSION2)
+        self.client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+        self.client.on_message = self._on_message
+        self.client.connect(args.mqtt_host, args.mqtt_port)
+        self.client.subscribe(f'{args.mqtt_topic_prefix}/{config.MQTT_TOPIC_REPORT}', qos=1)
+        self.client.loop_start()
+
+
+    def _on_message(self, client, userdata, message) -> None:
+        with self.lock:
+            self.count += 1
+
+
+    def wait(self, count: int, timeout: float) -> int:
+        deadline = time.monotonic() + timeout
+        while self.count < count and time.monotonic() < deadline:
+            time.sleep(0.1)
+        return self.count
+
+
+    def close(self) -> None:
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def run(name: str, args) -> None:
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = start_server(name, PUBLISHERS[name], args, data_dir)
+        subscriber = Subscriber(args)
+        try:
+            elapsed, latencies, failed = load(args, ENDPOINTS['report'])
+            delivered = subscriber.wait(len(latencies), 10)
+        finally:
+            subscriber.close()
+            stop_server(server)
+
+    print(
+        f'{name:>9} {len(latencies) / elapsed:>8.0f} '
+        f'{1000 * percentile(latencies, .5):>8.1f} {1000 * percentile(latencies, .99):>8.1f} '
+        f'{failed:>6} {delivered:>9}',
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--publisher', choices=PUBLISHERS, action='append')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=5, help='seconds before a request fails')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--mqtt-host', default='127.0.0.1')
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--mqtt-topic-prefix', default='benchmark')
+    args = parser.parse_args()
+
+    print(f'{"publisher":>9} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"failed":>6} {"delivered":>9}')
+    for name in args.publisher or PUBLISHERS:
+        run(name, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Load test of the ways to serve the data receiver: Flask's development server with the debugger, as
+it used to run, gunicorn with the thread pool that it used before, and gunicorn with the production
+settings in gunicorn.conf.py.
+
+Each server is started against a broker (by default the one from docker-compose), and gets
+--requests requests to /report, /state and /history from --concurrency clients, first on its own,
+then while --streams clients are connected to /state/stream. For each, the throughput, the median
+and 99th percentile latency, and the number of requests that failed or timed out are printed.
+
+    python benchmarks/serve.py [--mode dev|gthread|gunicorn] [--streams N] [--mqtt-port PORT]
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import os
+import pathlib
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client
+import paho.mqtt.enums
+
+BENCHMARKS_DIR = pathlib.Path(__file__).parent
+SRC_DIR = BENCHMARKS_DIR.parent / 'src' / 'data-receiver'
+sys.path.insert(0, str(SRC_DIR))
+
+import config  # noqa: E402
+
+GUNICORN = [sys.executable, '-m', 'gunicorn', '--config', str(SRC_DIR / 'gunicorn.conf.py')]
+MODES = {
+    'dev': [sys.executable, '-m', 'flask', '--app', 'wsgi', 'run', '--debug', '--port', '{port}'],
+    'gthread': GUNICORN + [
+        '--bind', '127.0.0.1:{port}', '--worker-class', 'gthread', '--threads', '16', 'wsgi:app',
+    ],
+    'gunicorn': GUNICORN + ['--bind', '127.0.0.1:{port}', 'wsgi:app'],
+}
+ENDPOINTS = {
+    'report': (
+        f'/report?ID={config.STATION_ID}&PASSWORD={config.STATION_KEY}&dateutc=now&tempf=68.5'
+        '&humidity=61&windgustmph=4.5&totalrainin=12.31&solarradiation=320.5&indoortempf=77.2'
+        '&indoorhumidity=55&baromin=29.87'
+    ),
+    'state': '/state',
+    'history': '/history?series=state.roofs.north.open&resolution=3600',
+}
+STATE = b'{"timestamp": 0, "roofs": {"north": {"position": 0.3}, "south": {"position": 0}}}'
+
+
+def publish_state(args) -> None:
+    """Publish a retained state, so that /state has something to serve."""
+    client = paho.mqtt.client.Client(paho.mqtt.enums.CallbackAPIVersion.VERSION2)
+    client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+    client.connect(args.mqtt_host, args.mqtt_port)
+    client.loop_start()
+    topic = f'{args.mqtt_topic_prefix}/{config.MQTT_TOPIC_STATE}'
+    client.publish(topic, STATE, qos=1, retain=True).wait_for_publish(5)
+    client.loop_stop()
+    client.disconnect()
+
+
+def request(port: int, path: str, timeout: float = 5) -> float | None:
+    """Return the latency of a request, or None if it failed."""
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            return None
+    except OSError:
+        return None
+    finally:
+        connection.close()
+    return time.perf_counter() - start
+
+
+class Streams:
+    """Clients of /state/stream, whose events are read and discarded by a single thread."""
+
+    def __init__(self, port: int, count: int):
+        self.selector = selectors.DefaultSelector()
+        self.connected = set()
+        self.running = True
+        for _ in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(b'GET /state/stream HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._read)
+        self.thread.start()
+
+
+    def _read(self) -> None:
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                try:
+                    data = key.fileobj.recv(65536)
+                except OSError:
+                    data = b''
+                if not data:
+                    self.selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                elif b'id: ' in data:
+                    self.connected.add(key.fileobj)
+
+
+    def wait_connected(self, count: int, timeout: float) -> int:
+        deadline = time.monotonic() + timeout
+        while len(self.connected) < count and time.monotonic() < deadline:
+            time.sleep(0.1)
+        return len(self.connected)
+
+
+    def close(self) -> None:
+        self.running = False
+        self.thread.join()
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+
+
+def start_server(name: str, command: list[str], args, data_dir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BENCHMARK_DATA_DIR=data_dir,
+        BENCHMARK_MQTT_HOST=args.mqtt_host,
+        BENCHMARK_MQTT_PORT=str(args.mqtt_port),
+        BENCHMARK_MQTT_TOPIC_PREFIX=args.mqtt_topic_prefix,
+    )
+    server = subprocess.Popen(
+        [part.format(port=args.port) for part in command],
+        cwd=BENCHMARKS_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    deadline = time.monotonic() + 30
+    while request(args.port, '/state') is None:
+        if time.monotonic() > deadline or server.poll() is not None:
+            stop_server(server)
+            raise Exception(f'{name} server did not start')
+        time.sleep(0.2)
+    return server
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    # The development server's reloader runs the server in a child process
+    os.killpg(server.pid, signal.SIGTERM)
+    server.wait()
+
+
+def load(args, path: str) -> tuple[float, list[float], int]:
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(
+            lambda _: request(args.port, path, args.timeout),
+            range(args.requests),
+        ))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(result for result in results if result is not None)
+    return elapsed, latencies, len(results) - len(latencies)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return float('nan')
+    return values[int(fraction * (len(values) - 1))]
+
+
+def run(mode: str, args) -> None:
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = start_server(mode, MODES[mode], args, data_dir)
+        try:
+            for stream_count in (0, args.streams):
+                streams = Streams(args.port, stream_count)
+                connected = streams.wait_connected(stream_count, 5)
+                try:
+                    for name, path in ENDPOINTS.items():
+                        elapsed, latencies, failed = load(args, path)
+                        print(
+                            f'{mode:>9} {connected:>4}/{stream_count:<4} {name:>8} '
+                            f'{len(latencies) / elapsed:>8.0f} '
+                            f'{1000 * percentile(latencies, .5):>8.1f} '
+                            f'{1000 * percentile(latencies, .99):>8.1f} {failed:>6}',
+                            flush=True,
+                        )
+                finally:
+                    streams.close()
+        finally:
+            stop_server(server)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=MODES, action='append')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--streams', type=int, default=64)
+    parser.add_argument('--timeout', type=float, default=2, help='seconds before a request fails')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--mqtt-host', default='127.0.0.1')
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--mqtt-topic-prefix', default='benchmark')
+    args = parser.parse_args()
+
+    publish_state(args)
+    print(f'{"mode":>9} {"streams":>9} {"endpoint":>8} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"failed":>6}')
+    for mode in args.mode or MODES:
+        run(mode, args)
+
+
+if __name__ == '__main__':
+    main()
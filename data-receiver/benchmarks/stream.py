@@ -0,0 +1,188 @@
+"""
+Benchmark of /state/stream with a few hundred clients, on gunicorn with the production settings and
+a single worker.
+
+For each number of --streams, the clients connect, and the memory that the worker needs for each
+connection is taken from its resident set size. Then --states new states are published to the
+broker (by default the one from docker-compose), and the fan-out latency is measured: the time from
+publishing a state until a client receives it. The median and 99th percentile are over all the
+clients and states, the last client is the median over the states of the slowest client.
+
+    python benchmarks/stream.py [--streams N ...] [--states N] [--mqtt-port PORT]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import selectors
+import socket
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client
+import paho.mqtt.enums
+from serve import MODES, percentile, publish_state, request, start_server, stop_server
+
+# serve has put the sources of the data receiver on the path
+import config
+
+EVENT_ID = re.compile(rb'^id: (\w+)$', re.MULTILINE)
+
+
+class TimedStreams:
+    """Clients of /state/stream. A single thread reads them, and notes when each event arrives."""
+
+    def __init__(self, port: int, count: int):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        # The time.perf_counter() at which each client received each event id
+        self.received: dict[bytes, list[float]] = {}
+        self.connected = set()
+        self.running = True
+        for _ in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(b'GET /state/stream HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._read)
+        self.thread.start()
+
+
+    def _read(self) -> None:
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                try:
+                    data = key.fileobj.recv(65536)
+                except OSError:
+                    data = b''
+                if not data:
+                    self.selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    continue
+
+                now = time.perf_counter()
+                with self.lock:
+                    for event_id in EVENT_ID.findall(data):
+                        self.received.setdefault(event_id, []).append(now)
+                        self.connected.add(key.fileobj)
+
+
+    def wait_connected(self, count: int, timeout: float) -> int:
+        deadline = time.monotonic() + timeout
+        while len(self.connected) < count and time.monotonic() < deadline:
+            time.sleep(0.1)
+        return len(self.connected)
+
+
+    def wait_received(self, event_id: bytes, count: int, timeout: float) -> list[float]:
+        deadline = time.monotonic() + timeout
+        while len(self.received.get(event_id, [])) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self.lock:
+            return list(self.received.get(event_id, []))
+
+
+    def close(self) -> None:
+        self.running = False
+        self.thread.join()
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+
+
+def get_worker_pid(server_pid: int) -> int:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with open(f'/proc/{server_pid}/task/{server_pid}/children') as f:
+            children = f.read().split()
+        if children:
+            return int(children[0])
+        time.sleep(0.1)
+    raise Exception('gunicorn did not start a worker')
+
+
+def get_rss(pid: int) -> int:
+    """Return the resident set size of a process in bytes."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    raise Exception(f'No VmRSS for process {pid}')
+
+
+def run(stream_count: int, args) -> None:
+    publisher = paho.mqtt.client.Client(paho.mqtt.enums.CallbackAPIVersion.VERSION2)
+    publisher.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+    publisher.connect(args.mqtt_host, args.mqtt_port)
+    publisher.loop_start()
+    topic = f'{args.mqtt_topic_prefix}/{config.MQTT_TOPIC_STATE}'
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = start_server('gunicorn', MODES['gunicorn'], args, data_dir)
+        try:
+            worker = get_worker_pid(server.pid)
+            for _ in range(100):
+                request(args.port, '/state')
+            rss_before = get_rss(worker)
+
+            streams = TimedStreams(args.port, stream_count)
+            try:
+                connected = streams.wait_connected(stream_count, 30)
+                # Let the worker settle before measuring
+                time.sleep(1)
+                per_connection = (get_rss(worker) - rss_before) / max(connected, 1)
+
+                latencies = []
+                last_client = []
+                missed = 0
+                for i in range(args.states):
+                    payload = json.dumps({'timestamp': time.time(), 'sequence': i}).encode()
+                    event_id = hashlib.sha1(payload).hexdigest().encode()
+                    start = time.perf_counter()
+                    publisher.publish(topic, payload, qos=1, retain=True)
+                    received = streams.wait_received(event_id, connected, 10)
+                    missed += connected - len(received)
+                    latencies.extend(t - start for t in received)
+                    if received:
+                        last_client.append(max(received) - start)
+                    time.sleep(args.interval)
+            finally:
+                streams.close()
+        finally:
+            stop_server(server)
+            publisher.loop_stop()
+            publisher.disconnect()
+
+    latencies.sort()
+    last_client.sort()
+    print(
+        f'{connected:>4}/{stream_count:<4} {per_connection / 1024:>8.1f} '
+        f'{1000 * percentile(latencies, .5):>8.1f} {1000 * percentile(latencies, .99):>8.1f} '
+        f'{1000 * percentile(last_client, .5):>8.1f} {missed:>6}',
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, action='append')
+    parser.add_argument('--states', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between states')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--mqtt-host', default='127.0.0.1')
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--mqtt-topic-prefix', default='benchmark')
+    args = parser.parse_args()
+    # A single worker holds all the streams, so its memory can be measured
+    os.environ['DATA_RECEIVER_WORKERS'] = '1'
+
+    publish_state(args)
+    print(f'{"streams":>9} {"KB/conn":>8} {"p50 ms":>8} {"p99 ms":>8} {"last ms":>8} {"missed":>6}')
+    for stream_count in args.streams or (100, 300, 500):
+        run(stream_count, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""
+The server, for the benchmarks that run it with the development server or gunicorn. Its data is
+kept in BENCHMARK_DATA_DIR, and it connects to the broker at BENCHMARK_MQTT_HOST:BENCHMARK_MQTT_PORT,
+under BENCHMARK_MQTT_TOPIC_PREFIX, so that it doesn't interfere with a running controller.
+"""
+
+import os
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src' / 'data-receiver'))
+
+from app import app  # noqa: E402
+
+DATA_DIR = pathlib.Path(os.environ['BENCHMARK_DATA_DIR'])
+app.config.update(
+    DATA_DIR=DATA_DIR,
+    RECENT_REPORTS_PATH=DATA_DIR / 'recent_reports.sqlite',
+    HISTORY_PATH=DATA_DIR / 'history.sqlite',
+    MQTT_HOST=os.environ['BENCHMARK_MQTT_HOST'],
+    MQTT_PORT=int(os.environ['BENCHMARK_MQTT_PORT']),
+    MQTT_TOPIC_PREFIX=os.environ['BENCHMARK_MQTT_TOPIC_PREFIX'],
+)
+
+from server import app  # noqa: E402, F811
@@ -0,0 +1,28 @@
+"""
+The benchmark server of wsgi.py, but publishing every report with paho.mqtt.publish.single(), as the
+data receiver did before it shared one MQTT connection: a new connection per /report request.
+"""
+
+from paho.mqtt import publish
+from wsgi import app
+
+# wsgi has configured the app before importing the server
+import server  # noqa: E402
+
+
+def publish_single(topic: str, payload: str, retain: bool = False) -> None:
+    publish.single(
+        server.mqtt_client.prefix_topic(topic),
+        payload,
+        retain=retain,
+        hostname=app.config['MQTT_HOST'],
+        port=app.config['MQTT_PORT'],
+        client_id=app.config['MQTT_CLIENT_ID'],
+        auth={
+            'username': app.config['MQTT_USERNAME'],
+            'password': app.config['MQTT_PASSWORD'],
+        },
+    )
+
+
+server.mqtt_client.publish = publish_single
@@ -1,7 +1,11 @@
+import pathlib
 from datetime import timedelta
 
 STATION_ID = 'biotope-serre'
 STATION_KEY = 'biotope9000'
+# State that should survive a restart, or that is shared between server processes, is stored here.
+# In docker, this is a mounted volume.
+DATA_DIR = pathlib.Path('/data')
 
 
 MQTT_HOST = 'mosquitto'
@@ -12,6 +16,55 @@ MQTT_PASSWORD = '7RPV2vWfD2rJgS9u'
 MQTT_TOPIC_PREFIX = 'weatherstation'
 MQTT_TOPIC_REPORT = 'report'
 MQTT_TOPIC_STATE = 'state'
+# The connection to the broker is shared by all requests. When it is lost, we keep on trying to
+# reconnect, with a delay that doubles from MQTT_RECONNECT_MIN_DELAY up to MQTT_RECONNECT_MAX_DELAY.
+# Meanwhile, up to MQTT_MAX_QUEUED_MESSAGES reports are queued.
+MQTT_RECONNECT_MIN_DELAY = timedelta(seconds=1)
+MQTT_RECONNECT_MAX_DELAY = timedelta(minutes=2)
+MQTT_MAX_QUEUED_MESSAGES = 100
 
 
+# /state is served from the latest state that the controller published. Right after startup, a
+# request waits up to STATE_TIMEOUT for the retained state to arrive. If the client accepts it, the
+# state is sent gzipped.
+STATE_TIMEOUT = timedelta(seconds=5)
+STATE_GZIP = True
+# /state/stream pushes every new state as a Server-Sent Event. When nothing changed for
+# STATE_STREAM_KEEPALIVE, we send a comment, so that dead connections are noticed.
+STATE_STREAM_KEEPALIVE = timedelta(seconds=15)
+
+
+# Every report is extended with metrics over rolling windows of past reports: the rain in the past
+# RAIN_EVENT_DURATION and RAIN_DAY_DURATION, the maximum wind gust in the past
+# WIND_GUST_MAX_DURATION, and the temperature trend (˚C/hour) over TEMPERATURE_TREND_DURATION.
 RAIN_EVENT_DURATION = timedelta(hours=1)
+RAIN_DAY_DURATION = timedelta(hours=24)
+WIND_GUST_MAX_DURATION = timedelta(minutes=10)
+TEMPERATURE_TREND_DURATION = timedelta(minutes=30)
+RECENT_REPORTS_PATH = DATA_DIR / 'recent_reports.sqlite'
+
+
+# The numeric values of all reports and states are kept in a history. To spare the SD card, samples
+# are written in batches, every HISTORY_FLUSH_INTERVAL or once HISTORY_FLUSH_SIZE samples are
+# buffered. Raw samples are kept for HISTORY_RAW_RETENTION. HISTORY_AGGREGATES maps each resolution
+# of the aggregates to how long they are kept (None is forever). Expired data is deleted every
+# HISTORY_PRUNE_INTERVAL.
+HISTORY_PATH = DATA_DIR / 'history.sqlite'
+HISTORY_FLUSH_INTERVAL = timedelta(minutes=5)
+HISTORY_FLUSH_SIZE = 5000
+HISTORY_RAW_RETENTION = timedelta(days=1)
+HISTORY_AGGREGATES = {
+    timedelta(minutes=1): timedelta(days=30),
+    timedelta(hours=1): timedelta(days=2 * 365),
+    timedelta(days=1): None,
+}
+HISTORY_PRUNE_INTERVAL = timedelta(hours=1)
+# /history returns buckets of HISTORY_DEFAULT_RESOLUTION over HISTORY_DEFAULT_RANGE, unless asked
+# otherwise, and at most HISTORY_MAX_BUCKETS per series. Buckets are computed in chunks of
+# HISTORY_CHUNK_SIZE buckets, and up to HISTORY_CACHE_SIZE chunks that are completely in the past
+# are cached.
+HISTORY_DEFAULT_RESOLUTION = timedelta(hours=1)
+HISTORY_DEFAULT_RANGE = timedelta(days=1)
+HISTORY_MAX_BUCKETS = 10000
+HISTORY_CHUNK_SIZE = 256
+HISTORY_CACHE_SIZE = 1000
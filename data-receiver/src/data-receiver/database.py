@@ -0,0 +1,53 @@
+import contextlib
+import os
+import pathlib
+import sqlite3
+import threading
+import typing
+
+
+class Database:
+    """
+    A connection to an SQLite database that is shared by all threads of a server process, one at a
+    time.
+
+    Under gunicorn's gevent worker, every request runs in its own greenlet, and threading.local()
+    is local to each greenlet, so a connection per thread would be a new connection per request.
+    Worse, a request that waits for the database lock of another request would block in SQLite's
+    busy handler, which stalls every greenlet of the worker. Instead, requests wait for each other
+    on `lock`, which gevent patches to yield to the other greenlets. Only writes from other
+    processes can still make SQLite wait, and those are short.
+
+    The connection is opened again after a fork, so a forked process never shares the connection
+    of its parent.
+    """
+
+    path: pathlib.Path
+    lock: threading.RLock
+    connection: sqlite3.Connection | None = None
+    # The process that opened the connection
+    pid: int | None = None
+
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.lock = threading.RLock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+
+    @contextlib.contextmanager
+    def connect(self) -> typing.Iterator[sqlite3.Connection]:
+        """Use the connection of this process, while no other thread uses it."""
+        with self.lock:
+            if self.connection is None or self.pid != os.getpid():
+                connection = sqlite3.connect(
+                    self.path,
+                    timeout=10,
+                    isolation_level=None,
+                    check_same_thread=False,
+                )
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                self.connection = connection
+                self.pid = os.getpid()
+            yield self.connection
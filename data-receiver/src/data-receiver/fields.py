@@ -1,15 +1,12 @@
+# The value that the weather station sends for a sensor that isn't available
+MISSING_VALUE = '-9999'
+
+
 class Base:
     def __init__(self, name):
         self.name = name
 
 
-    def get_value(self, request):
-        data = request.args.get(self.name, None)
-        if data is None or data == '-9999':
-            raise ValueError(f'Parameter {self.name} not found')
-        return self.parse(data)
-
-
     def parse(self, data):
         return data
 
@@ -78,3 +75,34 @@ class Battery(Base):
             return 'low'
         else:
             return ''
+
+
+class Schema:
+    """
+    Parses all fields of a request in a single pass over its parameters. Stations regularly omit
+    fields, so missing and invalid fields are returned as lists of keys instead of being raised.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        # Look up the report key and parser of each request parameter in one go
+        self.parsers = {field.name: (key, field.parse) for key, field in fields.items()}
+
+
+    def parse(self, args):
+        """Return the parsed report, the keys of the missing fields and the keys of invalid fields."""
+        report = {}
+        invalid = []
+        for name, data in args.items():
+            parser = self.parsers.get(name)
+            if parser is None or data == MISSING_VALUE:
+                continue
+
+            key, parse = parser
+            try:
+                report[key] = parse(data)
+            except (TypeError, ValueError):
+                invalid.append(key)
+
+        missing = [key for key in self.fields if key not in report and key not in invalid]
+        return report, missing, invalid
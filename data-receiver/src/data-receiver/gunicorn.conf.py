@@ -0,0 +1,13 @@
+# Production settings for gunicorn, which picks up this file from the working directory. Send
+# SIGHUP to the master process (s6-svc -h) to gracefully reload the workers.
+import os
+
+bind = '0.0.0.0:5000'
+workers = int(os.environ.get('DATA_RECEIVER_WORKERS', 2))
+# Every /state/stream client stays connected, so each connection is served by a greenlet instead of
+# a thread from a small pool: streams can't starve /report, /state and /history. gevent patches
+# sockets, locks and sleeps, including those of the MQTT and history threads. The SQLite and numpy
+# work of a request is short enough to run on the event loop.
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('DATA_RECEIVER_CONNECTIONS', 1000))
+graceful_timeout = 10
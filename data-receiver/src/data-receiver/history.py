@@ -0,0 +1,295 @@
+import atexit
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+import typing
+from datetime import timedelta
+
+import numpy as np
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def get_values(data: dict, prefix: str, exclude: typing.Collection[str] = ()) -> dict[str, float]:
+    """
+    Return the numeric values in a (nested) report or state, keyed by their dotted path, e.g.
+    `state.roofs.north.position`. Strings and missing values are left out, as well as keys in
+    `exclude`, at any depth.
+    """
+    values = {}
+    for key, value in data.items():
+        if key in exclude:
+            continue
+        name = f'{prefix}.{key}'
+        if isinstance(value, dict):
+            values.update(get_values(value, name, exclude))
+        elif isinstance(value, (int, float)):
+            values[name] = float(value)
+    return values
+
+
+class History:
+    """
+    A time series store for the reports and states, in an SQLite database that is shared by all
+    server processes.
+
+    The store is written to an SD card, so samples are buffered in memory, and written in one
+    transaction every `flush_interval`, or once `flush_size` samples are buffered. Raw samples are
+    kept for `raw_retention`. While they are written, they are also added to aggregates (count,
+    total, minimum and maximum) over buckets of each resolution in `aggregates`, which are kept for
+    the retention that goes with the resolution, or forever if that is None. Buckets are aligned to
+    UTC.
+
+    A sample that is already stored is ignored, so the same state can safely be added by every
+    server process.
+    """
+
+    path: pathlib.Path
+    raw_retention: timedelta
+    aggregates: dict[timedelta, timedelta | None]
+    flush_interval: timedelta
+    flush_size: int
+    prune_interval: timedelta
+
+    # The buffered (series name, timestamp, value) samples
+    samples: list[tuple[str, float, float]]
+    lock: threading.Lock
+    flush_event: threading.Event
+    flush_thread: threading.Thread
+    database: Database
+    series_ids: dict[str, int]
+    last_prune: float = 0
+
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        raw_retention: timedelta,
+        aggregates: dict[timedelta, timedelta | None],
+        flush_interval: timedelta,
+        flush_size: int,
+        prune_interval: timedelta,
+    ):
+        self.path = path
+        self.raw_retention = raw_retention
+        self.aggregates = aggregates
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.prune_interval = prune_interval
+
+        self.samples = []
+        self.lock = threading.Lock()
+        self.database = Database(path)
+        self.series_ids = {}
+
+        with self.database.connect() as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS series (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS samples (
+                    series INTEGER NOT NULL,
+                    timestamp REAL NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (series, timestamp)
+                ) WITHOUT ROWID
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS aggregates (
+                    resolution INTEGER NOT NULL,
+                    series INTEGER NOT NULL,
+                    bucket REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    minimum REAL NOT NULL,
+                    maximum REAL NOT NULL,
+                    PRIMARY KEY (resolution, series, bucket)
+                ) WITHOUT ROWID
+            ''')
+
+        self.flush_event = threading.Event()
+        self.flush_thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.flush_thread.start()
+        atexit.register(self.flush)
+
+
+    def add(self, timestamp: float, values: dict[str, float]) -> None:
+        """Buffer a sample of each series in `values`."""
+        with self.lock:
+            self.samples.extend((name, timestamp, value) for name, value in values.items())
+            if len(self.samples) >= self.flush_size:
+                self.flush_event.set()
+
+
+    def _flush_periodically(self) -> None:
+        while True:
+            self.flush_event.wait(self.flush_interval.total_seconds())
+            self.flush_event.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.error(f'Could not write history {self.path}: {e}')
+
+
+    def flush(self) -> None:
+        """Write the buffered samples, and update the aggregates."""
+        with self.lock:
+            samples = self.samples
+            self.samples = []
+        if not samples:
+            return
+
+        with self.database.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                samples = self._insert_samples(connection, samples)
+                self._update_aggregates(connection, samples)
+                now = time.time()
+                if now - self.last_prune >= self.prune_interval.total_seconds():
+                    self._prune(connection, now)
+                    self.last_prune = now
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                # New series ids were rolled back as well
+                self.series_ids = {}
+                raise
+
+
+    def _get_series_id(self, connection: sqlite3.Connection, name: str) -> int:
+        series_id = self.series_ids.get(name)
+        if series_id is None:
+            connection.execute('INSERT OR IGNORE INTO series (name) VALUES (?)', (name,))
+            series_id, = connection.execute(
+                'SELECT id FROM series WHERE name = ?',
+                (name,),
+            ).fetchone()
+            self.series_ids[name] = series_id
+        return series_id
+
+
+    def _insert_samples(
+        self,
+        connection: sqlite3.Connection,
+        samples: list[tuple[str, float, float]],
+    ) -> list[tuple[int, float, float]]:
+        """Insert the samples that aren't stored yet, and return them as (series id, timestamp, value)."""
+        inserted = []
+        for name, timestamp, value in samples:
+            series_id = self._get_series_id(connection, name)
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO samples (series, timestamp, value) VALUES (?, ?, ?)',
+                (series_id, timestamp, value),
+            )
+            if cursor.rowcount:
+                inserted.append((series_id, timestamp, value))
+        return inserted
+
+
+    def _update_aggregates(
+        self,
+        connection: sqlite3.Connection,
+        samples: list[tuple[int, float, float]],
+    ) -> None:
+        # Aggregate the samples in memory first, so that each bucket is written once per flush
+        buckets: dict[tuple[int, int, float], list] = {}
+        for resolution in self.aggregates:
+            seconds = int(resolution.total_seconds())
+            for series_id, timestamp, value in samples:
+                key = (seconds, series_id, timestamp - timestamp % seconds)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = [1, value, value, value]
+                else:
+                    bucket[0] += 1
+                    bucket[1] += value
+                    bucket[2] = min(bucket[2], value)
+                    bucket[3] = max(bucket[3], value)
+
+        connection.executemany(
+            '''
+                INSERT INTO aggregates (resolution, series, bucket, count, total, minimum, maximum)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (resolution, series, bucket) DO UPDATE SET
+                    count = count + excluded.count,
+                    total = total + excluded.total,
+                    minimum = min(minimum, excluded.minimum),
+                    maximum = max(maximum, excluded.maximum)
+            ''',
+            (key + tuple(bucket) for key, bucket in buckets.items()),
+        )
+
+
+    def aggregate_resolution(self, resolution: int) -> int | None:
+        """
+        Return the resolution (in seconds) of the coarsest aggregates that divides `resolution`, or
+        None if there are none, and only the raw samples can be split into buckets of `resolution`.
+        """
+        return max(
+            (
+                seconds
+                for seconds in (int(r.total_seconds()) for r in self.aggregates)
+                if resolution % seconds == 0
+            ),
+            default=None,
+        )
+
+
+    def read(self, name: str, resolution: int, start: float, end: float) -> np.ndarray:
+        """
+        Return the data of a series between `start` and `end`, from the aggregates of
+        aggregate_resolution(resolution), or from the raw samples if there are none. The result has
+        a row per bucket or sample, and columns timestamp, count, total, minimum and maximum.
+        Samples that haven't been flushed yet are not included.
+        """
+        aggregate_resolution = self.aggregate_resolution(resolution)
+
+        with self.database.connect() as connection:
+            row = connection.execute('SELECT id FROM series WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return np.empty((0, 5))
+            series_id, = row
+
+            if aggregate_resolution is None:
+                rows = connection.execute(
+                    '''
+                        SELECT timestamp, 1, value, value, value FROM samples
+                        WHERE series = ? AND timestamp >= ? AND timestamp < ?
+                        ORDER BY timestamp
+                    ''',
+                    (series_id, start, end),
+                ).fetchall()
+            else:
+                rows = connection.execute(
+                    '''
+                        SELECT bucket, count, total, minimum, maximum FROM aggregates
+                        WHERE resolution = ? AND series = ? AND bucket >= ? AND bucket < ?
+                        ORDER BY bucket
+                    ''',
+                    (aggregate_resolution, series_id, start, end),
+                ).fetchall()
+
+        return np.array(rows, dtype=float).reshape(-1, 5)
+
+
+    def _prune(self, connection: sqlite3.Connection, now: float) -> None:
+        # Delete per series, so that the deletes are range scans of the primary keys
+        series_ids = [series_id for series_id, in connection.execute('SELECT id FROM series')]
+        for series_id in series_ids:
+            connection.execute(
+                'DELETE FROM samples WHERE series = ? AND timestamp < ?',
+                (series_id, now - self.raw_retention.total_seconds()),
+            )
+            for resolution, retention in self.aggregates.items():
+                if retention is None:
+                    continue
+                connection.execute(
+                    'DELETE FROM aggregates WHERE resolution = ? AND series = ? AND bucket < ?',
+                    (int(resolution.total_seconds()), series_id, now - retention.total_seconds()),
+                )
@@ -0,0 +1,122 @@
+import collections
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from history import History
+
+
+@dataclass(frozen=True)
+class Buckets:
+    """The aggregates of a series over consecutive buckets. Empty buckets are left out."""
+
+    timestamp: np.ndarray
+    count: np.ndarray
+    total: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+    def __getitem__(self, index) -> 'Buckets':
+        return Buckets(
+            self.timestamp[index],
+            self.count[index],
+            self.total[index],
+            self.minimum[index],
+            self.maximum[index],
+        )
+
+
+    @classmethod
+    def concatenate(cls, buckets: list['Buckets']) -> 'Buckets':
+        return cls(
+            np.concatenate([b.timestamp for b in buckets]),
+            np.concatenate([b.count for b in buckets]),
+            np.concatenate([b.total for b in buckets]),
+            np.concatenate([b.minimum for b in buckets]),
+            np.concatenate([b.maximum for b in buckets]),
+        )
+
+
+class HistoryQuery:
+    """
+    Aggregates series of the history over buckets of any resolution (in seconds), with vectorized
+    reductions over the stored data.
+
+    A range is computed in chunks of `chunk_size` buckets. Once a chunk ends more than
+    `immutable_after` ago, all its data has been flushed, and it won't change anymore. Those chunks
+    are kept in an LRU cache of `cache_size` chunks, so that a dashboard that keeps asking for the
+    past month only reads the data of the latest chunk.
+    """
+
+    history: History
+    chunk_size: int
+    cache_size: int
+    immutable_after: float
+    cache: collections.OrderedDict[tuple[str, int, float], Buckets]
+    lock: threading.Lock
+
+
+    def __init__(self, history: History, chunk_size: int, cache_size: int, immutable_after: float):
+        self.history = history
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self.immutable_after = immutable_after
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def aggregate(self, name: str, resolution: int, start: float, end: float) -> Buckets:
+        """Return the buckets of a series from the one that contains `start` up to `end`."""
+        chunk_duration = resolution * self.chunk_size
+        immutable_end = time.time() - self.immutable_after
+
+        chunks = []
+        chunk_start = start - start % chunk_duration
+        while chunk_start < end:
+            chunk_end = chunk_start + chunk_duration
+            key = (name, resolution, chunk_start)
+            with self.lock:
+                chunk = self.cache.get(key)
+                if chunk is not None:
+                    self.cache.move_to_end(key)
+
+            if chunk is None:
+                chunk = self._aggregate(name, resolution, chunk_start, chunk_end)
+                if chunk_end <= immutable_end:
+                    with self.lock:
+                        self.cache[key] = chunk
+                        while len(self.cache) > self.cache_size:
+                            self.cache.popitem(last=False)
+
+            chunks.append(chunk)
+            chunk_start = chunk_end
+
+        buckets = Buckets.concatenate(chunks)
+        return buckets[
+            (buckets.timestamp >= start - start % resolution) & (buckets.timestamp < end)
+        ]
+
+
+    def _aggregate(self, name: str, resolution: int, start: float, end: float) -> Buckets:
+        timestamp, count, total, minimum, maximum = self.history.read(name, resolution, start, end).T
+
+        # The rows are sorted, so the rows of each bucket are consecutive, and each bucket can be
+        # reduced from the index of its first row.
+        index = ((timestamp - start) // resolution).astype(np.int64)
+        firsts = np.flatnonzero(np.diff(index, prepend=-1))
+        if len(firsts) == 0:
+            return Buckets(*(np.empty(0) for _ in range(5)))
+
+        return Buckets(
+            start + index[firsts] * resolution,
+            np.add.reduceat(count, firsts),
+            np.add.reduceat(total, firsts),
+            np.minimum.reduceat(minimum, firsts),
+            np.maximum.reduceat(maximum, firsts),
+        )
@@ -0,0 +1,99 @@
+import logging
+import os
+import typing
+
+import paho.mqtt.client
+import paho.mqtt.enums
+
+logger = logging.getLogger(__name__)
+
+
+class MQTTClient:
+    """
+    A long-lived connection to the broker that is shared by all requests.
+
+    paho's network thread connects in the background, and reconnects with an exponential backoff
+    when the connection is lost. Messages are published with QoS 1, so paho queues them while we're
+    disconnected, and sends them once we're connected again. Subscriptions are renewed on every
+    reconnect, and their callbacks are called on the network thread.
+    """
+
+    topic_prefix: str
+    client: paho.mqtt.client.Client
+    subscriptions: dict[str, list[typing.Callable[[bytes], None]]]
+
+
+    def __init__(self, config):
+        self.topic_prefix = config['MQTT_TOPIC_PREFIX']
+        self.subscriptions = {}
+
+        # Each server process has its own connection, and the broker only allows one connection per
+        # client id.
+        self.client = paho.mqtt.client.Client(
+            paho.mqtt.enums.CallbackAPIVersion.VERSION2,
+            f'{config["MQTT_CLIENT_ID"]}-{os.getpid()}',
+        )
+        self.client.username_pw_set(config['MQTT_USERNAME'], config['MQTT_PASSWORD'])
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(
+            int(config['MQTT_RECONNECT_MIN_DELAY'].total_seconds()),
+            int(config['MQTT_RECONNECT_MAX_DELAY'].total_seconds()),
+        )
+        self.client.max_queued_messages_set(config['MQTT_MAX_QUEUED_MESSAGES'])
+        self.client.connect_async(config['MQTT_HOST'], config['MQTT_PORT'])
+        self.client.loop_start()
+
+
+    def _on_connect(self, client: paho.mqtt.client.Client, userdata, flags, rc, properties):
+        if rc.is_failure:
+            # paho will try again
+            logger.error(f'Failed to connect to MQTT: {rc}')
+            return
+
+        logger.info('Connected to MQTT')
+        for topic in self.subscriptions:
+            self.client.subscribe(topic)
+
+
+    def _on_disconnect(self, client: paho.mqtt.client.Client, userdata, flags, rc, properties):
+        logger.warning(f'Disconnected from MQTT: {rc}')
+
+
+    def _on_message(
+        self,
+        client: paho.mqtt.client.Client,
+        userdata,
+        message: paho.mqtt.client.MQTTMessage,
+    ):
+        for callback in self.subscriptions.get(message.topic, []):
+            callback(message.payload)
+
+
+    def prefix_topic(self, topic: str) -> str:
+        if self.topic_prefix:
+            return f'{self.topic_prefix}/{topic}'
+        else:
+            return topic
+
+
+    def publish(self, topic: str, payload: str, retain: bool = False) -> None:
+        """Queue a message, without waiting for it to be sent."""
+        info = self.client.publish(self.prefix_topic(topic), payload, qos=1, retain=retain)
+        if info.rc == paho.mqtt.enums.MQTTErrorCode.MQTT_ERR_NO_CONN:
+            # paho has queued the message, and will send it once we're reconnected
+            logger.info(f'Not connected to MQTT, queued message on {topic}')
+        elif info.rc != paho.mqtt.enums.MQTTErrorCode.MQTT_ERR_SUCCESS:
+            logger.error(f'Failed to publish on {topic}: {info.rc}')
+
+
+    def subscribe(self, topic: str, callback: typing.Callable[[bytes], None]) -> None:
+        topic = self.prefix_topic(topic)
+        if topic in self.subscriptions:
+            self.subscriptions[topic].append(callback)
+            return
+
+        self.subscriptions[topic] = [callback]
+        if self.client.is_connected():
+            self.client.subscribe(topic)
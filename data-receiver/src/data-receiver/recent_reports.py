@@ -0,0 +1,71 @@
+import json
+import pathlib
+from datetime import timedelta
+
+from database import Database
+
+
+class RecentReports:
+    """
+    The reports of the last `retention`, shared by all server processes through an SQLite
+    database. Each process reads the reports that were added since its previous read, including
+    those added by other processes.
+    """
+
+    path: pathlib.Path
+    retention: timedelta
+    database: Database
+
+
+    def __init__(self, path: pathlib.Path, retention: timedelta):
+        self.path = path
+        self.retention = retention
+        self.database = Database(path)
+
+        with self.database.connect() as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS recent_reports (
+                    id INTEGER PRIMARY KEY,
+                    timestamp REAL NOT NULL,
+                    report TEXT NOT NULL
+                )
+            ''')
+            connection.execute('''
+                CREATE INDEX IF NOT EXISTS recent_reports_timestamp
+                ON recent_reports (timestamp)
+            ''')
+
+
+    def append(self, timestamp: float, report: dict) -> int:
+        """Add a report, and return its id."""
+        with self.database.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = connection.execute(
+                    'INSERT INTO recent_reports (timestamp, report) VALUES (?, ?)',
+                    (timestamp, json.dumps(report)),
+                )
+                connection.execute(
+                    'DELETE FROM recent_reports WHERE timestamp < ?',
+                    (timestamp - self.retention.total_seconds(),),
+                )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+        return cursor.lastrowid
+
+
+    def read(self, after_id: int, until_id: int) -> list[tuple[int, float, dict]]:
+        """Return the (id, timestamp, report) of the reports after `after_id` up to `until_id`."""
+        with self.database.connect() as connection:
+            rows = connection.execute(
+                '''
+                    SELECT id, timestamp, report FROM recent_reports
+                    WHERE id > ? AND id <= ?
+                    ORDER BY id
+                ''',
+                (after_id, until_id),
+            ).fetchall()
+        return [(id, timestamp, json.loads(report)) for id, timestamp, report in rows]
@@ -0,0 +1,183 @@
+import collections
+import threading
+from datetime import timedelta
+
+
+class Base:
+    """
+    A metric over the values of a report field in a rolling time window. Adding a value and getting
+    the metric both take amortised O(1): every value is added once and evicted once.
+
+    Reports of several server processes can arrive slightly out of order. A late value is inserted
+    where its timestamp belongs, which costs O(1) per newer value that it is inserted before.
+    """
+
+    def __init__(self, field: str, duration: timedelta):
+        self.field = field
+        self.duration = duration
+
+
+    def add(self, timestamp: float, report: dict):
+        value = report.get(self.field)
+        if value is not None:
+            self.add_value(timestamp, value)
+
+
+    def get(self, now: float):
+        self.evict(now - self.duration.total_seconds())
+        return self.get_value()
+
+
+    def add_value(self, timestamp: float, value: float):
+        raise NotImplementedError
+
+    def evict(self, start: float):
+        raise NotImplementedError
+
+    def get_value(self):
+        raise NotImplementedError
+
+
+def find_position(values: collections.deque, timestamp: float) -> int:
+    """Return the index in `values`, ordered by timestamp, where a value of `timestamp` belongs."""
+    index = len(values)
+    while index and values[index - 1][0] > timestamp:
+        index -= 1
+    return index
+
+
+class Change(Base):
+    """How much a cumulative counter (e.g. total rain) increased within the window."""
+
+    def __init__(self, field, duration):
+        super().__init__(field, duration)
+        self.values = collections.deque()
+
+
+    def add_value(self, timestamp, value):
+        self.values.insert(find_position(self.values, timestamp), (timestamp, value))
+
+    def evict(self, start):
+        while self.values and self.values[0][0] < start:
+            self.values.popleft()
+
+    def get_value(self):
+        if not self.values:
+            return None
+        return self.values[-1][1] - self.values[0][1]
+
+
+class Max(Base):
+    """
+    The maximum within the window. We keep a monotonic deque: a value that is smaller than a newer
+    value can never be the maximum again, so it is dropped right away.
+    """
+
+    def __init__(self, field, duration):
+        super().__init__(field, duration)
+        self.values = collections.deque()
+
+
+    def add_value(self, timestamp, value):
+        index = find_position(self.values, timestamp)
+        # A late value that is smaller than a newer one is dropped like the older values
+        if index < len(self.values) and self.values[index][1] >= value:
+            return
+        while index and self.values[index - 1][1] <= value:
+            del self.values[index - 1]
+            index -= 1
+        self.values.insert(index, (timestamp, value))
+
+    def evict(self, start):
+        while self.values and self.values[0][0] < start:
+            self.values.popleft()
+
+    def get_value(self):
+        if not self.values:
+            return None
+        return self.values[0][1]
+
+
+class Trend(Base):
+    """
+    The least-squares slope of the values within the window, per hour. We keep running sums, which
+    are updated when a value enters or leaves the window. Timestamps are taken relative to an origin
+    within the window, to keep the sums small enough for floats: once the oldest value is more than a
+    window past the origin, the sums are recomputed relative to that value. This happens at most
+    once per window of values, so it stays amortised O(1), and it also clears the rounding errors.
+    """
+
+    def __init__(self, field, duration):
+        super().__init__(field, duration)
+        self.values = collections.deque()
+        self.origin = None
+        self._reset()
+
+
+    def add_value(self, timestamp, value):
+        if self.origin is None:
+            self.origin = timestamp
+        t = (timestamp - self.origin) / 3600
+        # The sums don't depend on the order, but the eviction does
+        self.values.insert(find_position(self.values, timestamp), (timestamp, value))
+        self._update(t, value, 1)
+
+    def evict(self, start):
+        while self.values and self.values[0][0] < start:
+            timestamp, value = self.values.popleft()
+            self._update((timestamp - self.origin) / 3600, value, -1)
+
+        if not self.values:
+            self.origin = None
+            self._reset()
+        elif self.values[0][0] - self.origin > self.duration.total_seconds():
+            self._rebase()
+
+    def _reset(self):
+        self.n = 0
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = 0.
+
+    def _rebase(self):
+        self.origin = self.values[0][0]
+        self._reset()
+        for timestamp, value in self.values:
+            self._update((timestamp - self.origin) / 3600, value, 1)
+
+    def _update(self, t, value, sign):
+        self.n += sign
+        self.sum_t += sign * t
+        self.sum_v += sign * value
+        self.sum_tt += sign * t * t
+        self.sum_tv += sign * t * value
+
+    def get_value(self):
+        denominator = self.n * self.sum_tt - self.sum_t * self.sum_t
+        if self.n < 2 or denominator <= 1e-12:
+            return None
+        return (self.n * self.sum_tv - self.sum_t * self.sum_v) / denominator
+
+
+class ReportWindows:
+    """
+    Keeps a set of windows up to date with all reports, including the ones that other server
+    processes received. The reports are shared through RecentReports: every process reads each
+    report once, so the cost per report stays O(1).
+    """
+
+    def __init__(self, recent_reports, windows: dict[str, Base]):
+        self.recent_reports = recent_reports
+        self.windows = windows
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+
+    def add(self, timestamp: float, report: dict) -> dict:
+        """Add a report, and return the metric of each window at the time of the report."""
+        with self.lock:
+            report_id = self.recent_reports.append(timestamp, report)
+            for _, past_timestamp, past_report in self.recent_reports.read(self.last_id, report_id):
+                for window in self.windows.values():
+                    window.add(past_timestamp, past_report)
+            self.last_id = report_id
+
+            return {key: window.get(timestamp) for key, window in self.windows.items()}
@@ -2,13 +2,76 @@ import json
 from datetime import datetime
 
 import fields
+import history
+import numpy as np
+import rolling_windows
 from app import app
-from flask import abort, request
-from paho.mqtt import publish, subscribe
+from flask import abort, jsonify, request
+from history_query import HistoryQuery
+from mqtt_client import MQTTClient
+from recent_reports import RecentReports
+from state_cache import StateCache
 
-from . import config
+mqtt_client = MQTTClient(app.config)
+state_cache = StateCache()
+mqtt_client.subscribe(app.config['MQTT_TOPIC_STATE'], state_cache.update)
 
-past_reports = []
+report_history = history.History(
+    app.config['HISTORY_PATH'],
+    app.config['HISTORY_RAW_RETENTION'],
+    app.config['HISTORY_AGGREGATES'],
+    app.config['HISTORY_FLUSH_INTERVAL'],
+    app.config['HISTORY_FLUSH_SIZE'],
+    app.config['HISTORY_PRUNE_INTERVAL'],
+)
+history_query = HistoryQuery(
+    report_history,
+    app.config['HISTORY_CHUNK_SIZE'],
+    app.config['HISTORY_CACHE_SIZE'],
+    # Other server processes may still hold samples that they haven't flushed yet
+    2 * app.config['HISTORY_FLUSH_INTERVAL'].total_seconds(),
+)
+
+
+# The sections of the state that are stored in the history. The others only hold timestamps and
+# configuration.
+STATE_HISTORY_SECTIONS = ('metrics', 'weather_report', 'roofs')
+# Timestamps within those sections, which aren't useful as a series
+STATE_HISTORY_EXCLUDED_KEYS = {'timestamp', 'last_verification'}
+
+
+def parse_state_timestamp(value) -> float:
+    """The controller sends timestamps as seconds since the epoch, older versions as ISO 8601."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def add_state_to_history(payload):
+    try:
+        state = json.loads(payload)
+        timestamp = parse_state_timestamp(state['timestamp'])
+    except (ValueError, KeyError, TypeError) as e:
+        app.logger.warning(f'Not adding state to the history: {e!r}')
+        return
+
+    values = {}
+    for section in STATE_HISTORY_SECTIONS:
+        if isinstance(state.get(section), dict):
+            values.update(history.get_values(
+                state[section],
+                f'state.{section}',
+                exclude=STATE_HISTORY_EXCLUDED_KEYS,
+            ))
+    # The mean of these series is the fraction of the time that a roof was open
+    for orientation, roof in state.get('roofs', {}).items():
+        if roof.get('position') is not None:
+            values[f'state.roofs.{orientation}.open'] = float(roof['position'] > 0)
+    report_history.add(timestamp, values)
+
+
+mqtt_client.subscribe(app.config['MQTT_TOPIC_STATE'], add_state_to_history)
 
 
 def authorize():
@@ -19,7 +82,7 @@ def authorize():
         abort(403)
 
 
-report_fields = {
+report_schema = fields.Schema({
     'outdoor_temperature': fields.Temperature('tempf'),
     'outdoor_humidity': fields.Humidity('humidity'),
     'outdoor_dewpoint': fields.Temperature('dewptf'),
@@ -38,69 +101,77 @@ report_fields = {
     'indoor_humidity': fields.Humidity('indoorhumidity'),
     'indoor_pressure': fields.Pressure('baromin'),
     'battery': fields.Battery('lowbatt'),
+})
+
+
+derived_fields = {
+    'outdoor_rain_event': rolling_windows.Change(
+        'outdoor_rain_total',
+        app.config['RAIN_EVENT_DURATION'],
+    ),
+    'outdoor_rain_day': rolling_windows.Change(
+        'outdoor_rain_total',
+        app.config['RAIN_DAY_DURATION'],
+    ),
+    'outdoor_wind_gust_max': rolling_windows.Max(
+        'outdoor_wind_gust',
+        app.config['WIND_GUST_MAX_DURATION'],
+    ),
+    'indoor_temperature_trend': rolling_windows.Trend(
+        'indoor_temperature',
+        app.config['TEMPERATURE_TREND_DURATION'],
+    ),
+    'outdoor_temperature_trend': rolling_windows.Trend(
+        'outdoor_temperature',
+        app.config['TEMPERATURE_TREND_DURATION'],
+    ),
 }
 
+# The server may run in several processes, so the reports are kept in shared storage
+recent_reports = RecentReports(
+    app.config['RECENT_REPORTS_PATH'],
+    max(window.duration for window in derived_fields.values()),
+)
+report_windows = rolling_windows.ReportWindows(recent_reports, derived_fields)
+
 
 def get_report(request):
-    report = {}
-    for key, field in report_fields.items():
-        try:
-            report[key] = field.get_value(request)
-        except Exception as e:
-            app.logger.exception(e)
+    report, missing, invalid = report_schema.parse(request.args)
+    if missing:
+        app.logger.debug(f'Missing fields: {", ".join(missing)}')
+    if invalid:
+        app.logger.warning(f'Invalid fields: {", ".join(invalid)}')
 
     now = datetime.now()
     report['timestamp'] = now.isoformat()
-    past_reports.insert(0, report)
 
-    while now - datetime.fromisoformat(past_reports[-1]['timestamp']) > config.RAIN_EVENT_DURATION:
-        past_reports.pop()
+    for key, value in report_windows.add(now.timestamp(), report).items():
+        if value is not None:
+            report[key] = round(value, 2)
 
-    rain_total = report.get('outdoor_rain_total', None)
-    past_rain_total = past_reports[-1].get('outdoor_rain_total', None)
-    if rain_total is not None and past_rain_total is not None:
-        report['outdoor_rain_event'] = rain_total - past_rain_total
+    report_history.add(now.timestamp(), history.get_values(report, 'report'))
 
     return report
 
 
 def publish_report(report):
     payload = json.dumps(report)
-    topic = app.config['MQTT_TOPIC_REPORT']
-    if app.config['MQTT_TOPIC_PREFIX']:
-        topic = app.config['MQTT_TOPIC_PREFIX'] +'/' + topic
-
-    publish.single(
-        topic,
-        payload,
-        hostname=app.config['MQTT_HOST'],
-        port=app.config['MQTT_PORT'],
-        client_id=app.config['MQTT_CLIENT_ID'],
-        auth={
-            'username': app.config['MQTT_USERNAME'],
-            'password': app.config['MQTT_PASSWORD'],
-        },
-    )
-
+    mqtt_client.publish(app.config['MQTT_TOPIC_REPORT'], payload)
 
-def get_state():
-    topic = app.config['MQTT_TOPIC_STATE']
-    if app.config['MQTT_TOPIC_PREFIX']:
-        topic = app.config['MQTT_TOPIC_PREFIX'] +'/' + topic
 
-    mqtt_message = subscribe.simple(
-        topic,
-        hostname=app.config['MQTT_HOST'],
-        port=app.config['MQTT_PORT'],
-        client_id=app.config['MQTT_CLIENT_ID'],
-        auth={
-            'username': app.config['MQTT_USERNAME'],
-            'password': app.config['MQTT_PASSWORD'],
-        },
+def get_state_response(state):
+    gzip = app.config['STATE_GZIP'] and request.accept_encodings['gzip'] > 0
+    response = app.response_class(
+        state.gzipped_body if gzip else state.body,
+        mimetype='application/json',
     )
-
-    state = json.loads(mqtt_message.payload)
-    return state
+    if gzip:
+        response.content_encoding = 'gzip'
+        response.set_etag(state.gzipped_etag)
+    else:
+        response.set_etag(state.etag)
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
 
 
 @app.route('/report', methods=['GET'])
@@ -113,11 +184,103 @@ def report():
     return 'OK'
 
 
+def stream_states(last_event_id):
+    keepalive = app.config['STATE_STREAM_KEEPALIVE'].total_seconds()
+    state = None
+    while True:
+        new_state = state_cache.wait_for_change(state, keepalive)
+        if new_state is state:
+            yield b': keepalive\n\n'
+            continue
+
+        state = new_state
+        # A client that reconnects tells us which state it saw last
+        if state.etag != last_event_id:
+            yield state.event
+
+
 @app.route('/state', methods=['GET'])
 def state():
-    state = get_state()
-    app.logger.debug('Get state: {state}')
-    return state
+    state = state_cache.get(app.config['STATE_TIMEOUT'].total_seconds())
+    if state is None:
+        abort(503)
+    return get_state_response(state)
+
+
+@app.route('/state/stream', methods=['GET'])
+def state_stream():
+    return app.response_class(
+        stream_states(request.headers.get('Last-Event-ID')),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Don't let a reverse proxy buffer the events
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+
+def parse_timestamp(name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (ValueError, OverflowError, OSError):
+        abort(400, f'Invalid {name}: {value}')
+
+
+def parse_resolution():
+    value = request.args.get('resolution')
+    if value is None:
+        return int(app.config['HISTORY_DEFAULT_RESOLUTION'].total_seconds())
+    try:
+        resolution = int(value)
+    except ValueError:
+        abort(400, f'Invalid resolution: {value}')
+    if resolution <= 0:
+        abort(400, f'Invalid resolution: {value}')
+    return resolution
+
+
+@app.route('/history', methods=['GET'])
+def get_history():
+    names = request.args.getlist('series')
+    if not names:
+        abort(400, 'No series given')
+
+    resolution = parse_resolution()
+    end = parse_timestamp('end', datetime.now().timestamp())
+    start = parse_timestamp('start', end - app.config['HISTORY_DEFAULT_RANGE'].total_seconds())
+    if start >= end:
+        abort(400, 'Invalid range: start must be before end')
+    if (end - start) / resolution > app.config['HISTORY_MAX_BUCKETS']:
+        abort(400, 'Too many buckets')
+    # Without aggregates to build them from, the buckets can only come from the raw samples, which
+    # don't go back far
+    raw_start = datetime.now().timestamp() - app.config['HISTORY_RAW_RETENTION'].total_seconds()
+    if report_history.aggregate_resolution(resolution) is None and start < raw_start:
+        finest = min(int(r.total_seconds()) for r in app.config['HISTORY_AGGREGATES'])
+        abort(400, f'Invalid resolution: {resolution}, must be a multiple of {finest} for ranges '
+            'that go back further than the raw samples')
+
+    series = {}
+    for name in names:
+        buckets = history_query.aggregate(name, resolution, start, end)
+        series[name] = {
+            'timestamp': buckets.timestamp.astype(np.int64).tolist(),
+            'count': buckets.count.astype(np.int64).tolist(),
+            'min': buckets.minimum.tolist(),
+            'mean': np.round(buckets.total / buckets.count, 3).tolist(),
+            'max': buckets.maximum.tolist(),
+        }
+
+    return jsonify({
+        'resolution': resolution,
+        'start': start,
+        'end': end,
+        'series': series,
+    })
 
 
 app.logger.info('Server started')
@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedState:
+    body: bytes
+    gzipped_body: bytes
+    # Each encoding of the body has its own strong etag
+    etag: str
+    gzipped_etag: str
+    # The state as a Server-Sent Event, with the etag as event id
+    event: bytes
+
+
+class StateCache:
+    """
+    Holds the latest state that the controller published, ready to be served: the state is only
+    serialized, compressed and hashed once, when it arrives, instead of on every request.
+
+    Streaming requests wait on a single condition, so a new state is pushed to all of them at
+    once.
+    """
+
+    state: CachedState | None = None
+    condition: threading.Condition
+
+
+    def __init__(self):
+        self.condition = threading.Condition()
+
+
+    def update(self, payload: bytes) -> None:
+        try:
+            json.loads(payload)
+        except ValueError:
+            logger.error(f'Ignoring invalid state: {payload!r}')
+            return
+
+        etag = hashlib.sha1(payload).hexdigest()
+        event = f'id: {etag}\n'.encode()
+        for line in payload.splitlines():
+            event += b'data: ' + line + b'\n'
+        event += b'\n'
+
+        state = CachedState(
+            body=payload,
+            gzipped_body=gzip.compress(payload),
+            etag=etag,
+            gzipped_etag=f'{etag}-gzip',
+            event=event,
+        )
+        with self.condition:
+            self.state = state
+            self.condition.notify_all()
+
+
+    def get(self, timeout: float) -> CachedState | None:
+        """Return the latest state. Right after startup, wait up to `timeout` for it to arrive."""
+        return self.wait_for_change(None, timeout)
+
+
+    def wait_for_change(self, state: CachedState | None, timeout: float) -> CachedState | None:
+        """Wait up to `timeout` for a state other than `state`, and return the latest state."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.state is not state, timeout)
+            return self.state
@@ -0,0 +1,35 @@
+import atexit
+import pathlib
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'src' / 'data-receiver'))
+
+from app import app  # noqa: E402
+
+# The server sets up its stores when it is imported, so the config must be changed before that
+DATA_DIR = pathlib.Path(tempfile.mkdtemp())
+# Registered before the server's own exit handlers, so that it runs after them
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+app.config.update(
+    DATA_DIR=DATA_DIR,
+    RECENT_REPORTS_PATH=DATA_DIR / 'recent_reports.sqlite',
+    HISTORY_PATH=DATA_DIR / 'history.sqlite',
+    # Nothing listens on port 9, so the MQTT client just keeps on trying to connect in the background
+    MQTT_HOST='127.0.0.1',
+    MQTT_PORT=9,
+)
+
+
+@pytest.fixture
+def server():
+    import server
+    return server
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
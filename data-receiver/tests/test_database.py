@@ -0,0 +1,37 @@
+import os
+import threading
+
+from database import Database
+
+
+def test_threads_share_one_connection(tmp_path):
+    database = Database(tmp_path / 'database.sqlite')
+    with database.connect() as connection:
+        connection.execute('CREATE TABLE numbers (number INTEGER)')
+
+    connections = []
+    def insert(number):
+        with database.connect() as connection:
+            connection.execute('INSERT INTO numbers VALUES (?)', (number,))
+            connections.append(connection)
+    threads = [threading.Thread(target=insert, args=(number,)) for number in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(connection) for connection in connections}) == 1
+    with database.connect() as connection:
+        assert connection is connections[0]
+        assert connection.execute('SELECT COUNT(*) FROM numbers').fetchone() == (10,)
+
+
+def test_forked_process_opens_its_own_connection(tmp_path, monkeypatch):
+    database = Database(tmp_path / 'database.sqlite')
+    with database.connect() as parent_connection:
+        pass
+
+    pid = os.getpid()
+    monkeypatch.setattr(os, 'getpid', lambda: pid + 1)
+    with database.connect() as child_connection:
+        assert child_connection is not parent_connection
@@ -0,0 +1,90 @@
+import logging
+import types
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import fields
+
+SCHEMA = fields.Schema({
+    'outdoor_temperature': fields.Temperature('tempf'),
+    'outdoor_humidity': fields.Humidity('humidity'),
+    'outdoor_wind_direction': fields.WindDirection('winddir'),
+    'outdoor_wind_speed': fields.WindSpeed('windspeedmph'),
+    'outdoor_rain': fields.Rain('rainin'),
+    'outdoor_solar_radiation': fields.SolarRadiation('solarradiation'),
+    'outdoor_uv': fields.UV('UV'),
+    'indoor_pressure': fields.Pressure('baromin'),
+    'battery': fields.Battery('lowbatt'),
+})
+
+
+def test_units_are_converted():
+    report, missing, invalid = SCHEMA.parse(MultiDict({
+        'tempf': '68.9',
+        'humidity': '45',
+        'winddir': '270',
+        'windspeedmph': '10.3',
+        'rainin': '0.51',
+        'solarradiation': '312.5',
+        'UV': '3',
+        'baromin': '29.92',
+        'lowbatt': '1',
+    }))
+    # The same values as the conversions of the field-by-field parser
+    assert report == {
+        'outdoor_temperature': 20.5,
+        'outdoor_humidity': 45,
+        'outdoor_wind_direction': 270,
+        'outdoor_wind_speed': 17.0,
+        'outdoor_rain': 13.0,
+        'outdoor_solar_radiation': 312.5,
+        'outdoor_uv': 3.0,
+        'indoor_pressure': 1013.2,
+        'battery': 'low',
+    }
+    assert missing == []
+    assert invalid == []
+
+
+def test_missing_fields():
+    report, missing, invalid = SCHEMA.parse(MultiDict({
+        'ID': 'station',
+        'tempf': '50',
+        'humidity': fields.MISSING_VALUE,
+        'lowbatt': '0',
+    }))
+    assert report == {'outdoor_temperature': 10.0, 'battery': ''}
+    assert missing == [
+        'outdoor_humidity',
+        'outdoor_wind_direction',
+        'outdoor_wind_speed',
+        'outdoor_rain',
+        'outdoor_solar_radiation',
+        'outdoor_uv',
+        'indoor_pressure',
+    ]
+    assert invalid == []
+
+
+@pytest.mark.parametrize('args', [
+    {'tempf': 'warm', 'humidity': '4.5', 'lowbatt': ''},
+    # Not from a query string, but a parser must not raise on these either
+    {'tempf': None, 'humidity': [45], 'lowbatt': {}},
+])
+def test_invalid_fields(args):
+    report, missing, invalid = SCHEMA.parse(args)
+    assert report == {}
+    assert invalid == ['outdoor_temperature', 'outdoor_humidity', 'battery']
+    assert 'outdoor_temperature' not in missing
+
+
+def test_invalid_fields_are_logged_without_traceback(server, caplog):
+    request = types.SimpleNamespace(args=MultiDict({'tempf': 'warm', 'humidity': '45'}))
+    with caplog.at_level(logging.DEBUG):
+        report = server.get_report(request)
+
+    assert report['outdoor_humidity'] == 45
+    assert 'outdoor_temperature' not in report
+    assert any('outdoor_temperature' in record.getMessage() for record in caplog.records)
+    assert all(record.exc_info is None for record in caplog.records)
@@ -0,0 +1,77 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Recent enough that the aggregates aren't pruned
+START = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+
+
+@pytest.mark.parametrize('query', [
+    'resolution=abc',
+    'resolution=1.5',
+    'resolution=0',
+    'resolution=-60',
+    'start=yesterday',
+    'end=0001-01-01',
+    'start=2024-06-02T00:00:00%2B00:00&end=2024-06-01T00:00:00%2B00:00',
+    'start=2024-01-01T00:00:00%2B00:00&end=2024-06-01T00:00:00%2B00:00&resolution=60',
+])
+def test_invalid_parameters(client, query):
+    response = client.get(f'/history?series=state.roofs.north.open&{query}')
+    assert response.status_code == 400
+
+
+def test_no_series(client):
+    assert client.get('/history').status_code == 400
+
+
+def test_roofs_open_fraction(server, client):
+    # The north roof is open for 15 of every 60 minutes
+    for minute in range(24 * 60):
+        state = {
+            'timestamp': (START + timedelta(minutes=minute)).timestamp(),
+            'roofs': {'north': {'position': 0.3 if minute % 60 < 15 else 0}},
+        }
+        server.add_state_to_history(json.dumps(state).encode())
+    server.report_history.flush()
+
+    response = client.get('/history', query_string={
+        'series': 'state.roofs.north.open',
+        'start': START.isoformat(),
+        'end': (START + timedelta(days=1)).isoformat(),
+        'resolution': 3600,
+    })
+    assert response.status_code == 200
+    series = response.json['series']['state.roofs.north.open']
+    assert len(series['timestamp']) == 24
+    assert series['mean'] == [0.25] * 24
+
+
+def test_resolution_without_aggregates(server, client):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    for minute in range(60):
+        server.report_history.add(
+            (now - timedelta(minutes=minute)).timestamp(),
+            {'report.temperature': 20.0},
+        )
+    server.report_history.flush()
+
+    # No aggregates divide 90 seconds, and the raw samples don't go back three days
+    response = client.get('/history', query_string={
+        'series': 'report.temperature',
+        'start': START.isoformat(),
+        'end': now.isoformat(),
+        'resolution': 90,
+    })
+    assert response.status_code == 400
+
+    # Within the last day, they can be split up from the raw samples
+    response = client.get('/history', query_string={
+        'series': 'report.temperature',
+        'start': (now - timedelta(hours=2)).isoformat(),
+        'end': (now + timedelta(seconds=1)).isoformat(),
+        'resolution': 90,
+    })
+    assert response.status_code == 200
+    assert sum(response.json['series']['report.temperature']['count']) == 60
@@ -0,0 +1,30 @@
+import logging
+
+import paho.mqtt.enums
+from app import app
+from mqtt_client import MQTTClient
+
+
+def test_publish_while_disconnected_is_queued(caplog):
+    mqtt_client = MQTTClient(app.config)
+    try:
+        with caplog.at_level(logging.INFO, logger='mqtt_client'):
+            mqtt_client.publish('report', '{}')
+    finally:
+        mqtt_client.client.loop_stop()
+
+    assert [record.levelno for record in caplog.records] == [logging.INFO]
+    assert 'queued' in caplog.records[0].message
+    assert len(mqtt_client.client._out_messages) == 1
+
+
+def test_publish_failure_is_an_error(caplog):
+    # The queue is full after the first message
+    mqtt_client = MQTTClient(dict(app.config, MQTT_MAX_QUEUED_MESSAGES=1))
+    mqtt_client.client.loop_stop()
+    mqtt_client.publish('report', '{}')
+
+    with caplog.at_level(logging.INFO, logger='mqtt_client'):
+        mqtt_client.publish('report', '{}')
+    assert caplog.records[-1].levelno == logging.ERROR
+    assert str(paho.mqtt.enums.MQTTErrorCode.MQTT_ERR_QUEUE_SIZE) in caplog.records[-1].message
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+import pytest
+import rolling_windows
+
+START = 1.7e9
+
+
+def test_trend_of_steady_rise():
+    trend = rolling_windows.Trend('temperature', timedelta(hours=1))
+    for minute in range(120):
+        timestamp = START + 60 * minute
+        trend.add(timestamp, {'temperature': 20 + minute / 60})
+    assert trend.get(timestamp) == pytest.approx(1)
+
+
+def test_trend_origin_follows_window_that_never_empties():
+    trend = rolling_windows.Trend('temperature', timedelta(hours=1))
+    # A month of reports every 16 seconds: the window is never empty
+    for i in range(30 * 24 * 225):
+        timestamp = START + 16 * i
+        trend.add(timestamp, {'temperature': 20 + 0.5 * i * 16 / 3600})
+        trend.get(timestamp)
+
+    assert timestamp - trend.origin <= 2 * trend.duration.total_seconds()
+    assert trend.get(timestamp) == pytest.approx(0.5, abs=1e-6)
+
+
+def test_trend_starts_over_after_gap():
+    trend = rolling_windows.Trend('temperature', timedelta(hours=1))
+    trend.add(START, {'temperature': 20})
+    trend.add(START + 60, {'temperature': 21})
+    assert trend.get(START + 7200) is None
+    assert trend.origin is None
+
+
+@pytest.mark.parametrize('window_class', [
+    rolling_windows.Change,
+    rolling_windows.Max,
+    rolling_windows.Trend,
+])
+def test_late_report_is_added_in_order(window_class):
+    values = [(START + 60 * minute, 20 + (minute * 7) % 11) for minute in range(120)]
+    # The report of minute 50 arrives after that of minute 51
+    late = values[:50] + [values[51], values[50]] + values[52:]
+
+    in_order = window_class('value', timedelta(minutes=30))
+    out_of_order = window_class('value', timedelta(minutes=30))
+    for i, ((timestamp, value), (late_timestamp, late_value)) in enumerate(zip(values, late)):
+        in_order.add(timestamp, {'value': value})
+        out_of_order.add(late_timestamp, {'value': late_value})
+        # Once both have the same reports, they have the same metric
+        if i != 50:
+            now = max(timestamp, late_timestamp)
+            assert out_of_order.get(now) == pytest.approx(in_order.get(now))
+
+
+def test_late_maximum_leaves_window_at_its_own_time():
+    window = rolling_windows.Max('wind', timedelta(minutes=10))
+    window.add(START + 60, {'wind': 10})
+    window.add(START, {'wind': 30})
+    assert window.get(START + 60) == 30
+    # The late maximum is evicted before the value that was added before it
+    assert window.get(START + 600 + 30) == 10
@@ -0,0 +1,36 @@
+import gzip
+import json
+
+import pytest
+
+STATE = json.dumps({'roofs': {'north': {'position': 0.3}, 'south': {'position': 0}}}).encode()
+
+
+@pytest.fixture
+def state(server):
+    server.state_cache.update(STATE)
+
+
+def test_each_encoding_has_its_own_etag(client, state):
+    identity = client.get('/state', headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get('/state', headers={'Accept-Encoding': 'gzip'})
+
+    assert identity.data == STATE
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped.data) == STATE
+    assert identity.headers['ETag'] != gzipped.headers['ETag']
+    assert identity.headers['Vary'] == gzipped.headers['Vary'] == 'Accept-Encoding'
+
+
+@pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+def test_matching_etag_is_not_modified(client, state, encoding):
+    etag = client.get('/state', headers={'Accept-Encoding': encoding}).headers['ETag']
+    response = client.get('/state', headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_etag_of_other_encoding_is_modified(client, state):
+    etag = client.get('/state', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    response = client.get('/state', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.data == STATE
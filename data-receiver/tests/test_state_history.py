@@ -0,0 +1,88 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+# A state as the controller publishes it: util.JSONEncoder encodes datetimes as seconds since the
+# epoch, and enums by their name.
+NOW = int(time.time())
+STATE = {
+    'timestamp': NOW,
+    'status': {
+        'status': 'OK',
+        'last_manual_input': NOW - 3600,
+        'last_high_wind': None,
+        'last_healthcheck': NOW - 60,
+    },
+    'metrics': {
+        'tick_duration': {'count': 600, 'mean': 0.42, 'max': 3.1},
+        'healthcheck_failures': 0,
+        'actuation_seconds': 120,
+        'reversals': 2,
+        'reversals_held_back': 1,
+        'mqtt_latency': {'count': 0, 'mean': None, 'max': 0},
+        'mqtt_outbox': 0,
+    },
+    'parameters': {
+        'min_temperature': 25,
+        'max_temperature': 31,
+        'high_wind': 50,
+        'rain_threshold': 0.5,
+    },
+    'weather_report': {
+        'timestamp': NOW - 30,
+        'indoor': {'data_source': 'WEATHERSTATION', 'temperature': 26.3},
+        'outdoor': {
+            'data_source': 'WEATHERSTATION',
+            'temperature': 18.1,
+            'wind_gust': 12.4,
+            'rain_event': 0,
+            'solar_radiation': 420,
+        },
+    },
+    'roofs': {
+        'north': {'position': 0.3, 'target': 0.3, 'last_verification': NOW - 7200, 'confidence': 1},
+        'south': {'position': 0, 'target': 0, 'last_verification': None, 'confidence': 0.8},
+    },
+}
+
+
+def get_series(server, timestamp=NOW):
+    server.report_history.flush()
+    with server.report_history.database.connect() as connection:
+        rows = connection.execute('''
+            SELECT name, timestamp, value FROM samples JOIN series ON series.id = samples.series
+            WHERE name LIKE 'state.%' AND timestamp = ?
+        ''', (timestamp,)).fetchall()
+    return {name: value for name, _, value in rows}
+
+
+def test_controller_state_is_added(server):
+    server.add_state_to_history(json.dumps(STATE).encode())
+    series = get_series(server)
+
+    assert series['state.roofs.north.position'] == 0.3
+    assert series['state.roofs.north.open'] == 1
+    assert series['state.roofs.south.open'] == 0
+    assert series['state.weather_report.indoor.temperature'] == 26.3
+    assert series['state.metrics.tick_duration.mean'] == 0.42
+    assert series['state.metrics.reversals'] == 2
+
+    # Timestamps and configuration are not series
+    for name in series:
+        assert 'last_' not in name
+        assert not name.endswith('.timestamp')
+        assert not name.startswith(('state.status.', 'state.parameters.'))
+
+
+def test_iso_timestamp_is_accepted(server):
+    state = dict(STATE, timestamp=datetime.fromtimestamp(NOW + 1).isoformat())
+    server.add_state_to_history(json.dumps(state).encode())
+    assert 'state.roofs.north.position' in get_series(server, NOW + 1)
+
+
+@pytest.mark.parametrize('payload', [b'not json', b'{}', b'{"timestamp": "yesterday"}'])
+def test_invalid_state_is_logged(server, caplog, payload):
+    server.add_state_to_history(payload)
+    assert 'Not adding state to the history' in caplog.text